@@ -0,0 +1,285 @@
+import logging
+import time
+import numpy as np
+
+from reference_comparison import (max_similarity_search, encode_segments, DEFAULT_ENCODE_BATCH_SIZE,
+                                  DEFAULT_SIMILARITY_BLOCK_SIZE)
+
+DEFAULT_IVF_LISTS = 1024
+DEFAULT_IVF_NPROBE = 16
+DEFAULT_IVF_TRAIN_PER_LIST = 64
+DEFAULT_KMEANS_ITERATIONS = 10
+DEFAULT_HNSW_M = 32
+DEFAULT_HNSW_EF_CONSTRUCTION = 200
+DEFAULT_HNSW_EF_SEARCH = 128
+DEFAULT_RESCORE_MARGIN = 0.05
+INDEX_BACKENDS = ("exact", "ivf", "hnsw")
+
+
+def _normalize(block):
+    """Return block as an L2-normalized float32 array."""
+    block = np.asarray(block, dtype=np.float32)
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return block / norms
+
+
+def _normalized_rows(embeddings, block_size=DEFAULT_SIMILARITY_BLOCK_SIZE):
+    """Copy embeddings (possibly a memmap or tensor) into an L2-normalized float32 array block by block."""
+    if hasattr(embeddings, "cpu"):
+        embeddings = embeddings.cpu().numpy()
+    out = np.empty(embeddings.shape, dtype=np.float32)
+    for start in range(0, len(embeddings), block_size):
+        out[start:start + block_size] = _normalize(embeddings[start:start + block_size])
+    return out
+
+
+class ExactIndex:
+    """Brute-force cosine search, identical to the detector's default reference comparison."""
+
+    def __init__(self, ref_embeddings, block_size=DEFAULT_SIMILARITY_BLOCK_SIZE):
+        self.ref_embeddings = ref_embeddings
+        self.block_size = block_size
+
+    def search(self, queries):
+        """
+        Find the most similar reference for every query.
+
+        Args:
+            queries (np.ndarray or tensor): Query embeddings.
+
+        Returns:
+            (max_sims, ref_ids): Best cosine similarity and reference row per query.
+        """
+        return max_similarity_search(queries, self.ref_embeddings, block_size=self.block_size)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized reference embeddings.
+
+    The references are partitioned with spherical k-means into n_lists clusters.
+    A query is compared only against the members of the nprobe clusters whose
+    centroids are closest to it, so the cost per query drops from N to roughly
+    N * nprobe / n_lists dot products. Higher nprobe trades speed for recall.
+    """
+
+    def __init__(self, ref_embeddings, n_lists=DEFAULT_IVF_LISTS, nprobe=DEFAULT_IVF_NPROBE,
+                 train_per_list=DEFAULT_IVF_TRAIN_PER_LIST, iterations=DEFAULT_KMEANS_ITERATIONS,
+                 block_size=DEFAULT_SIMILARITY_BLOCK_SIZE, seed=42):
+        self.nprobe = nprobe
+        self.block_size = block_size
+        vectors = _normalized_rows(ref_embeddings, block_size=block_size)
+        n_lists = max(1, min(n_lists, len(vectors)))
+        rng = np.random.default_rng(seed)
+
+        start = time.perf_counter()
+        sample_size = min(len(vectors), n_lists * train_per_list)
+        sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+        self.centroids = self._train_centroids(sample, n_lists, iterations, rng)
+
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for b_start in range(0, len(vectors), block_size):
+            block = vectors[b_start:b_start + block_size]
+            assignments[b_start:b_start + block_size] = np.argmax(block @ self.centroids.T, axis=1)
+
+        order = np.argsort(assignments, kind="stable")
+        self.ids = order
+        self.vectors = vectors[order]
+        counts = np.bincount(assignments, minlength=n_lists)
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        logging.info("Built IVF index with %d lists over %d references in %.2f seconds",
+                     n_lists, len(vectors), time.perf_counter() - start)
+
+    @staticmethod
+    def _train_centroids(sample, n_lists, iterations, rng):
+        """Run spherical k-means on sample and return normalized centroids."""
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            # Re-seed empty clusters from random sample points.
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+        return centroids
+
+    def search(self, queries):
+        """
+        Find the most similar reference for every query among the probed lists.
+
+        Args:
+            queries (np.ndarray or tensor): Query embeddings.
+
+        Returns:
+            (max_sims, ref_ids): Best cosine similarity and reference row per query.
+        """
+        if hasattr(queries, "cpu"):
+            queries = queries.cpu().numpy()
+        n_queries = len(queries)
+        max_sims = np.full(n_queries, -1.0, dtype=np.float32)
+        ref_ids = np.full(n_queries, -1, dtype=np.int64)
+        nprobe = min(self.nprobe, len(self.centroids))
+
+        for q_start in range(0, n_queries, self.block_size):
+            q_block = _normalize(queries[q_start:q_start + self.block_size])
+            centroid_sims = q_block @ self.centroids.T
+            probes = np.argpartition(-centroid_sims, nprobe - 1, axis=1)[:, :nprobe]
+            # Group (query, list) pairs by list so every list is scanned once per query block.
+            pair_queries = np.repeat(np.arange(len(q_block)), nprobe)
+            pair_lists = probes.ravel()
+            order = np.argsort(pair_lists, kind="stable")
+            pair_queries, pair_lists = pair_queries[order], pair_lists[order]
+            boundaries = np.flatnonzero(np.diff(pair_lists)) + 1
+            best_sims = np.full(len(q_block), -1.0, dtype=np.float32)
+            best_pos = np.full(len(q_block), -1, dtype=np.int64)
+            for group in np.split(np.arange(len(pair_lists)), boundaries):
+                if len(group) == 0:
+                    continue
+                list_id = pair_lists[group[0]]
+                l_start, l_stop = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+                if l_start == l_stop:
+                    continue
+                qs = pair_queries[group]
+                sims = q_block[qs] @ self.vectors[l_start:l_stop].T
+                arg = np.argmax(sims, axis=1)
+                top = sims[np.arange(len(qs)), arg]
+                improved = top > best_sims[qs]
+                best_sims[qs[improved]] = top[improved]
+                best_pos[qs[improved]] = arg[improved] + l_start
+            found = best_pos >= 0
+            max_sims[q_start:q_start + len(q_block)] = best_sims
+            ref_ids[q_start:q_start + len(q_block)][found] = self.ids[best_pos[found]]
+        return max_sims, ref_ids
+
+
+class HNSWIndex:
+    """
+    HNSW graph index over normalized reference embeddings (requires the optional hnswlib package).
+
+    m and ef_construction control graph quality at build time, ef_search the
+    recall/latency trade-off at query time.
+    """
+
+    def __init__(self, ref_embeddings, m=DEFAULT_HNSW_M, ef_construction=DEFAULT_HNSW_EF_CONSTRUCTION,
+                 ef_search=DEFAULT_HNSW_EF_SEARCH, block_size=DEFAULT_SIMILARITY_BLOCK_SIZE, num_threads=-1):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The hnsw backend requires hnswlib (pip install hnswlib).") from e
+        if hasattr(ref_embeddings, "cpu"):
+            ref_embeddings = ref_embeddings.cpu().numpy()
+        start = time.perf_counter()
+        self.index = hnswlib.Index(space="ip", dim=ref_embeddings.shape[1])
+        self.index.init_index(max_elements=len(ref_embeddings), ef_construction=ef_construction, M=m)
+        self.index.set_num_threads(num_threads)
+        for b_start in range(0, len(ref_embeddings), block_size):
+            block = _normalize(ref_embeddings[b_start:b_start + block_size])
+            self.index.add_items(block, np.arange(b_start, b_start + len(block)))
+        self.index.set_ef(ef_search)
+        self.block_size = block_size
+        logging.info("Built HNSW index over %d references in %.2f seconds",
+                     len(ref_embeddings), time.perf_counter() - start)
+
+    def search(self, queries):
+        """
+        Find the (approximately) most similar reference for every query.
+
+        Args:
+            queries (np.ndarray or tensor): Query embeddings.
+
+        Returns:
+            (max_sims, ref_ids): Best cosine similarity and reference row per query.
+        """
+        if hasattr(queries, "cpu"):
+            queries = queries.cpu().numpy()
+        max_sims = np.full(len(queries), -1.0, dtype=np.float32)
+        ref_ids = np.full(len(queries), -1, dtype=np.int64)
+        for q_start in range(0, len(queries), self.block_size):
+            labels, distances = self.index.knn_query(_normalize(queries[q_start:q_start + self.block_size]), k=1)
+            max_sims[q_start:q_start + len(labels)] = 1.0 - distances[:, 0]
+            ref_ids[q_start:q_start + len(labels)] = labels[:, 0]
+        return max_sims, ref_ids
+
+
+def build_reference_index(ref_embeddings, backend="exact", **params):
+    """
+    Build a nearest-neighbour index over reference embeddings.
+
+    Args:
+        ref_embeddings (np.ndarray or tensor): Reference embeddings.
+        backend (str): One of 'exact', 'ivf' or 'hnsw'.
+        **params: Backend specific parameters (see ExactIndex, IVFIndex, HNSWIndex).
+
+    Returns:
+        Index object with a search(queries) -> (max_sims, ref_ids) method.
+    """
+    if backend == "exact":
+        return ExactIndex(ref_embeddings, **params)
+    if backend == "ivf":
+        return IVFIndex(ref_embeddings, **params)
+    if backend == "hnsw":
+        return HNSWIndex(ref_embeddings, **params)
+    raise ValueError(f"Unknown reference index backend: {backend}")
+
+
+def search_with_rescoring(index, queries, ref_embeddings, threshold, margin=DEFAULT_RESCORE_MARGIN,
+                          block_size=DEFAULT_SIMILARITY_BLOCK_SIZE):
+    """
+    Search an approximate index and rescore queries close to the threshold exactly.
+
+    An approximate index can only underestimate the best similarity, so queries already
+    at or above the threshold are flagged correctly. Queries whose approximate score lies
+    in [threshold - margin, threshold) may be missed hits and are rescored with the exact
+    blocked search against all references.
+
+    Args:
+        index: Index built by build_reference_index.
+        queries (np.ndarray or tensor): Query embeddings.
+        ref_embeddings (np.ndarray or tensor): Reference embeddings the index was built from.
+        threshold (float): Similarity threshold used for flagging.
+        margin (float): Width of the band below threshold that is rescored (0 disables rescoring).
+        block_size (int): Rows per block in the exact search.
+
+    Returns:
+        (max_sims, ref_ids): Best cosine similarity and reference row per query.
+    """
+    if hasattr(queries, "cpu"):
+        queries = queries.cpu().numpy()
+    max_sims, ref_ids = index.search(queries)
+    if margin <= 0 or isinstance(index, ExactIndex):
+        return max_sims, ref_ids
+    near = np.flatnonzero((max_sims >= threshold - margin) & (max_sims < threshold))
+    if len(near):
+        logging.info("Rescoring %d segments near the similarity threshold exactly", len(near))
+        exact_sims, exact_ids = max_similarity_search(queries[near], ref_embeddings, block_size=block_size)
+        better = exact_sims > max_sims[near]
+        max_sims[near[better]] = exact_sims[better]
+        ref_ids[near[better]] = exact_ids[better]
+    return max_sims, ref_ids
+
+
+def check_reference_similarity_index(segments, index, ref_embeddings, threshold=0.9, ref_model=None,
+                                     batch_size=DEFAULT_ENCODE_BATCH_SIZE, rescore_margin=DEFAULT_RESCORE_MARGIN):
+    """
+    Index-backed counterpart of check_reference_similarity_batch.
+
+    Args:
+        segments (list): Text segments to check.
+        index: Index built by build_reference_index over ref_embeddings.
+        ref_embeddings (np.ndarray or tensor): Reference embeddings, used for exact rescoring.
+        threshold (float): Similarity threshold (default: 0.9).
+        ref_model: SentenceTransformer model to encode the segments.
+        batch_size (int): Encoding batch size.
+        rescore_margin (float): Width of the band below threshold that is rescored exactly.
+
+    Returns:
+        (max_sims, ref_ids, flags): Arrays with the maximum similarity, the index of the
+        best matching reference text and a flag indicating if the similarity exceeds threshold.
+    """
+    segment_embeddings = encode_segments(segments, ref_model, batch_size=batch_size)
+    max_sims, ref_ids = search_with_rescoring(index, segment_embeddings, ref_embeddings, threshold,
+                                              margin=rescore_margin, block_size=index.block_size)
+    flags = max_sims >= threshold
+    return max_sims, ref_ids, flags
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Reference Index Benchmark
+
+Measures recall and latency of the approximate reference index backends against the
+exact blocked search used by the detector by default.
+
+The reference embeddings are either read from a persistent reference store
+(--reference-store-dir) or generated synthetically as clustered unit vectors. Queries
+are perturbed copies of random references mixed with unrelated vectors, so that both
+near-duplicate hits and clean segments are represented.
+
+Usage:
+    python benchmark_ann.py [--reference-store-dir DIR] [--num-references N] [--num-queries N] [other options...]
+"""
+
+import argparse
+import logging
+import time
+import numpy as np
+
+from ann_index import build_reference_index, search_with_rescoring
+
+
+def make_synthetic_references(num_references, dim, num_clusters, rng):
+    """Generate clustered unit vectors that mimic sentence embeddings."""
+    centers = rng.normal(size=(num_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, size=num_references)
+    refs = centers[labels] + 0.6 * rng.normal(size=(num_references, dim)).astype(np.float32)
+    return refs / np.linalg.norm(refs, axis=1, keepdims=True)
+
+
+def make_queries(references, num_queries, noise, rng):
+    """Mix perturbed copies of references (potential hits) with random vectors (clean segments)."""
+    num_hits = num_queries // 2
+    hits = references[rng.integers(0, len(references), size=num_hits)]
+    hits = hits + noise * rng.normal(size=hits.shape).astype(np.float32)
+    clean = rng.normal(size=(num_queries - num_hits, references.shape[1])).astype(np.float32)
+    queries = np.concatenate([hits, clean])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def run_backend(name, index, queries, references, exact_sims, exact_ids, threshold, margin, build_seconds):
+    """Search with one index and compare against the exact results."""
+    start = time.perf_counter()
+    sims, ids = search_with_rescoring(index, queries, references, threshold, margin=margin)
+    seconds = time.perf_counter() - start
+    recall = float(np.mean((ids == exact_ids) | np.isclose(sims, exact_sims, atol=1e-5)))
+    exact_flags = exact_sims >= threshold
+    flag_recall = float(np.mean((sims >= threshold)[exact_flags])) if exact_flags.any() else 1.0
+    print(f"{name:<28} build {build_seconds:8.2f}s  search {seconds:8.3f}s  "
+          f"{len(queries) / seconds:12.0f} q/s  recall@1 {recall:.4f}  flag recall {flag_recall:.4f}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Reference Index Benchmark")
+    parser.add_argument("--reference-store-dir", type=str, default=None,
+                        help="Optional reference store to benchmark on instead of synthetic embeddings.")
+    parser.add_argument("--ref_model_name", type=str, default="all-MiniLM-L6-v2",
+                        help="Model name of the reference store.")
+    parser.add_argument("--num-references", type=int, default=200000,
+                        help="Number of synthetic reference embeddings (default: 200000).")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic embedding dimension (default: 384).")
+    parser.add_argument("--num-queries", type=int, default=10000, help="Number of queries (default: 10000).")
+    parser.add_argument("--query-noise", type=float, default=0.02,
+                        help="Noise added to copied references to form near-duplicate queries (default: 0.02).")
+    parser.add_argument("--ref_similarity_threshold", type=float, default=0.9,
+                        help="Similarity threshold used for flag recall and rescoring (default: 0.9).")
+    parser.add_argument("--ref-rescore-margin", type=float, default=0.05,
+                        help="Exact rescoring margin below the threshold (default: 0.05).")
+    parser.add_argument("--ivf-lists", type=int, default=1024, help="Number of ivf lists (default: 1024).")
+    parser.add_argument("--ivf-nprobe", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="nprobe values to benchmark for the ivf backend.")
+    parser.add_argument("--hnsw-ef-search", type=int, nargs="+", default=[32, 128, 512],
+                        help="ef_search values to benchmark for the hnsw backend (requires hnswlib).")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42).")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.reference_store_dir:
+        from reference_store import ReferenceStore
+        references = np.asarray(ReferenceStore(args.reference_store_dir, args.ref_model_name).open())
+    else:
+        references = make_synthetic_references(args.num_references, args.dim, max(1, args.num_references // 500), rng)
+    queries = make_queries(references, args.num_queries, args.query_noise, rng)
+    logging.info("Benchmarking %d queries against %d references", len(queries), len(references))
+
+    start = time.perf_counter()
+    exact = build_reference_index(references, backend="exact")
+    exact_sims, exact_ids = exact.search(queries)
+    exact_seconds = time.perf_counter() - start
+    print(f"{'exact':<28} build {0.0:8.2f}s  search {exact_seconds:8.3f}s  "
+          f"{len(queries) / exact_seconds:12.0f} q/s  recall@1 1.0000  flag recall 1.0000")
+
+    start = time.perf_counter()
+    ivf = build_reference_index(references, backend="ivf", n_lists=args.ivf_lists)
+    build_seconds = time.perf_counter() - start
+    for nprobe in args.ivf_nprobe:
+        ivf.nprobe = nprobe
+        for margin in (0.0, args.ref_rescore_margin):
+            run_backend(f"ivf nprobe={nprobe} margin={margin}", ivf, queries, references,
+                        exact_sims, exact_ids, args.ref_similarity_threshold, margin, build_seconds)
+
+    try:
+        start = time.perf_counter()
+        hnsw = build_reference_index(references, backend="hnsw")
+        build_seconds = time.perf_counter() - start
+    except ImportError as e:
+        logging.warning("Skipping hnsw backend: %s", e)
+        return
+    for ef_search in args.hnsw_ef_search:
+        hnsw.index.set_ef(ef_search)
+        for margin in (0.0, args.ref_rescore_margin):
+            run_backend(f"hnsw ef={ef_search} margin={margin}", hnsw, queries, references,
+                        exact_sims, exact_ids, args.ref_similarity_threshold, margin, build_seconds)
+
+
+if __name__ == "__main__":
+    main()
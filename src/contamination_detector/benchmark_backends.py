@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Inference Backend Benchmark
+
+Measures CPU throughput of the language model and the reference embedding model under
+each inference backend, and the drift of their scores against the fp32 eager baseline.
+
+Language model drift is the relative difference in per-segment perplexity; embedding
+drift is one minus the cosine similarity between backend and baseline embeddings.
+Segments are read from a preprocessed CSV (--input-file) or generated synthetically.
+
+Usage:
+    python benchmark_backends.py [--input-file FILE] [--num-segments N] [--backends eager int8 ...] [other options...]
+"""
+
+import argparse
+import logging
+import random
+import time
+import numpy as np
+import pandas as pd
+import torch
+
+from inference_backends import INFERENCE_BACKENDS, DEFAULT_ONNX_DIR, configure_threads, load_sentence_transformer
+from pacost import load_language_model, compute_perplexity_batch
+from reference_comparison import encode_segments
+
+
+def make_synthetic_segments(num_segments, words_per_segment, rng):
+    """Generate word-salad segments from a small vocabulary."""
+    vocab = ("the of and to in a is that for it as was with be by on not he this are or his from at which "
+             "but have an they you were her she there been one all we their has would when if so no will").split()
+    return [" ".join(rng.choice(vocab) for _ in range(words_per_segment)) for _ in range(num_segments)]
+
+
+def summarize_drift(drift):
+    """Mean and max of a drift array, ignoring segments a backend could not score."""
+    drift = drift[np.isfinite(drift)]
+    if len(drift) == 0:
+        return float("nan"), float("nan")
+    return float(np.mean(drift)), float(np.max(drift))
+
+
+def benchmark_language_model(args, segments):
+    baseline = None
+    for backend in args.backends:
+        try:
+            model, tokenizer = load_language_model(args.lm_model_name, backend=backend, onnx_dir=args.onnx_dir,
+                                                   intra_op_threads=args.intra_op_threads,
+                                                   inter_op_threads=args.inter_op_threads)
+            # Warm-up batch, which also triggers compilation for the compile backend.
+            compute_perplexity_batch(segments[:args.lm_batch_size], model, tokenizer, batch_size=args.lm_batch_size)
+        except Exception as e:
+            logging.warning("Skipping language model backend %s: %s", backend, e)
+            continue
+        start = time.perf_counter()
+        ppls = compute_perplexity_batch(segments, model, tokenizer, batch_size=args.lm_batch_size)
+        seconds = time.perf_counter() - start
+        ppls = np.array([np.nan if p is None else p for p in ppls], dtype=np.float64)
+        if baseline is None:
+            baseline = ppls
+        mean_drift, max_drift = summarize_drift(np.abs(ppls - baseline) / baseline)
+        print(f"lm  {backend:<8} {len(segments) / seconds:10.1f} seg/s  "
+              f"ppl rel. drift mean {mean_drift:.2e}  max {max_drift:.2e}")
+
+
+def benchmark_embedding_model(args, segments):
+    baseline = None
+    for backend in args.backends:
+        try:
+            model = load_sentence_transformer(args.ref_model_name, backend=backend)
+            encode_segments(segments[:args.ref_batch_size], model, batch_size=args.ref_batch_size)
+        except Exception as e:
+            logging.warning("Skipping embedding backend %s: %s", backend, e)
+            continue
+        start = time.perf_counter()
+        embeddings = encode_segments(segments, model, batch_size=args.ref_batch_size)
+        seconds = time.perf_counter() - start
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if baseline is None:
+            baseline = embeddings
+        mean_drift, max_drift = summarize_drift(1.0 - np.sum(embeddings * baseline, axis=1))
+        print(f"emb {backend:<8} {len(segments) / seconds:10.1f} seg/s  "
+              f"1-cos drift mean {mean_drift:.2e}  max {max_drift:.2e}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Inference Backend Benchmark")
+    parser.add_argument("--input-file", type=str, default=None,
+                        help="Optional preprocessed CSV whose 'segments' column is benchmarked.")
+    parser.add_argument("--num-segments", type=int, default=512, help="Number of segments (default: 512).")
+    parser.add_argument("--words-per-segment", type=int, default=100,
+                        help="Words per synthetic segment (default: 100).")
+    parser.add_argument("--backends", type=str, nargs="+", choices=INFERENCE_BACKENDS, default=list(INFERENCE_BACKENDS),
+                        help="Backends to benchmark; the first one is the drift baseline (default: all).")
+    parser.add_argument("--models", type=str, nargs="+", choices=("lm", "embedding"), default=["lm", "embedding"],
+                        help="Models to benchmark (default: both).")
+    parser.add_argument("--lm_model_name", type=str, default="distilgpt2", help="Language model name.")
+    parser.add_argument("--ref_model_name", type=str, default="all-MiniLM-L6-v2",
+                        help="SentenceTransformer model name.")
+    parser.add_argument("--lm-batch-size", type=int, default=32, help="Language model batch size (default: 32).")
+    parser.add_argument("--ref-batch-size", type=int, default=256, help="Embedding batch size (default: 256).")
+    parser.add_argument("--onnx-dir", type=str, default=DEFAULT_ONNX_DIR,
+                        help="Directory caching ONNX exports of the language model.")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Intra-op threads.")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="Inter-op threads.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42).")
+    args = parser.parse_args()
+
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+
+    if args.input_file:
+        segments = pd.read_csv(args.input_file, nrows=args.num_segments)['segments'].astype(str).tolist()
+    else:
+        segments = make_synthetic_segments(args.num_segments, args.words_per_segment, random.Random(args.seed))
+    logging.info("Benchmarking backends %s on %d segments with %d intra-op threads", args.backends, len(segments),
+                 torch.get_num_threads())
+
+    if "lm" in args.models:
+        benchmark_language_model(args, segments)
+    if "embedding" in args.models:
+        benchmark_embedding_model(args, segments)
+
+
+if __name__ == "__main__":
+    main()
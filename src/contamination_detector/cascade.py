@@ -0,0 +1,76 @@
+import time
+import logging
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# name: stage name used in reports and the cascade_stage column.
+# score: callable(segments, positions) -> dict of column name -> per-segment values;
+#        positions are the indices of the segments in the list passed to run_cascade.
+# decide: callable(columns) -> (flags, decided) boolean arrays; decided marks segments
+#         whose flag is confident enough to skip the remaining stages.
+CascadeStage = namedtuple("CascadeStage", ["name", "score", "decide"])
+
+
+def run_cascade(segments, stages):
+    """
+    Run detection stages from cheapest to most expensive, routing only undecided segments onward.
+
+    Every stage scores the segments still undecided after the previous stages. Segments
+    the stage decides (as contaminated or as clean) keep its flag and skip the later
+    stages; the last stage decides all segments that reach it.
+
+    Args:
+        segments (list): Text segments.
+        stages (list): CascadeStage objects ordered cheap to expensive.
+
+    Returns:
+        (results, report): DataFrame with one row per segment holding every stage's
+        columns (NaN for stages a segment skipped), 'cascade_stage' and
+        'contamination_flag'; and a list of per-stage report dicts.
+    """
+    n = len(segments)
+    flags = np.zeros(n, dtype=bool)
+    deciding_stage = np.full(n, None, dtype=object)
+    pending = np.arange(n)
+    stage_frames = []
+    report = []
+
+    for i, stage in enumerate(stages):
+        if len(pending) == 0:
+            report.append({"stage": stage.name, "segments": 0, "contaminated": 0, "clean": 0,
+                           "passed_on": 0, "seconds": 0.0})
+            continue
+        start = time.perf_counter()
+        columns = stage.score([segments[p] for p in pending], pending)
+        stage_flags, decided = stage.decide(columns)
+        stage_flags = np.asarray(stage_flags, dtype=bool)
+        decided = np.ones(len(pending), dtype=bool) if i == len(stages) - 1 else np.asarray(decided, dtype=bool)
+        seconds = time.perf_counter() - start
+
+        stage_frames.append(pd.DataFrame(columns, index=pending))
+        flags[pending[decided]] = stage_flags[decided]
+        deciding_stage[pending[decided]] = stage.name
+        report.append({
+            "stage": stage.name,
+            "segments": int(len(pending)),
+            "contaminated": int((stage_flags & decided).sum()),
+            "clean": int((~stage_flags & decided).sum()),
+            "passed_on": int((~decided).sum()),
+            "seconds": round(seconds, 3),
+        })
+        pending = pending[~decided]
+
+    results = pd.concat(stage_frames, axis=1).reindex(np.arange(n)) if stage_frames else pd.DataFrame(index=range(n))
+    results['cascade_stage'] = deciding_stage
+    results['contamination_flag'] = flags
+    return results, report
+
+
+def log_cascade_report(report):
+    """Log the per-stage segment counts and timings of a cascade run."""
+    logging.info("%-12s %10s %13s %10s %10s %10s", "stage", "segments", "contaminated", "clean", "passed on",
+                 "seconds")
+    for row in report:
+        logging.info("%-12s %10d %13d %10d %10d %10.2f", row["stage"], row["segments"], row["contaminated"],
+                     row["clean"], row["passed_on"], row["seconds"])
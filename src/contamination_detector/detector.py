@@ -10,98 +10,386 @@ It processes a preprocessed CSV file (which should have a 'segments' column),
 computes reference similarity and perplexity-based confidence scores for each segment,
 and flags segments that appear contaminated.
 
+The input is processed in fixed-size shards. Each shard's scores are written
+atomically to a Parquet part file in a work directory, so an interrupted run
+resumes with the first unfinished shard. Shards can be scored in parallel by a
+pool of worker processes, each with its own model instances.
+
 Usage:
     python detector.py [--input-file PATH] [--output-file PATH] [other options...]
 """
 
 import os
+import math
+import json
 import argparse
 import logging
-import pandas as pd
-from datasets import load_dataset
-from tqdm import tqdm
+import shutil
+import functools
+import numpy as np
+import torch
 
-from reference_comparison import load_reference_data, check_reference_similarity
-from pacost import perturb_text, load_language_model, compute_perplexity
+from reference_comparison import load_reference_data, check_reference_similarity_batch
+from ann_index import build_reference_index, check_reference_similarity_index, INDEX_BACKENDS
+from ngram_index import load_or_build_ngram_index, NGramIndex
+from sharding import prepare_work_dir, run_shards, merge_parts, load_reports
+from cascade import CascadeStage, run_cascade, log_cascade_report
+from pacost import perturb_text, load_language_model, compute_perplexity_batch, pacost_test_batch
+from inference_backends import INFERENCE_BACKENDS, DEFAULT_ONNX_DIR, configure_threads, load_sentence_transformer
 
+from embedding_service import EmbeddingService, memmap_spec, open_memmap_spec
+from seeding import row_rng
+from table_io import iter_batches, table_columns
 
-def detect_contamination(args):
-    logging.info("Loading preprocessed data from: %s", args.input_file)
-    df = pd.read_csv(args.input_file, on_bad_lines='skip', engine='python')
-    logging.info("Loaded data shape: %s", df.shape)
 
-    if 'segments' not in df.columns:
-        logging.error("Input data must have a 'segments' column.")
-        return None
+def _index_params(args):
+    """Collect the parameters of the selected reference index backend from the CLI arguments."""
+    if args.ref_index == "ivf":
+        return {"n_lists": args.ivf_lists, "nprobe": args.ivf_nprobe}
+    if args.ref_index == "hnsw":
+        return {"m": args.hnsw_m, "ef_construction": args.hnsw_ef_construction, "ef_search": args.hnsw_ef_search}
+    return {}
 
-    # Setup reference benchmark
-    logging.info("Setting up reference benchmark comparison...")
-    if args.reference_file:
-        with open(args.reference_file, 'r') as f:
-            reference_texts = [line.strip() for line in f if line.strip()]
+
+def run_ngram_check(segments, ngram_index, args):
+    """
+    Score segments by exact n-gram overlap with the reference texts.
+
+    Returns:
+        dict: Column name -> array for 'ngram_overlap', 'ngram_longest_match',
+        'ngram_longest_span' and 'ngram_flag'.
+    """
+    overlaps, longest, spans = ngram_index.score(segments)
+    return {'ngram_overlap': overlaps, 'ngram_longest_match': longest, 'ngram_longest_span': spans,
+            'ngram_flag': overlaps >= args.ngram_threshold}
+
+
+def run_reference_check(segments, resources, args):
+    """
+    Compare segments against the reference benchmark.
+
+    Returns:
+        dict: Column name -> array for 'ref_similarity', 'ref_match_id' and 'ref_flag'.
+    """
+    # Reference similarity check in encoding batches and blocked similarity search
+    if args.ref_index == "exact":
+        ref_similarities, ref_match_ids, ref_flags = check_reference_similarity_batch(
+            segments, resources.ref_embeddings, threshold=args.ref_similarity_threshold,
+            ref_model=resources.ref_model, batch_size=args.ref_batch_size, block_size=args.ref_block_size)
     else:
-        # reference_texts = [
-        #     "this is a known contaminated text from benchmark dataset",
-        #     "another reference text that should not be in the training data",
-        #     "benchmark evaluation text that must remain separate"
-        # ]
-        pg19_passages = load_dataset("deepmind/pg19", split="train", num_proc=10, trust_remote_code=True)
-        reference_texts = pg19_passages["text"]
-
-    ref_model, ref_embeddings = load_reference_data(reference_texts, model_name=args.ref_model_name)
-
-    # Setup language model for confidence testing
-    logging.info("Loading language model for confidence testing...")
-    lm_model, lm_tokenizer = load_language_model(model_name=args.lm_model_name)
-
-    ref_similarities = []
-    ref_flags = []
-    perplexity_orig_list = []
-    perplexity_perturbed_list = []
-    confidence_flags = []
+        ref_similarities, ref_match_ids, ref_flags = check_reference_similarity_index(
+            segments, resources.reference_index(), resources.ref_embeddings,
+            threshold=args.ref_similarity_threshold, ref_model=resources.ref_model,
+            batch_size=args.ref_batch_size, rescore_margin=args.ref_rescore_margin)
+    return {'ref_similarity': ref_similarities, 'ref_match_id': ref_match_ids, 'ref_flag': ref_flags}
 
-    perplexity_ratio_threshold = args.perplexity_ratio_threshold
-    segments = df['segments'].tolist()
 
-    logging.info("Starting contamination detection on %d segments", len(segments))
-    for seg in tqdm(segments, desc="Processing segments"):
-        # Reference similarity check
-        try:
-            max_sim, ref_flag = check_reference_similarity(seg, ref_embeddings, threshold=args.ref_similarity_threshold,
-                                                           ref_model=ref_model)
-        except Exception as e:
-            logging.error("Error in reference similarity check: %s", e)
-            max_sim, ref_flag = 0.0, False
-        ref_similarities.append(max_sim)
-        ref_flags.append(ref_flag)
-
-        # Compute perplexity for original segment
-        ppl_orig = compute_perplexity(seg, lm_model, lm_tokenizer)
-        # Compute perplexity for perturbed segment
-        perturbed_seg = perturb_text(seg)
-        ppl_perturbed = compute_perplexity(perturbed_seg, lm_model, lm_tokenizer)
-
-        perplexity_orig_list.append(ppl_orig)
-        perplexity_perturbed_list.append(ppl_perturbed)
+def run_confidence_test(segments, lm_model, lm_tokenizer, args, row_ids):
+    """
+    Run the PaCoST-inspired confidence test on segments.
 
+    In 'ratio' mode a single perturbation per segment is compared against
+    --perplexity_ratio_threshold. In 'multi' mode --num-perturbations perturbations
+    are scored and a one-sample t-test of their NLLs against the original's NLL plus
+    --pacost-margin yields a p-value per segment. Perturbations are drawn from a generator
+    per row, seeded from --seed and the row's global id (row_ids), so the results do not
+    depend on --shard-size or --num-workers.
+
+    Returns:
+        dict: Column name -> array for 'ppl_original', 'ppl_perturbed', 'confidence_flag'
+        and, in 'multi' mode, 'pacost_p_value'.
+    """
+    logging.info("Computing perplexities with batch size %d", args.lm_batch_size)
+    if args.pacost_mode == "multi":
+        results = pacost_test_batch(segments, lm_model, lm_tokenizer, num_perturbations=args.num_perturbations,
+                                    alpha=args.pacost_alpha, margin=args.pacost_margin, seed=args.seed,
+                                    row_ids=row_ids, batch_size=args.lm_batch_size,
+                                    window=args.lm_window, stride=args.lm_stride, show_progress=True)
+        return {'ppl_original': results['ppl_original'], 'ppl_perturbed': results['ppl_perturbed'],
+                'pacost_p_value': results['p_value'], 'confidence_flag': results['flag']}
+
+    # Compute perplexity for original and perturbed segments in length-bucketed batches
+    perturbed_segments = [perturb_text(seg, rng=row_rng(args.seed, row_id)) for seg, row_id in zip(segments, row_ids)]
+    perplexity_orig_list = compute_perplexity_batch(segments, lm_model, lm_tokenizer,
+                                                    batch_size=args.lm_batch_size, window=args.lm_window,
+                                                    stride=args.lm_stride, show_progress=True)
+    perplexity_perturbed_list = compute_perplexity_batch(perturbed_segments, lm_model, lm_tokenizer,
+                                                         batch_size=args.lm_batch_size, window=args.lm_window,
+                                                         stride=args.lm_stride, show_progress=True)
+
+    confidence_flags = []
+    for ppl_orig, ppl_perturbed in zip(perplexity_orig_list, perplexity_perturbed_list):
         # Confidence testing: flag if original perplexity is significantly lower
         if (ppl_orig is not None and ppl_perturbed is not None and ppl_perturbed > 0):
-            conf_flag = ppl_orig < perplexity_ratio_threshold * ppl_perturbed
+            conf_flag = ppl_orig < args.perplexity_ratio_threshold * ppl_perturbed
         else:
             conf_flag = False
         confidence_flags.append(conf_flag)
+    return {'ppl_original': perplexity_orig_list, 'ppl_perturbed': perplexity_perturbed_list,
+            'confidence_flag': np.array(confidence_flags, dtype=bool)}
+
+
+class DetectorResources:
+    """
+    Models and reference data used to score shards, loaded once per process.
+
+    The language model and the approximate reference index are only created when
+    first needed, so cascade runs that never reach the pacost stage skip the LM.
+    """
+
+    def __init__(self, args, ref_model, ref_embeddings, ngram_index=None):
+        # ref_model only encodes segments; it is a SegmentEncoder of the shared embedding service.
+        self.args = args
+        self.ref_model = ref_model
+        self.ref_embeddings = ref_embeddings
+        self.ngram_index = ngram_index
+        self._lm = None
+        self._ref_index = None
+
+    @classmethod
+    def from_spec(cls, args, ref_spec):
+        """Load resources in a worker process from files prepared by the parent."""
+        ref_model = _embedding_service(args).encoder(args.ref_model_name)
+        ref_embeddings = open_memmap_spec(ref_spec)
+        ngram_index = NGramIndex.load(args.ngram_index) if args.ngram_index else None
+        return cls(args, ref_model, ref_embeddings, ngram_index)
+
+    def language_model(self):
+        """Return (model, tokenizer), loading them on first use."""
+        if self._lm is None:
+            logging.info("Loading language model for confidence testing...")
+            self._lm = load_language_model(model_name=self.args.lm_model_name, backend=self.args.lm_backend,
+                                           onnx_dir=self.args.onnx_dir,
+                                           intra_op_threads=self.args.threads_per_worker,
+                                           inter_op_threads=self.args.inter_op_threads)
+        return self._lm
+
+    def reference_index(self):
+        """Return the approximate reference index, building it on first use."""
+        if self._ref_index is None:
+            self._ref_index = build_reference_index(self.ref_embeddings, backend=self.args.ref_index,
+                                                    block_size=self.args.ref_block_size, **_index_params(self.args))
+        return self._ref_index
+
+
+def build_cascade_stages(args, resources, row_ids):
+    """
+    Build the detection stages named in --cascade, in the given order.
+
+    A stage decides a segment when its flag is set, or when the segment's score is
+    below the stage's clean threshold. The language model is loaded only once a
+    segment actually reaches the pacost stage.
+
+    Args:
+        row_ids (np.ndarray): Global row ids of the shard's segments, seeding their perturbations.
+
+    Returns:
+        list: CascadeStage objects.
+    """
+    def score_pacost(segments, positions):
+        lm_model, lm_tokenizer = resources.language_model()
+        return run_confidence_test(segments, lm_model, lm_tokenizer, args, row_ids[positions])
+
+    def decide_ngram(columns):
+        flags = columns['ngram_flag']
+        clean = (columns['ngram_overlap'] <= args.ngram_clean_threshold if args.ngram_clean_threshold is not None
+                 else np.zeros(len(flags), dtype=bool))
+        return flags, flags | clean
+
+    def decide_reference(columns):
+        flags = columns['ref_flag']
+        return flags, flags | (columns['ref_similarity'] < args.ref_clean_threshold)
+
+    available = {
+        'ngram': CascadeStage('ngram', lambda segments, _: run_ngram_check(segments, resources.ngram_index, args),
+                              decide_ngram),
+        'reference': CascadeStage('reference', lambda segments, _: run_reference_check(segments, resources, args),
+                                  decide_reference),
+        'pacost': CascadeStage('pacost', score_pacost,
+                               lambda columns: (columns['confidence_flag'], columns['confidence_flag'])),
+    }
+    stages = []
+    for name in args.cascade.split(','):
+        name = name.strip()
+        if name not in available:
+            raise ValueError(f"Unknown cascade stage: {name}")
+        if name == 'ngram' and resources.ngram_index is None:
+            raise ValueError("The ngram cascade stage requires --ngram-index.")
+        stages.append(available[name])
+    return stages
+
+
+def detect_shard(df, resources, args):
+    """
+    Score one shard of segments and add the result columns to it.
+
+    The shard's index holds the global row ids of its segments (see _iter_shards).
+
+    Returns:
+        (df, report): The shard with result columns, and the per-stage cascade report
+        (None when not running in cascade mode).
+    """
+    segments = df['segments'].tolist()
+    row_ids = np.asarray(df.index, dtype=np.int64)
 
-    # Combine flags: flag if either reference or confidence flag is true
-    combined_flags = [r or c for r, c in zip(ref_flags, confidence_flags)]
+    if args.cascade:
+        stages = build_cascade_stages(args, resources, row_ids)
+        results, report = run_cascade(segments, stages)
+        for column in results.columns:
+            df[column] = results[column].values
+        return df, report
 
-    df['ref_similarity'] = ref_similarities
-    df['ref_flag'] = ref_flags
-    df['ppl_original'] = perplexity_orig_list
-    df['ppl_perturbed'] = perplexity_perturbed_list
-    df['confidence_flag'] = confidence_flags
+    ngram_results = {}
+    if resources.ngram_index is not None:
+        ngram_results = run_ngram_check(segments, resources.ngram_index, args)
+    ref_results = run_reference_check(segments, resources, args)
+    lm_model, lm_tokenizer = resources.language_model()
+    confidence_results = run_confidence_test(segments, lm_model, lm_tokenizer, args, row_ids)
+
+    # Combine flags: flag if the n-gram, reference or confidence flag is true
+    combined_flags = ref_results['ref_flag'] | confidence_results['confidence_flag']
+    if ngram_results:
+        combined_flags = combined_flags | ngram_results['ngram_flag']
+
+    for column, values in {**ngram_results, **ref_results, **confidence_results}.items():
+        df[column] = values
     df['contamination_flag'] = combined_flags
+    return df, None
+
+
+def load_reference_texts(args):
+    """Load the reference benchmark texts from --reference-file or pg19."""
+    if args.reference_file:
+        with open(args.reference_file, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+    # reference_texts = [
+    #     "this is a known contaminated text from benchmark dataset",
+    #     "another reference text that should not be in the training data",
+    #     "benchmark evaluation text that must remain separate"
+    # ]
+    from datasets import load_dataset
+    pg19_passages = load_dataset("deepmind/pg19", split="train", num_proc=10, trust_remote_code=True)
+    return pg19_passages["text"]
+
+
+def _reference_spec(ref_embeddings, work_dir):
+    """
+    Describe the reference embeddings as a file that worker processes can memory-map.
+
+    Embeddings from a reference store already are a memmap; anything else is written
+    to the work directory once.
+    """
+    if isinstance(ref_embeddings, torch.Tensor):
+        ref_embeddings = ref_embeddings.cpu().numpy()
+    if not isinstance(ref_embeddings, np.memmap):
+        ref_embeddings = np.asarray(ref_embeddings, dtype=np.float32)
+    return memmap_spec(ref_embeddings, work_dir, "reference_embeddings")
+
+
+def _embedding_service(args):
+    """Embedding service encoding segments with the reference model, shared with the membership checker."""
+    return EmbeddingService(cache_dir=args.embedding_cache_dir,
+                            load_model=functools.partial(load_sentence_transformer, backend=args.ref_backend),
+                            backend=args.ref_backend, batch_size=args.ref_batch_size)
+
+
+def _configure_threads(args):
+    configure_threads(intra_op_threads=args.threads_per_worker, inter_op_threads=args.inter_op_threads)
+
+
+_WORKER_RESOURCES = None
+
+
+def _init_worker(args, ref_spec):
+    """Load models and reference data once per worker process."""
+    global _WORKER_RESOURCES
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    _configure_threads(args)
+    _WORKER_RESOURCES = DetectorResources.from_spec(args, ref_spec)
+
+
+def _detect_shard_in_worker(shard_id, df):
+    return detect_shard(df, _WORKER_RESOURCES, _WORKER_RESOURCES.args)
+
+
+def _iter_shards(input_file, shard_size):
+    # Only the segments are loaded; Parquet inputs are streamed row group by row group.
+    for shard_id, df in enumerate(iter_batches(input_file, batch_size=shard_size, columns=['segments'])):
+        yield shard_id, df
+
+
+def _manifest(args):
+    """Configuration that must match for existing part files to be reused."""
+    operational = {'output_file', 'work_dir', 'keep_parts', 'num_workers', 'threads_per_worker',
+                   'inter_op_threads', 'onnx_dir', 'embedding_cache_dir', 'cascade_report'}
+    config = {key: value for key, value in vars(args).items() if key not in operational}
+    return {'input_mtime': os.path.getmtime(args.input_file), 'config': config}
+
+
+def detect_contamination(args):
+    """
+    Score all shards of the input that have no part file yet.
+
+    Returns:
+        str: The work directory holding one part file per shard, or None on error.
+    """
+    logging.info("Loading preprocessed data from: %s (shards of %d rows)", args.input_file, args.shard_size)
+    if 'segments' not in table_columns(args.input_file):
+        logging.error("Input data must have a 'segments' column.")
+        return None
+
+    work_dir = args.work_dir or args.output_file + ".parts"
+    prepare_work_dir(work_dir, _manifest(args))
+    # Inter-op threads can only be set before torch runs its first parallel op.
+    _configure_threads(args)
+
+    # Setup reference benchmark
+    logging.info("Setting up reference benchmark comparison...")
+    reference_texts = load_reference_texts(args)
+    service = _embedding_service(args)
+    _, ref_embeddings = load_reference_data(reference_texts, model_name=args.ref_model_name,
+                                            store_dir=args.reference_store_dir, backend=args.ref_backend,
+                                            model=service.model(args.ref_model_name))
+    ref_model = service.encoder(args.ref_model_name)
+
+    ngram_index = None
+    if args.ngram_index:
+        ngram_index = load_or_build_ngram_index(args.ngram_index, reference_texts, n=args.ngram_n)
+
+    logging.info("Starting contamination detection with %d worker(s)%s", args.num_workers,
+                 f" (cascade stages: {args.cascade})" if args.cascade else "")
+    shards = _iter_shards(args.input_file, args.shard_size)
+    if args.num_workers <= 1:
+        resources = DetectorResources(args, ref_model, ref_embeddings, ngram_index)
+        processed = run_shards(shards, lambda shard_id, df: detect_shard(df, resources, args),
+                               work_dir)
+    else:
+        ref_spec = _reference_spec(ref_embeddings, work_dir)
+        del ref_model, ref_embeddings, ngram_index
+        processed = run_shards(shards, _detect_shard_in_worker, work_dir, num_workers=args.num_workers,
+                               initializer=_init_worker, initargs=(args, ref_spec))
+    logging.info("Processed %d new shard(s)", processed)
+
+    if args.cascade:
+        report = _merge_reports(load_reports(work_dir))
+        log_cascade_report(report)
+        if args.cascade_report:
+            with open(args.cascade_report, 'w') as f:
+                json.dump(report, f, indent=2)
+    return work_dir
+
 
-    return df
+def _merge_reports(reports):
+    """Sum per-shard cascade reports into one report per stage."""
+    merged = {}
+    for report in reports:
+        for row in report:
+            total = merged.setdefault(row['stage'], {**row, 'segments': 0, 'contaminated': 0, 'clean': 0,
+                                                     'passed_on': 0, 'seconds': 0.0})
+            for key in ('segments', 'contaminated', 'clean', 'passed_on', 'seconds'):
+                total[key] += row[key]
+            total['seconds'] = round(total['seconds'], 3)
+    return list(merged.values())
 
 
 def main():
@@ -111,12 +399,21 @@ def main():
     )
 
     parser = argparse.ArgumentParser(description="Contamination Detector Module")
-    parser.add_argument("--input-file", type=str, default="../data/preprocessed_wikitext103_subset.csv",
-                        help="Path to preprocessed CSV file with a 'segments' column.")
-    parser.add_argument("--output-file", type=str, default="../data/contamination_flags_sample.csv",
-                        help="Path to save the flagged contamination output CSV.")
+    parser.add_argument("--input-file", type=str, default="../data/preprocessed_wikitext103_subset.parquet",
+                        help="Path to the preprocessed Parquet (or CSV) table with a 'segments' column.")
+    parser.add_argument("--output-file", type=str, default="../data/contamination_flags_sample.parquet",
+                        help="Path to save the flagged contamination output (.parquet, or .csv to export CSV).")
     parser.add_argument("--reference-file", type=str, default=None,
                         help="Optional path to a reference benchmark text file (one text per line).")
+    parser.add_argument("--reference-store-dir", type=str, default=None,
+                        help="Optional directory of a persistent reference embedding store reused across runs.")
+    parser.add_argument("--ngram-index", type=str, default=None,
+                        help="Optional path of an exact n-gram overlap index over the reference texts "
+                             "(built and saved there if missing or stale).")
+    parser.add_argument("--ngram-n", type=int, default=8,
+                        help="N-gram length in words for the n-gram index (default: 8).")
+    parser.add_argument("--ngram-threshold", type=float, default=0.5,
+                        help="Fraction of matching n-grams at which a segment is flagged (default: 0.5).")
     parser.add_argument("--ref_similarity_threshold", type=float, default=0.9,
                         help="Threshold for reference similarity (default: 0.9).")
     parser.add_argument("--perplexity_ratio_threshold", type=float, default=0.8,
@@ -125,14 +422,94 @@ def main():
                         help="SentenceTransformer model name for reference comparisons.")
     parser.add_argument("--lm_model_name", type=str, default="distilgpt2",
                         help="Lightweight LM model name for computing perplexity.")
+    parser.add_argument("--embedding-cache-dir", type=str, default=None,
+                        help="Optional shared embedding cache; segment embeddings are published there for the "
+                             "membership checker and only segments missing from it are encoded.")
+    parser.add_argument("--ref-batch-size", type=int, default=256,
+                        help="Batch size for encoding segments for reference comparison (default: 256).")
+    parser.add_argument("--ref-block-size", type=int, default=4096,
+                        help="Rows per block in the reference similarity search (default: 4096).")
+    parser.add_argument("--ref-index", type=str, choices=INDEX_BACKENDS, default="exact",
+                        help="Search backend for reference comparison (default: exact).")
+    parser.add_argument("--ivf-lists", type=int, default=1024,
+                        help="Number of k-means lists for the ivf backend (default: 1024).")
+    parser.add_argument("--ivf-nprobe", type=int, default=16,
+                        help="Number of lists probed per segment by the ivf backend (default: 16).")
+    parser.add_argument("--hnsw-m", type=int, default=32,
+                        help="Graph degree for the hnsw backend (default: 32).")
+    parser.add_argument("--hnsw-ef-construction", type=int, default=200,
+                        help="Build-time candidate list size for the hnsw backend (default: 200).")
+    parser.add_argument("--hnsw-ef-search", type=int, default=128,
+                        help="Query-time candidate list size for the hnsw backend (default: 128).")
+    parser.add_argument("--ref-rescore-margin", type=float, default=0.05,
+                        help="Rescore approximate similarities within this margin below the threshold exactly "
+                             "(default: 0.05, 0 disables).")
+    parser.add_argument("--lm-batch-size", type=int, default=32,
+                        help="Number of segments per padded LM forward pass (default: 32).")
+    parser.add_argument("--lm-window", type=int, default=None,
+                        help="Tokens per sliding window for segments longer than the LM context "
+                             "(default: the model context length).")
+    parser.add_argument("--lm-stride", type=int, default=None,
+                        help="Tokens the sliding window advances per step (default: half the window).")
+    parser.add_argument("--pacost-mode", type=str, choices=["ratio", "multi"], default="ratio",
+                        help="Confidence test: single perturbation with a perplexity ratio threshold, or "
+                             "multiple perturbations with a one-sample t-test against a margin (default: ratio).")
+    parser.add_argument("--num-perturbations", type=int, default=8,
+                        help="Perturbations per segment in multi mode (default: 8).")
+    parser.add_argument("--pacost-alpha", type=float, default=0.05,
+                        help="Significance level for flagging in multi mode (default: 0.05).")
+    parser.add_argument("--pacost-margin", type=float, default=None,
+                        help="Mean NLL increase under perturbation that a segment must significantly exceed to be "
+                             "flagged in multi mode (default: log(1 / perplexity_ratio_threshold), the ratio "
+                             "mode's decision boundary).")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Seed for the perturbation generator (default: 42).")
+    parser.add_argument("--cascade", type=str, default=None,
+                        help="Comma-separated detection stages ordered cheap to expensive, e.g. "
+                             "'ngram,reference,pacost'. Segments decided by a stage skip the later ones.")
+    parser.add_argument("--ref-clean-threshold", type=float, default=0.5,
+                        help="In cascade mode, segments with reference similarity below this are decided "
+                             "clean (default: 0.5).")
+    parser.add_argument("--ngram-clean-threshold", type=float, default=None,
+                        help="In cascade mode, segments with n-gram overlap at or below this are decided clean "
+                             "(default: never).")
+    parser.add_argument("--cascade-report", type=str, default=None,
+                        help="Optional path to save the per-stage cascade counts and timings as JSON.")
+    parser.add_argument("--shard-size", type=int, default=50000,
+                        help="Number of input rows scored and checkpointed together (default: 50000).")
+    parser.add_argument("--work-dir", type=str, default=None,
+                        help="Directory for per-shard part files (default: <output-file>.parts).")
+    parser.add_argument("--keep-parts", action="store_true", default=False,
+                        help="Keep the part files after merging them into the output file.")
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="Number of worker processes scoring shards in parallel (default: 1).")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Intra-op threads per worker process, for torch and ONNX Runtime (default: library default).")
+    parser.add_argument("--inter-op-threads", type=int, default=None,
+                        help="Inter-op threads per worker process, for torch and ONNX Runtime (default: library default).")
+    parser.add_argument("--lm-backend", type=str, choices=INFERENCE_BACKENDS, default="eager",
+                        help="Language model inference backend: eager, int8 (dynamic quantization), compile "
+                             "(torch.compile) or onnx (ONNX Runtime) (default: eager).")
+    parser.add_argument("--ref-backend", type=str, choices=INFERENCE_BACKENDS, default="eager",
+                        help="Reference embedding model inference backend (default: eager).")
+    parser.add_argument("--onnx-dir", type=str, default=DEFAULT_ONNX_DIR,
+                        help="Directory caching ONNX exports of the language model.")
     args = parser.parse_args()
+    if args.pacost_mode == "multi" and args.num_perturbations < 2:
+        parser.error("--num-perturbations must be at least 2 in multi mode.")
+    if args.pacost_margin is None:
+        if args.perplexity_ratio_threshold <= 0:
+            parser.error("--perplexity_ratio_threshold must be positive to derive --pacost-margin.")
+        args.pacost_margin = math.log(1 / args.perplexity_ratio_threshold)
 
     logging.info("Starting Contamination Detector Module...")
-    df_result = detect_contamination(args)
-    if df_result is not None:
+    work_dir = detect_contamination(args)
+    if work_dir is not None:
         os.makedirs(os.path.dirname(args.output_file), exist_ok=True)
-        df_result.to_csv(args.output_file, index=False)
-        logging.info("Contamination detection results saved to: %s", args.output_file)
+        rows = merge_parts(work_dir, args.output_file)
+        logging.info("Contamination detection results (%d rows) saved to: %s", rows, args.output_file)
+        if not args.keep_parts:
+            shutil.rmtree(work_dir)
 
 
 if __name__ == "__main__":
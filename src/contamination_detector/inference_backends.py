@@ -0,0 +1,175 @@
+import os
+import re
+import logging
+from types import SimpleNamespace
+import torch
+from torch import nn
+
+INFERENCE_BACKENDS = ("eager", "int8", "compile", "onnx")
+DEFAULT_ONNX_DIR = "../data/onnx_models"
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Set the torch thread pools of the current process.
+
+    Args:
+        intra_op_threads (int): Threads used inside a single op (matmul, attention).
+        inter_op_threads (int): Threads used to run independent ops concurrently. Torch
+            only accepts this before the first parallel op has run in the process.
+    """
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            logging.warning("Could not set inter-op threads: %s", e)
+
+
+def _slug(model_name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+def _conv1d_to_linear(model):
+    """
+    Replace transformers' Conv1D layers (used by GPT-2) with equivalent nn.Linear layers.
+
+    Dynamic quantization only rewrites nn.Linear modules, and Conv1D stores the
+    transposed weight of a linear layer.
+    """
+    from transformers.pytorch_utils import Conv1D
+    for name, module in model.named_children():
+        if isinstance(module, Conv1D):
+            linear = nn.Linear(module.weight.shape[0], module.weight.shape[1])
+            linear.weight = nn.Parameter(module.weight.data.T.contiguous())
+            linear.bias = nn.Parameter(module.bias.data)
+            setattr(model, name, linear)
+        else:
+            _conv1d_to_linear(module)
+    return model
+
+
+class _LogitsOnly(nn.Module):
+    """Export wrapper returning only the logits of a causal LM."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+
+class OnnxCausalLM:
+    """
+    ONNX Runtime session behaving like a causal LM for the perplexity scorer.
+
+    Calling it with input_ids and attention_mask returns an object with a .logits
+    tensor. It has no torch parameters, so the scorer keeps its inputs on the CPU.
+    """
+
+    def __init__(self, onnx_path, config, intra_op_threads=None, inter_op_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.config = config
+
+    def parameters(self):
+        return iter(())
+
+    def __call__(self, input_ids, attention_mask):
+        logits = self.session.run(["logits"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy(),
+        })[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def export_language_model_onnx(model, model_name, onnx_dir=DEFAULT_ONNX_DIR):
+    """
+    Export a causal LM to ONNX with dynamic batch and sequence axes, reusing an earlier export.
+
+    Returns:
+        str: Path of the .onnx file.
+    """
+    onnx_path = os.path.join(onnx_dir, f"{_slug(model_name)}.onnx")
+    if os.path.exists(onnx_path):
+        return onnx_path
+    os.makedirs(onnx_dir, exist_ok=True)
+    logging.info("Exporting %s to ONNX: %s", model_name, onnx_path)
+    dummy = torch.ones((2, 8), dtype=torch.long)
+    # Worker processes may export concurrently; each writes its own file before the rename.
+    tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+    torch.onnx.export(
+        _LogitsOnly(model.cpu()).eval(), (dummy, torch.ones_like(dummy)), tmp_path,
+        input_names=["input_ids", "attention_mask"], output_names=["logits"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                      "logits": {0: "batch", 1: "sequence"}},
+        opset_version=17, dynamo=False,
+    )
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def prepare_language_model(model, model_name, backend="eager", onnx_dir=DEFAULT_ONNX_DIR,
+                           intra_op_threads=None, inter_op_threads=None):
+    """
+    Turn a loaded fp32 causal LM into the selected inference backend.
+
+    Args:
+        model: Causal LM loaded with transformers.
+        model_name (str): Model name, used to cache ONNX exports.
+        backend (str): 'eager' (unchanged), 'int8' (dynamic int8 quantization of the
+            linear layers, CPU only), 'compile' (torch.compile with dynamic shapes) or
+            'onnx' (exported ONNX Runtime session).
+        onnx_dir (str): Directory of cached ONNX exports.
+        intra_op_threads (int): ONNX Runtime intra-op threads.
+        inter_op_threads (int): ONNX Runtime inter-op threads.
+
+    Returns:
+        Model callable as model(input_ids=..., attention_mask=...).logits.
+    """
+    if backend == "eager":
+        return model
+    if backend == "int8":
+        model = _conv1d_to_linear(model.cpu())
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if backend == "compile":
+        return torch.compile(model, dynamic=True)
+    if backend == "onnx":
+        onnx_path = export_language_model_onnx(model, model_name, onnx_dir=onnx_dir)
+        return OnnxCausalLM(onnx_path, model.config, intra_op_threads=intra_op_threads,
+                            inter_op_threads=inter_op_threads)
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+
+def load_sentence_transformer(model_name, backend="eager"):
+    """
+    Load a SentenceTransformer model with the selected inference backend.
+
+    Args:
+        model_name (str): SentenceTransformer model name.
+        backend (str): 'eager', 'int8' (dynamic int8 quantization of the linear layers),
+            'compile' (torch.compile of the underlying transformer) or 'onnx'
+            (sentence-transformers' ONNX Runtime backend, requires optimum).
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    model = SentenceTransformer(model_name)
+    if backend == "eager":
+        return model
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(model.cpu(), {nn.Linear}, dtype=torch.qint8)
+    if backend == "compile":
+        model[0].auto_model = torch.compile(model[0].auto_model, dynamic=True)
+        return model
+    raise ValueError(f"Unknown inference backend: {backend}")
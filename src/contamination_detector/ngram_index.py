@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from tqdm import tqdm
+
+from reference_store import text_hash, corpus_fingerprint
+
+DEFAULT_NGRAM_N = 8
+DEFAULT_NGRAM_THRESHOLD = 0.5
+DEFAULT_BUILD_CHUNK_SIZE = 100
+# Distinct n-grams buffered in memory while building before they are spilled as a sorted run (128 MiB of uint64).
+DEFAULT_BUILD_RUN_SIZE = 1 << 24
+WORD_RE = re.compile(r"\w+")
+# Odd 64-bit multiplier of the polynomial rolling hash (arithmetic wraps modulo 2**64).
+_HASH_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _words(text):
+    """Split text into lowercase word tokens."""
+    return WORD_RE.findall(text.lower())
+
+
+class _WordHasher:
+    """Map words to stable 64-bit hashes, memoizing the vocabulary seen so far."""
+
+    def __init__(self):
+        self.cache = {}
+
+    def __call__(self, word):
+        value = self.cache.get(word)
+        if value is None:
+            value = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            self.cache[word] = value
+        return value
+
+
+def _ngram_hashes(word_lists, n, hasher):
+    """
+    Compute rolling n-gram hashes for many word lists at once.
+
+    The word hashes of all lists are concatenated and combined with a polynomial
+    rolling hash in n vectorized steps. N-grams that would cross from one list into
+    the next are dropped.
+
+    Args:
+        word_lists (list): List of word lists.
+        n (int): N-gram length in words.
+        hasher (_WordHasher): Word hash function.
+
+    Returns:
+        (hashes, owners, positions): uint64 n-gram hashes, the index of the list each
+        n-gram belongs to and the word position at which it starts.
+    """
+    lengths = np.fromiter((len(words) for words in word_lists), dtype=np.int64, count=len(word_lists))
+    total = int(lengths.sum())
+    if total < n:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    word_hashes = np.fromiter((hasher(word) for words in word_lists for word in words),
+                              dtype=np.uint64, count=total)
+
+    hashes = word_hashes[:total - n + 1].copy()
+    for j in range(1, n):
+        hashes = hashes * _HASH_BASE + word_hashes[j:total - n + 1 + j]
+
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    owners = np.repeat(np.arange(len(word_lists)), lengths)[:total - n + 1]
+    positions = np.arange(total - n + 1) - starts[owners]
+    valid = positions <= lengths[owners] - n
+    return hashes[valid], owners[valid], positions[valid]
+
+
+def _merge_sorted_runs(runs, out_path, chunk_size):
+    """
+    Merge sorted runs of distinct uint64 hashes into one .npy of distinct hashes, chunk by chunk.
+
+    Every step reads the next chunk_size entries of each run and takes the entries up to
+    the smallest chunk end, which no run can still undercut, so memory is bounded by
+    len(runs) * chunk_size entries however large the runs are.
+
+    Args:
+        runs (list): Sorted, individually distinct uint64 arrays (typically memory-mapped).
+        out_path (str): Path of the merged .npy file.
+        chunk_size (int): Entries read from each run per step.
+
+    Returns:
+        int: Number of distinct hashes written.
+    """
+    raw_path = out_path + ".raw"
+    positions = [0] * len(runs)
+    count = 0
+    with open(raw_path, "wb") as f:
+        while True:
+            chunks = [run[pos:pos + chunk_size] for run, pos in zip(runs, positions)]
+            active = [i for i, chunk in enumerate(chunks) if len(chunk)]
+            if not active:
+                break
+            bound = min(chunks[i][-1] for i in active)
+            taken = []
+            for i in active:
+                stop = int(np.searchsorted(chunks[i], bound, side="right"))
+                taken.append(chunks[i][:stop])
+                positions[i] += stop
+            merged = np.unique(np.concatenate(taken))
+            merged.tofile(f)
+            count += len(merged)
+
+    # The count is only known now, so the raw values are copied behind an .npy header.
+    if count == 0:
+        np.save(out_path, np.empty(0, dtype=np.uint64))
+    else:
+        raw = np.memmap(raw_path, dtype=np.uint64, mode="r", shape=(count,))
+        out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint64, shape=(count,))
+        step = chunk_size * max(len(runs), 1)
+        for start in range(0, count, step):
+            out[start:start + step] = raw[start:start + step]
+        out.flush()
+        del raw, out
+    os.remove(raw_path)
+    return count
+
+
+class NGramIndex:
+    """
+    Sorted array of the distinct hashed word n-grams of a reference corpus.
+
+    Membership of a segment's n-grams is tested with a single vectorized binary
+    search, so scoring needs no model forward pass. The array is saved as .npy
+    together with a JSON sidecar and memory-mapped when loaded.
+    """
+
+    def __init__(self, hashes, n, fingerprint=None):
+        self.hashes = hashes
+        self.n = n
+        self.fingerprint = fingerprint
+        self.hasher = _WordHasher()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @classmethod
+    def build(cls, texts, n=DEFAULT_NGRAM_N, chunk_size=DEFAULT_BUILD_CHUNK_SIZE, fingerprint=None, path=None,
+              run_size=DEFAULT_BUILD_RUN_SIZE):
+        """
+        Build an index from reference texts.
+
+        The distinct n-grams of every chunk of texts are buffered, and once run_size of them
+        are buffered they are sorted and spilled to a temporary run file. The runs are
+        merged chunk by chunk at the end, so build memory is bounded by run_size rather
+        than by the number of distinct n-grams of the corpus.
+
+        Args:
+            texts (list): Reference texts.
+            n (int): N-gram length in words.
+            chunk_size (int): Number of texts hashed at a time.
+            fingerprint (str): Optional corpus fingerprint stored with the index.
+            path (str): Optional .npy path the merged index is written to (then memory-mapped);
+                without it, an index that was spilled is loaded into memory after merging.
+            run_size (int): Distinct n-grams buffered in memory before a run is spilled.
+
+        Returns:
+            NGramIndex: The built index.
+        """
+        hasher = _WordHasher()
+        buffer, buffered, runs = [], 0, []
+        run_dir = None
+        try:
+            for start in tqdm(range(0, len(texts), chunk_size), desc="Building n-gram index"):
+                word_lists = [_words(text) for text in texts[start:start + chunk_size]]
+                hashes, _, _ = _ngram_hashes(word_lists, n, hasher)
+                buffer.append(np.unique(hashes))
+                buffered += len(buffer[-1])
+                if buffered >= run_size:
+                    run_dir = run_dir or tempfile.mkdtemp(prefix="ngram_runs_", dir=os.path.dirname(path or "") or None)
+                    run_path = os.path.join(run_dir, f"run_{len(runs):06d}.npy")
+                    np.save(run_path, np.unique(np.concatenate(buffer)))
+                    runs.append(np.load(run_path, mmap_mode="r"))
+                    buffer, buffered = [], 0
+
+            if not runs:
+                hashes = np.unique(np.concatenate(buffer)) if buffer else np.empty(0, dtype=np.uint64)
+            else:
+                if buffer:
+                    runs.append(np.unique(np.concatenate(buffer)))
+                    buffer = []
+                out_path = (path or os.path.join(run_dir, "merged.npy")) + ".tmp.npy"
+                merge_chunk = max(1024, run_size // (4 * len(runs)))
+                logging.info("Merging %d sorted n-gram runs", len(runs))
+                _merge_sorted_runs(runs, out_path, merge_chunk)
+                runs = []
+                if path:
+                    os.replace(out_path, path)
+                    hashes = np.load(path, mmap_mode="r")
+                else:
+                    hashes = np.load(out_path)
+        finally:
+            runs = []
+            if run_dir is not None:
+                shutil.rmtree(run_dir, ignore_errors=True)
+        logging.info("Built %d-gram index with %d distinct n-grams from %d texts", n, len(hashes), len(texts))
+        return cls(hashes, n, fingerprint=fingerprint)
+
+    def save(self, path):
+        """Save the index to path (.npy) and its metadata to path + '.json'."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # An index built with path=... is already memory-mapped from there.
+        if getattr(self.hashes, "filename", None) != os.path.abspath(path):
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, self.hashes)
+            os.replace(tmp_path, path)
+        with open(path + ".json", "w") as f:
+            json.dump({"n": self.n, "size": len(self.hashes), "fingerprint": self.fingerprint}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save(), memory-mapping the n-gram array."""
+        with open(path + ".json", "r") as f:
+            meta = json.load(f)
+        return cls(np.load(path, mmap_mode="r"), meta["n"], fingerprint=meta["fingerprint"])
+
+    def score(self, segments):
+        """
+        Score segments by the fraction of their n-grams found in the index.
+
+        Args:
+            segments (list): Text segments.
+
+        Returns:
+            (overlaps, longest, spans): Overlap ratio per segment, the length in words of
+            the longest run of consecutive matching text, and that matching text
+            ('' when nothing matches).
+        """
+        word_lists = [_words(seg) for seg in segments]
+        hashes, owners, positions = _ngram_hashes(word_lists, self.n, self.hasher)
+        if len(self.hashes) and len(hashes):
+            found = np.searchsorted(self.hashes, hashes)
+            found[found == len(self.hashes)] = 0
+            hits = np.asarray(self.hashes[found]) == hashes
+        else:
+            hits = np.zeros(len(hashes), dtype=bool)
+
+        totals = np.bincount(owners, minlength=len(segments))
+        hit_counts = np.bincount(owners, weights=hits, minlength=len(segments))
+        overlaps = np.divide(hit_counts, totals, out=np.zeros(len(segments)), where=totals > 0)
+
+        # Runs of consecutive matching n-grams within a segment form one matching span.
+        prev_hit = np.concatenate(([False], hits[:-1] & (owners[1:] == owners[:-1])))
+        run_ids = np.cumsum(hits & ~prev_hit) - 1
+        run_lengths = np.bincount(run_ids[hits], minlength=max(int(run_ids.max(initial=-1)) + 1, 0))
+        run_starts = np.flatnonzero(hits & ~prev_hit)
+        longest = np.zeros(len(segments), dtype=np.int64)
+        spans = [""] * len(segments)
+        best_run = {}
+        for run, start in enumerate(run_starts):
+            owner = owners[start]
+            if run_lengths[run] + self.n - 1 > longest[owner]:
+                longest[owner] = run_lengths[run] + self.n - 1
+                best_run[owner] = positions[start]
+        for owner, word_pos in best_run.items():
+            spans[owner] = " ".join(word_lists[owner][word_pos:word_pos + longest[owner]])
+        return overlaps, longest, spans
+
+
+def load_or_build_ngram_index(path, reference_texts, n=DEFAULT_NGRAM_N):
+    """
+    Load the n-gram index at path, rebuilding it if it is missing or stale.
+
+    The index is considered stale if it was built with a different n or from a
+    different reference corpus (compared by corpus fingerprint).
+
+    Args:
+        path (str): Path of the saved index.
+        reference_texts (list): Reference texts.
+        n (int): N-gram length in words.
+
+    Returns:
+        NGramIndex: The loaded or freshly built index.
+    """
+    fingerprint = corpus_fingerprint(text_hash(text) for text in reference_texts)
+    if os.path.exists(path) and os.path.exists(path + ".json"):
+        index = NGramIndex.load(path)
+        if index.n == n and index.fingerprint == fingerprint:
+            logging.info("Loaded %d-gram index with %d n-grams from: %s", n, len(index), path)
+            return index
+        logging.info("N-gram index at %s is stale, rebuilding.", path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    index = NGramIndex.build(reference_texts, n=n, fingerprint=fingerprint, path=path)
+    index.save(path)
+    logging.info("Saved n-gram index to: %s", path)
+    return index
@@ -1,17 +1,31 @@
+import math
 import random
 import logging
+import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import torch.nn.functional as F
+from tqdm import tqdm
+
+from inference_backends import prepare_language_model
+from seeding import row_rng
 
 DEFAULT_LM_MODEL_NAME = "distilgpt2"
+DEFAULT_LM_BATCH_SIZE = 32
+DEFAULT_MAX_BATCH_TOKENS = 8192
+DEFAULT_NUM_PERTURBATIONS = 8
+DEFAULT_PACOST_ALPHA = 0.05
+DEFAULT_PERPLEXITY_RATIO_THRESHOLD = 0.8
+# NLL margin equivalent to the ratio test: ppl_orig < r * ppl_perturbed  <=>  NLL_perturbed - NLL_orig > log(1 / r).
+DEFAULT_PACOST_MARGIN = math.log(1 / DEFAULT_PERPLEXITY_RATIO_THRESHOLD)
 
 
-def perturb_text(text):
+def perturb_text(text, rng=None):
     """
     Perturb the text by shuffling its words.
 
     Args:
         text (str): Input text.
+        rng (random.Random): Optional random generator for reproducible shuffles.
 
     Returns:
         str: Perturbed text.
@@ -19,50 +33,348 @@ def perturb_text(text):
     words = text.split()
     if len(words) <= 1:
         return text
-    random.shuffle(words)
+    (rng or random).shuffle(words)
     return " ".join(words)
 
 
-def load_language_model(model_name=DEFAULT_LM_MODEL_NAME):
+def generate_perturbations(text, num_perturbations, rng=None):
+    """
+    Generate several independent word-shuffle perturbations of a text.
+
+    Args:
+        text (str): Input text.
+        num_perturbations (int): Number of perturbations to generate.
+        rng (random.Random): Optional random generator for reproducible shuffles.
+
+    Returns:
+        list: List of num_perturbations perturbed texts.
+    """
+    return [perturb_text(text, rng=rng) for _ in range(num_perturbations)]
+
+
+def load_language_model(model_name=DEFAULT_LM_MODEL_NAME, backend="eager", **backend_options):
     """
     Load a lightweight language model and its tokenizer.
 
     Args:
         model_name (str): Model name (default: distilgpt2).
+        backend (str): Inference backend, one of inference_backends.INFERENCE_BACKENDS
+            (default: eager). Non-eager backends run on the CPU.
+        **backend_options: Passed to inference_backends.prepare_language_model
+            (onnx_dir, intra_op_threads, inter_op_threads).
 
     Returns:
         (model, tokenizer): The loaded model and tokenizer.
     """
-    logging.info("Loading language model: %s", model_name)
+    logging.info("Loading language model: %s (backend: %s)", model_name, backend)
+    from transformers import AutoTokenizer, AutoModelForCausalLM
     model = AutoModelForCausalLM.from_pretrained(model_name)
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model.eval()
+    if backend != "eager":
+        return prepare_language_model(model, model_name, backend=backend, **backend_options), tokenizer
     if torch.mps.is_available():
         model.to("mps")
     return model, tokenizer
 
 
-def compute_perplexity(text, model, tokenizer):
+def compute_perplexity(text, model, tokenizer, window=None, stride=None):
     """
     Compute perplexity for a given text using a language model.
 
+    Texts longer than the model context are scored with a strided sliding window.
+
     Args:
         text (str): Input text.
         model: Language model.
         tokenizer: Corresponding tokenizer.
+        window (int): Tokens per sliding window (default: the model context length).
+        stride (int): Tokens the sliding window advances per step (default: window // 2).
 
     Returns:
         float: Computed perplexity or None on error.
     """
     try:
-        encodings = tokenizer(text, return_tensors='pt')
-        if torch.mps.is_available():
-            encodings = {k: v.to("mps") for k, v in encodings.items()}
-        with torch.no_grad():
-            outputs = model(**encodings, labels=encodings["input_ids"])
-        loss = outputs.loss
-        perplexity = torch.exp(loss)
-        return perplexity.item()
+        return compute_perplexity_batch([text], model, tokenizer, window=window, stride=stride)[0]
     except Exception as e:
         logging.error("Error computing perplexity: %s", e)
-        return None
\ No newline at end of file
+        return None
+
+
+def _model_device(model):
+    """Return the device holding the model parameters (cpu if it has none)."""
+    try:
+        return next(model.parameters()).device
+    except (AttributeError, StopIteration):
+        return torch.device("cpu")
+
+
+def _model_max_length(model):
+    """Return the maximum context length of the model, or None if unknown."""
+    config = getattr(model, "config", None)
+    return getattr(config, "n_positions", None) or getattr(config, "max_position_embeddings", None)
+
+
+def _length_buckets(lengths, batch_size, max_batch_tokens):
+    """
+    Group sequence indices into batches of similar length.
+
+    Indices are sorted by length so that every batch pads to a length close to its
+    longest member. A batch is closed once it holds batch_size sequences or once
+    adding another sequence would exceed max_batch_tokens padded tokens.
+
+    Args:
+        lengths (list): Token count of each sequence.
+        batch_size (int): Maximum number of sequences per batch.
+        max_batch_tokens (int): Maximum number of padded tokens per batch.
+
+    Returns:
+        list: List of index lists, one per batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets = []
+    current = []
+    for idx in order:
+        padded = (len(current) + 1) * lengths[idx]
+        if current and (len(current) >= batch_size or padded > max_batch_tokens):
+            buckets.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def _sliding_windows(ids, window, stride):
+    """
+    Split a token sequence into overlapping windows for strided perplexity.
+
+    Each window starts stride tokens after the previous one and holds at most window
+    tokens. Only the tokens not scored by an earlier window are scored, so every token
+    after the first is scored exactly once while keeping up to window - stride tokens
+    of left context.
+
+    Args:
+        ids (list): Token ids of one text.
+        window (int): Maximum number of tokens per window.
+        stride (int): Number of tokens the window advances each step.
+
+    Returns:
+        list: (window_ids, score_from) pairs where tokens at positions >= score_from
+        within the window are scored.
+    """
+    if len(ids) <= window:
+        return [(ids, 1)]
+    windows = []
+    prev_end = 0
+    for begin in range(0, len(ids), stride):
+        end = min(begin + window, len(ids))
+        windows.append((ids[begin:end], max(prev_end - begin, 1)))
+        prev_end = end
+        if end == len(ids):
+            break
+    return windows
+
+
+def score_texts(texts, model, tokenizer, batch_size=DEFAULT_LM_BATCH_SIZE,
+                max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, window=None, stride=None, show_progress=False):
+    """
+    Compute the summed token negative log-likelihood of each text in padded batches.
+
+    Texts are tokenized once, sorted into length buckets and right-padded, so the
+    position ids of real tokens match an un-padded forward pass. Token losses are
+    computed unreduced and masked, which keeps every sequence's score independent of
+    the other sequences in its batch.
+
+    Texts longer than window tokens are split into strided sliding windows (see
+    _sliding_windows). The windows are scored in the same length buckets as short
+    texts and their losses are summed back per text, so long documents cost
+    O(length * window / stride) tokens instead of failing on the context limit.
+
+    Args:
+        texts (list): List of input texts.
+        model: Language model.
+        tokenizer: Corresponding tokenizer.
+        batch_size (int): Maximum number of sequences per forward pass.
+        max_batch_tokens (int): Maximum number of padded tokens per forward pass.
+        window (int): Tokens per sliding window (default: the model context length).
+        stride (int): Tokens the sliding window advances per step (default: window // 2).
+        show_progress (bool): Whether to display a progress bar over batches.
+
+    Returns:
+        (nll_sums, token_counts): Arrays with the summed NLL and the number of scored
+        tokens for each text. Texts that cannot be scored get a count of 0.
+    """
+    nll_sums = np.zeros(len(texts), dtype=np.float64)
+    token_counts = np.zeros(len(texts), dtype=np.int64)
+    if len(texts) == 0:
+        return nll_sums, token_counts
+
+    max_length = _model_max_length(model) or DEFAULT_MAX_BATCH_TOKENS
+    window = max(min(window or max_length, max_length), 2)
+    stride = max(min(stride or window // 2, window - 1), 1)
+
+    input_ids = tokenizer(list(texts))["input_ids"]
+    units = []
+    for i, ids in enumerate(input_ids):
+        if len(ids) > 1:
+            units.extend((i, unit_ids, score_from) for unit_ids, score_from in _sliding_windows(ids, window, stride))
+    skipped = sum(1 for ids in input_ids if len(ids) <= 1)
+    if skipped:
+        logging.warning("Skipping %d texts that are too short to score.", skipped)
+
+    pad_id = tokenizer.pad_token_id
+    if pad_id is None:
+        pad_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else 0
+    device = _model_device(model)
+
+    lengths = [len(unit_ids) for _, unit_ids, _ in units]
+    buckets = _length_buckets(lengths, batch_size, max_batch_tokens)
+    for bucket in tqdm(buckets, desc="Scoring perplexity batches", disable=not show_progress):
+        batch_units = [units[b] for b in bucket]
+        longest = max(len(unit_ids) for _, unit_ids, _ in batch_units)
+        batch_ids = torch.full((len(batch_units), longest), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch_units), longest), dtype=torch.long)
+        score_mask = torch.zeros((len(batch_units), longest), dtype=torch.float32)
+        for j, (_, unit_ids, score_from) in enumerate(batch_units):
+            batch_ids[j, :len(unit_ids)] = torch.tensor(unit_ids, dtype=torch.long)
+            attention_mask[j, :len(unit_ids)] = 1
+            score_mask[j, score_from:len(unit_ids)] = 1.0
+        batch_ids = batch_ids.to(device)
+        attention_mask = attention_mask.to(device)
+
+        with torch.no_grad():
+            logits = model(input_ids=batch_ids, attention_mask=attention_mask).logits
+        shift_logits = logits[:, :-1, :].float()
+        shift_labels = batch_ids[:, 1:]
+        shift_mask = score_mask[:, 1:].to(device)
+        token_losses = F.cross_entropy(
+            shift_logits.reshape(-1, shift_logits.size(-1)),
+            shift_labels.reshape(-1),
+            reduction="none",
+        ).view(shift_labels.shape)
+
+        text_rows = [text_idx for text_idx, _, _ in batch_units]
+        np.add.at(nll_sums, text_rows, (token_losses * shift_mask).sum(dim=1).cpu().numpy())
+        np.add.at(token_counts, text_rows, shift_mask.sum(dim=1).long().cpu().numpy())
+
+    return nll_sums, token_counts
+
+
+def compute_perplexity_batch(texts, model, tokenizer, batch_size=DEFAULT_LM_BATCH_SIZE,
+                             max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, window=None, stride=None,
+                             show_progress=False):
+    """
+    Compute perplexity for a list of texts using length-bucketed, padded batches.
+
+    Args:
+        texts (list): List of input texts.
+        model: Language model.
+        tokenizer: Corresponding tokenizer.
+        batch_size (int): Maximum number of sequences per forward pass.
+        max_batch_tokens (int): Maximum number of padded tokens per forward pass.
+        window (int): Tokens per sliding window for long texts (default: the model context length).
+        stride (int): Tokens the sliding window advances per step (default: window // 2).
+        show_progress (bool): Whether to display a progress bar over batches.
+
+    Returns:
+        list: Perplexity of each text, or None where the text could not be scored.
+    """
+    nll_sums, token_counts = score_texts(texts, model, tokenizer, batch_size=batch_size,
+                                         max_batch_tokens=max_batch_tokens, window=window, stride=stride,
+                                         show_progress=show_progress)
+    return [math.exp(nll / count) if count > 0 else None for nll, count in zip(nll_sums, token_counts)]
+
+
+def confidence_t_test(nll_original, nll_perturbed, margin=DEFAULT_PACOST_MARGIN):
+    """
+    One-sided one-sample t-test of the perturbed NLLs of each segment against its original NLL plus a margin.
+
+    The original of a segment is a single constant, so for every segment the K differences
+    d_k = NLL(perturbation_k) - NLL(original) are tested against the null hypothesis
+    mean(d) <= margin. Shuffling raises the NLL of almost any fluent text, so the margin
+    is what separates memorized segments from ordinary ones: the default log(1 / 0.8) is
+    the decision boundary of the ratio test with --perplexity_ratio_threshold 0.8. A small
+    p-value means the model is consistently more confident on the original wording than
+    the margin allows.
+
+    Args:
+        nll_original (np.ndarray): Mean token NLL of each original segment (n,).
+        nll_perturbed (np.ndarray): Mean token NLL of each perturbation (n x K).
+        margin (float): NLL margin (delta) of the null hypothesis.
+
+    Returns:
+        np.ndarray: p-value per segment, NaN where the test is undefined.
+    """
+    diffs = nll_perturbed - nll_original[:, None] - margin
+    k = diffs.shape[1]
+    p_values = np.full(len(diffs), np.nan)
+    if k < 2:
+        return p_values
+    valid = np.isfinite(diffs).all(axis=1)
+    mean = diffs[valid].mean(axis=1)
+    std = diffs[valid].std(axis=1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = mean / (std / np.sqrt(k))
+    from scipy import stats
+    p = stats.t.sf(t_stat, df=k - 1)
+    # Identical differences (e.g. perturbations equal to the original) give a zero variance.
+    degenerate = std == 0
+    p[degenerate] = np.where(mean[degenerate] > 0, 0.0, 1.0)
+    p_values[valid] = p
+    return p_values
+
+
+def pacost_test_batch(segments, model, tokenizer, num_perturbations=DEFAULT_NUM_PERTURBATIONS,
+                      alpha=DEFAULT_PACOST_ALPHA, margin=DEFAULT_PACOST_MARGIN, seed=None, row_ids=None, batch_size=DEFAULT_LM_BATCH_SIZE,
+                      max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, window=None, stride=None, show_progress=False):
+    """
+    Run the multi-perturbation PaCoST test on a list of segments.
+
+    Every segment and its num_perturbations shuffles are scored together in the
+    length-bucketed batches of score_texts. Perturbations of a segment have the same
+    words, hence nearly the same token length, so they share padded batches with their
+    original and the cost per segment grows sublinearly in the number of perturbations.
+
+    Args:
+        segments (list): Text segments to test.
+        model: Language model.
+        tokenizer: Corresponding tokenizer.
+        num_perturbations (int): Number of perturbations per segment (K).
+        alpha (float): Significance level for flagging.
+        margin (float): NLL margin of the null hypothesis, see confidence_t_test.
+        seed (int): Seed of the perturbation generator for reproducible runs.
+        row_ids (list): Global row ids of the segments. When given, every segment is perturbed
+            with its own row_rng(seed, row_id), so results do not depend on batching.
+        batch_size (int): Maximum number of sequences per forward pass.
+        max_batch_tokens (int): Maximum number of padded tokens per forward pass.
+        window (int): Tokens per sliding window for long texts.
+        stride (int): Tokens the sliding window advances per step.
+        show_progress (bool): Whether to display a progress bar over batches.
+
+    Returns:
+        dict: Arrays 'ppl_original', 'ppl_perturbed' (geometric mean over perturbations),
+        'p_value' and 'flag' (p_value < alpha), one entry per segment.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for i, seg in enumerate(segments):
+        texts.append(seg)
+        seg_rng = rng if row_ids is None else row_rng(seed, row_ids[i])
+        texts.extend(generate_perturbations(seg, num_perturbations, rng=seg_rng))
+
+    nll_sums, token_counts = score_texts(texts, model, tokenizer, batch_size=batch_size,
+                                         max_batch_tokens=max_batch_tokens, window=window, stride=stride,
+                                         show_progress=show_progress)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_nll = np.where(token_counts > 0, nll_sums / np.maximum(token_counts, 1), np.nan)
+    mean_nll = mean_nll.reshape(len(segments), num_perturbations + 1)
+    nll_original, nll_perturbed = mean_nll[:, 0], mean_nll[:, 1:]
+
+    p_values = confidence_t_test(nll_original, nll_perturbed, margin=margin)
+    return {
+        "ppl_original": np.exp(nll_original),
+        "ppl_perturbed": np.exp(nll_perturbed.mean(axis=1)),
+        "p_value": p_values,
+        "flag": p_values < alpha,
+    }
@@ -1,23 +1,39 @@
 import logging
-from sentence_transformers import SentenceTransformer, util
+import numpy as np
+import torch
+
+from reference_store import ReferenceStore
+from inference_backends import load_sentence_transformer
 
 DEFAULT_REF_MODEL_NAME = 'all-MiniLM-L6-v2'
+DEFAULT_ENCODE_BATCH_SIZE = 256
+DEFAULT_SIMILARITY_BLOCK_SIZE = 4096
 
 
-def load_reference_data(reference_texts, model_name=DEFAULT_REF_MODEL_NAME):
+def load_reference_data(reference_texts, model_name=DEFAULT_REF_MODEL_NAME, store_dir=None, backend="eager", model=None):
     """
     Load a SentenceTransformer model and compute embeddings for a list of reference texts.
 
     Args:
         reference_texts (list): List of reference text strings.
         model_name (str): Model name for SentenceTransformer (default: all-MiniLM-L6-v2).
+        store_dir (str): Optional directory of a persistent reference store. When given,
+            stored embeddings are memory-mapped and only texts missing from the store are encoded.
+        backend (str): Inference backend, one of inference_backends.INFERENCE_BACKENDS
+            (default: eager). Non-eager embeddings are stored separately from fp32 ones.
+        model: Optional already loaded model_name model (e.g. from the embedding service).
 
     Returns:
         (model, embeddings): Tuple containing the loaded model and computed embeddings.
     """
-    logging.info("Loading reference model: %s", model_name)
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(reference_texts, convert_to_tensor=True)
+    if model is None:
+        logging.info("Loading reference model: %s (backend: %s)", model_name, backend)
+        model = load_sentence_transformer(model_name, backend=backend)
+    if store_dir is not None:
+        store = ReferenceStore(store_dir, model_name if backend == "eager" else f"{model_name}@{backend}")
+        embeddings = store.get_embeddings(reference_texts, model)
+    else:
+        embeddings = model.encode(reference_texts, convert_to_tensor=True)
     return model, embeddings
 
 
@@ -37,7 +53,101 @@ def check_reference_similarity(segment, ref_embeddings, threshold=0.9, ref_model
     if ref_model is None:
         raise ValueError("A reference model is required to encode the segment.")
     segment_embedding = ref_model.encode(segment, convert_to_tensor=True)
+    from sentence_transformers import util
     cos_scores = util.cos_sim(segment_embedding, ref_embeddings)
     max_sim = cos_scores.max().item()
     flag = max_sim >= threshold
-    return max_sim, flag
\ No newline at end of file
+    return max_sim, flag
+
+
+def _normalized_block(embeddings, start, stop, device):
+    """Return rows [start, stop) of embeddings as an L2-normalized float32 tensor."""
+    block = embeddings[start:stop]
+    if not isinstance(block, torch.Tensor):
+        block = torch.from_numpy(np.ascontiguousarray(block))
+    block = block.to(device=device, dtype=torch.float32)
+    return torch.nn.functional.normalize(block, p=2, dim=1)
+
+
+def max_similarity_search(query_embeddings, ref_embeddings, block_size=DEFAULT_SIMILARITY_BLOCK_SIZE):
+    """
+    Find the most similar reference embedding for every query embedding.
+
+    Both sides are processed in blocks of block_size rows, so the largest temporary
+    similarity matrix is block_size x block_size regardless of corpus size. A running
+    maximum and argmax are kept per query across reference blocks.
+
+    Args:
+        query_embeddings (tensor or np.ndarray): Query embeddings (n_queries x dim).
+        ref_embeddings (tensor or np.ndarray): Reference embeddings (n_refs x dim).
+        block_size (int): Number of rows per query and reference block.
+
+    Returns:
+        (max_sims, ref_ids): Arrays with the maximum cosine similarity and the row index
+        of the matching reference embedding for each query.
+    """
+    n_queries, n_refs = len(query_embeddings), len(ref_embeddings)
+    max_sims = np.full(n_queries, -1.0, dtype=np.float32)
+    ref_ids = np.full(n_queries, -1, dtype=np.int64)
+    if n_queries == 0 or n_refs == 0:
+        return max_sims, ref_ids
+
+    device = query_embeddings.device if isinstance(query_embeddings, torch.Tensor) else torch.device("cpu")
+    for q_start in range(0, n_queries, block_size):
+        q_stop = min(q_start + block_size, n_queries)
+        queries = _normalized_block(query_embeddings, q_start, q_stop, device)
+        best_sims = torch.full((q_stop - q_start,), -1.0, device=device)
+        best_ids = torch.full((q_stop - q_start,), -1, dtype=torch.long, device=device)
+        for r_start in range(0, n_refs, block_size):
+            refs = _normalized_block(ref_embeddings, r_start, min(r_start + block_size, n_refs), device)
+            block_sims, block_ids = (queries @ refs.T).max(dim=1)
+            improved = block_sims > best_sims
+            best_sims = torch.where(improved, block_sims, best_sims)
+            best_ids = torch.where(improved, block_ids + r_start, best_ids)
+        max_sims[q_start:q_stop] = best_sims.cpu().numpy()
+        ref_ids[q_start:q_stop] = best_ids.cpu().numpy()
+    return max_sims, ref_ids
+
+
+def encode_segments(segments, ref_model, batch_size=DEFAULT_ENCODE_BATCH_SIZE):
+    """
+    Encode text segments in batches with the reference model.
+
+    Args:
+        segments (list): Text segments.
+        ref_model: SentenceTransformer model.
+        batch_size (int): Encoding batch size.
+
+    Returns:
+        tensor: Segment embeddings.
+    """
+    if ref_model is None:
+        raise ValueError("A reference model is required to encode the segments.")
+    return ref_model.encode(segments, batch_size=batch_size, convert_to_tensor=True, show_progress_bar=True)
+
+
+def check_reference_similarity_batch(segments, ref_embeddings, threshold=0.9, ref_model=None,
+                                     batch_size=DEFAULT_ENCODE_BATCH_SIZE,
+                                     block_size=DEFAULT_SIMILARITY_BLOCK_SIZE):
+    """
+    Compute the maximum cosine similarity to the reference embeddings for many segments.
+
+    Segments are encoded in large batches and compared against the references with
+    blocked, normalized matrix products (see max_similarity_search).
+
+    Args:
+        segments (list): Text segments to check.
+        ref_embeddings (tensor or np.ndarray): Precomputed reference embeddings.
+        threshold (float): Similarity threshold (default: 0.9).
+        ref_model: SentenceTransformer model to encode the segments.
+        batch_size (int): Encoding batch size.
+        block_size (int): Number of rows per block in the similarity search.
+
+    Returns:
+        (max_sims, ref_ids, flags): Arrays with the maximum similarity, the index of the
+        best matching reference text and a flag indicating if the similarity exceeds threshold.
+    """
+    segment_embeddings = encode_segments(segments, ref_model, batch_size=batch_size)
+    max_sims, ref_ids = max_similarity_search(segment_embeddings, ref_embeddings, block_size=block_size)
+    flags = max_sims >= threshold
+    return max_sims, ref_ids, flags
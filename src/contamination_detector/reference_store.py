@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import numpy as np
+
+EMBEDDINGS_FILENAME = "embeddings.f32"
+INDEX_FILENAME = "index.json"
+DEFAULT_ENCODE_CHUNK_SIZE = 10000
+
+
+def text_hash(text):
+    """
+    Compute the content hash used as the id of a reference text.
+
+    Args:
+        text (str): Reference text.
+
+    Returns:
+        str: 128-bit BLAKE2b hex digest of the UTF-8 encoded text.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def corpus_fingerprint(ids):
+    """
+    Compute a fingerprint of an ordered list of text ids.
+
+    Args:
+        ids (list): Text ids as returned by text_hash.
+
+    Returns:
+        str: Hex digest identifying the corpus and its order.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for text_id in ids:
+        digest.update(text_id.encode("ascii"))
+    return digest.hexdigest()
+
+
+def _model_slug(model_name):
+    """Turn a model name such as 'sentence-transformers/all-MiniLM-L6-v2' into a directory name."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+class ReferenceStore:
+    """
+    Persistent store of reference embeddings for one SentenceTransformer model.
+
+    The store lives in <store_dir>/<model slug>/ and consists of:
+      - embeddings.f32: a raw float32 matrix with one normalized embedding per row,
+        opened as a read-only memory map.
+      - index.json: a sidecar mapping each text id (content hash) to its row offset,
+        together with the embedding dimension and the fingerprint of the stored corpus.
+
+    Rows are only ever appended, so encoding a corpus that extends a stored one only
+    encodes the new texts.
+    """
+
+    def __init__(self, store_dir, model_name):
+        self.model_name = model_name
+        self.path = os.path.join(store_dir, _model_slug(model_name))
+        self.embeddings_path = os.path.join(self.path, EMBEDDINGS_FILENAME)
+        self.index_path = os.path.join(self.path, INDEX_FILENAME)
+        self.offsets = {}
+        self.dim = None
+        self.fingerprint = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index["model_name"] != model_name:
+                raise ValueError(f"Reference store at {self.path} belongs to model {index['model_name']}.")
+            self.offsets = index["offsets"]
+            self.dim = index["dim"]
+            self.fingerprint = index["fingerprint"]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _write_index(self):
+        """Atomically replace the sidecar with the current offsets."""
+        self.fingerprint = corpus_fingerprint(self.offsets.keys())
+        index = {
+            "model_name": self.model_name,
+            "dim": self.dim,
+            "dtype": "float32",
+            "fingerprint": self.fingerprint,
+            "offsets": self.offsets,
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _append(self, ids, embeddings):
+        """Append embeddings for new ids to the embeddings file, then publish them in the sidecar."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        with open(self.embeddings_path, "ab") as f:
+            # Drop rows written by an interrupted append that never made it into the sidecar.
+            f.truncate(len(self.offsets) * self.dim * 4)
+            f.write(embeddings.tobytes())
+        for text_id in ids:
+            self.offsets[text_id] = len(self.offsets)
+        self._write_index()
+
+    def open(self):
+        """
+        Open the stored embeddings without reading them into memory.
+
+        Returns:
+            np.memmap: Read-only (n_texts x dim) float32 matrix in row offset order.
+        """
+        if not self.offsets:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(len(self.offsets), self.dim))
+
+    def add(self, texts, model, chunk_size=DEFAULT_ENCODE_CHUNK_SIZE, ids=None):
+        """
+        Encode and append the texts that are not in the store yet.
+
+        New texts are encoded in chunks and each chunk is committed to disk before the
+        next one starts, so an interrupted run keeps the work already done.
+
+        Args:
+            texts (list): Reference texts.
+            model: SentenceTransformer model matching the store's model name.
+            chunk_size (int): Number of texts encoded and committed at a time.
+            ids (list): Optional precomputed text ids for texts.
+
+        Returns:
+            int: Number of texts that were encoded.
+        """
+        if ids is None:
+            ids = [text_hash(text) for text in texts]
+        missing = {}
+        for i, text_id in enumerate(ids):
+            if text_id not in self.offsets and text_id not in missing:
+                missing[text_id] = i
+        if not missing:
+            return 0
+
+        os.makedirs(self.path, exist_ok=True)
+        new_ids = list(missing.keys())
+        logging.info("Encoding %d new reference texts (%d already stored).", len(new_ids), len(self.offsets))
+        for start in range(0, len(new_ids), chunk_size):
+            chunk_ids = new_ids[start:start + chunk_size]
+            chunk_texts = [texts[missing[text_id]] for text_id in chunk_ids]
+            embeddings = model.encode(chunk_texts, convert_to_numpy=True, normalize_embeddings=True,
+                                      show_progress_bar=True)
+            self._append(chunk_ids, embeddings)
+        return len(new_ids)
+
+    def get_embeddings(self, texts, model, chunk_size=DEFAULT_ENCODE_CHUNK_SIZE):
+        """
+        Return embeddings for texts, encoding only texts missing from the store.
+
+        If the texts are exactly the stored corpus in stored order (same fingerprint),
+        the memory map is returned as is. Otherwise the requested rows are gathered in
+        the order of texts.
+
+        Args:
+            texts (list): Reference texts.
+            model: SentenceTransformer model matching the store's model name.
+            chunk_size (int): Number of texts encoded and committed at a time.
+
+        Returns:
+            np.ndarray: (len(texts) x dim) float32 embeddings aligned with texts.
+        """
+        ids = [text_hash(text) for text in texts]
+        if self.fingerprint is not None and corpus_fingerprint(ids) == self.fingerprint:
+            logging.info("Reference store hit for %d texts at: %s", len(ids), self.path)
+            return self.open()
+
+        self.add(texts, model, chunk_size=chunk_size, ids=ids)
+        embeddings = self.open()
+        if len(ids) == len(self.offsets) and corpus_fingerprint(ids) == self.fingerprint:
+            return embeddings
+        rows = np.fromiter((self.offsets[text_id] for text_id in ids), dtype=np.int64, count=len(ids))
+        return np.asarray(embeddings[rows])
@@ -0,0 +1,166 @@
+import os
+import json
+import shutil
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def part_path(work_dir, shard_id):
+    """Path of the columnar part file holding the results of one shard."""
+    return os.path.join(work_dir, f"part-{shard_id:05d}.parquet")
+
+
+def report_path(work_dir, shard_id):
+    """Path of the JSON report written next to a shard's part file."""
+    return os.path.join(work_dir, f"part-{shard_id:05d}.report.json")
+
+
+def prepare_work_dir(work_dir, manifest):
+    """
+    Create the work directory, discarding parts written under a different configuration.
+
+    Args:
+        work_dir (str): Directory holding the part files.
+        manifest (dict): JSON-serializable description of the input and the scoring
+            configuration. Parts are only reused if the stored manifest is identical.
+    """
+    manifest_file = os.path.join(work_dir, MANIFEST_FILENAME)
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            if json.load(f) == manifest:
+                return
+        logging.warning("Configuration changed since the parts in %s were written, discarding them.", work_dir)
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def write_part(df, report, work_dir, shard_id):
+    """
+    Atomically write a shard's results (and optional report) to the work directory.
+
+    The part file is written under a temporary name and renamed into place, so a part
+    file that exists is always complete.
+    """
+    if report is not None:
+        with open(report_path(work_dir, shard_id), "w") as f:
+            json.dump(report, f)
+    path = part_path(work_dir, shard_id)
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def run_shards(shards, process_shard, work_dir, num_workers=1, initializer=None, initargs=()):
+    """
+    Process shards that have no part file yet, sequentially or in a process pool.
+
+    Args:
+        shards (iterable): (shard_id, DataFrame) pairs.
+        process_shard (callable): (shard_id, DataFrame) -> (result DataFrame, report or None).
+            Must be a module-level function when num_workers > 1.
+        work_dir (str): Directory holding the part files.
+        num_workers (int): Number of worker processes (1 runs in the current process).
+        initializer (callable): Optional per-worker initializer, e.g. to load models.
+        initargs (tuple): Arguments for initializer.
+
+    Returns:
+        int: Number of shards processed in this run.
+    """
+    pending = ((shard_id, df) for shard_id, df in shards if not os.path.exists(part_path(work_dir, shard_id)))
+    processed = 0
+    if num_workers <= 1:
+        for shard_id, df in pending:
+            result, report = process_shard(shard_id, df)
+            write_part(result, report, work_dir, shard_id)
+            processed += 1
+            logging.info("Finished shard %d", shard_id)
+        return processed
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=initializer,
+                             initargs=initargs) as pool:
+        in_flight = {}
+        for shard_id, df in pending:
+            # Keep the number of queued shards bounded so the input is never fully in memory.
+            if len(in_flight) >= 2 * num_workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    processed += _collect(future, in_flight.pop(future), work_dir)
+            in_flight[pool.submit(process_shard, shard_id, df)] = shard_id
+        for future in list(in_flight):
+            processed += _collect(future, in_flight.pop(future), work_dir)
+    return processed
+
+
+def _collect(future, shard_id, work_dir):
+    """Write the result of a finished worker future as a part file."""
+    result, report = future.result()
+    write_part(result, report, work_dir, shard_id)
+    logging.info("Finished shard %d", shard_id)
+    return 1
+
+
+def list_parts(work_dir):
+    """Return the part files in the work directory in shard order."""
+    names = sorted(name for name in os.listdir(work_dir) if name.startswith("part-") and name.endswith(".parquet"))
+    return [os.path.join(work_dir, name) for name in names]
+
+
+def load_reports(work_dir):
+    """Return the reports written next to the part files, in shard order."""
+    names = sorted(name for name in os.listdir(work_dir) if name.endswith(".report.json"))
+    reports = []
+    for name in names:
+        with open(os.path.join(work_dir, name), "r") as f:
+            reports.append(json.load(f))
+    return reports
+
+
+def merge_parts(work_dir, output_file):
+    """
+    Merge the part files into a single Parquet table (or CSV, by the output extension),
+    one part at a time.
+
+    Parts may lack columns that only some shards produce (e.g. cascade stages no
+    segment of a shard reached), so every part is aligned to the union of columns.
+
+    Args:
+        work_dir (str): Directory holding the part files.
+        output_file (str): Path of the merged table (.parquet, otherwise CSV).
+
+    Returns:
+        int: Number of rows written.
+    """
+    parts = list_parts(work_dir)
+    schemas = [pq.read_schema(path).remove_metadata() for path in parts]
+    schema = pa.unify_schemas(schemas, promote_options="permissive") if schemas else pa.schema([])
+    columns = schema.names
+
+    tmp_path = output_file + ".tmp"
+    rows = 0
+    if output_file.endswith(".parquet"):
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for path in parts:
+                table = pq.read_table(path)
+                for field in schema:
+                    if field.name not in table.column_names:
+                        table = table.append_column(field, pa.nulls(len(table), field.type))
+                writer.write_table(table.select(columns).cast(schema))
+                rows += len(table)
+    else:
+        for i, path in enumerate(parts):
+            df = pd.read_parquet(path).reindex(columns=columns)
+            df.to_csv(tmp_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            rows += len(df)
+        if not parts:
+            pd.DataFrame(columns=columns).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output_file)
+    return rows
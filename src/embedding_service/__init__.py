@@ -0,0 +1,17 @@
+"""
+Embedding Service
+
+Shared segment embedding service used by the contamination detector and the membership
+inference checker. Models are loaded once per process and segment embeddings are
+published to a content-addressed cache, so a full pipeline run encodes every segment once.
+Modules:
+    - cache: Content-addressed, append-only embedding cache shared between processes.
+    - service: EmbeddingService and the SegmentEncoder view of it.
+    - shared_arrays: Describing embedding arrays as files that worker processes memory-map.
+"""
+
+from .cache import EmbeddingCache, segment_key
+from .service import EmbeddingService, SegmentEncoder
+from .shared_arrays import memmap_spec, open_memmap_spec
+
+__version__ = "0.1.0"
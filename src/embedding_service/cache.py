@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+import numpy as np
+
+KEYS_FILENAME = "keys.bin"
+EMBEDDINGS_FILENAME = "embeddings.f32"
+META_FILENAME = "meta.json"
+LOCK_FILENAME = ".lock"
+DEFAULT_ENCODE_CHUNK_SIZE = 10000
+_KEY_DTYPE = np.dtype("S16")
+
+
+def segment_key(text):
+    """Return the 128-bit BLAKE2b digest of a segment's UTF-8 text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _merge_levels(older, newer):
+    """
+    Merge two sorted (keys, rows) levels in one pass, keeping older entries first among equal keys.
+
+    Only the merged arrays and the insert positions of newer are allocated.
+    """
+    (a_keys, a_rows), (b_keys, b_rows) = older, newer
+    total = len(a_keys) + len(b_keys)
+    # newer[j] lands after the older entries <= it and the j newer entries before it.
+    b_pos = np.searchsorted(a_keys, b_keys, side="right") + np.arange(len(b_keys))
+    from_a = np.ones(total, dtype=bool)
+    from_a[b_pos] = False
+    keys = np.empty(total, dtype=_KEY_DTYPE)
+    rows = np.empty(total, dtype=np.int64)
+    keys[b_pos], rows[b_pos] = b_keys, b_rows
+    keys[from_a], rows[from_a] = a_keys, a_rows
+    return keys, rows
+
+
+def _model_slug(model_name):
+    """Turn a model name such as 'sentence-transformers/all-MiniLM-L6-v2' into a directory name."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of segment embeddings for one SentenceTransformer model.
+
+    The cache lives in <cache_dir>/<model slug>/ and consists of:
+      - keys.bin: the 16-byte content hash of the segment stored in each row.
+      - embeddings.f32: a raw float32 matrix with one embedding per row.
+      - meta.json: model name, embedding dimension and the number of committed rows.
+
+    Rows are only appended, under an exclusive file lock, so several processes (or
+    pipeline stages) can share one cache. A row is committed once meta.json counts
+    it; rows left behind by an interrupted run are ignored and overwritten by the
+    next append.
+
+    Keys are looked up in sorted levels of (key, row) arrays, oldest first: every commit
+    adds a level and levels of similar size are merged, so each key is copied a
+    logarithmic number of times rather than the whole index once per commit.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, _model_slug(model_name))
+        self.keys_path = os.path.join(self.path, KEYS_FILENAME)
+        self.embeddings_path = os.path.join(self.path, EMBEDDINGS_FILENAME)
+        self.meta_path = os.path.join(self.path, META_FILENAME)
+        self.lock_path = os.path.join(self.path, LOCK_FILENAME)
+        self.rows = 0
+        self.dim = None
+        self.levels = []
+        self._refresh()
+
+    def __len__(self):
+        return self.rows
+
+    def _refresh(self):
+        """Pick up rows committed since the last refresh, by this or another process."""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["model_name"] != self.model_name:
+            raise ValueError(f"Embedding cache at {self.path} belongs to model {meta['model_name']}.")
+        self.dim = meta["dim"]
+        if meta["rows"] > self.rows:
+            with open(self.keys_path, "rb") as f:
+                f.seek(self.rows * _KEY_DTYPE.itemsize)
+                new_keys = np.fromfile(f, dtype=_KEY_DTYPE, count=meta["rows"] - self.rows)
+            self._merge_keys(new_keys)
+            self.rows = meta["rows"]
+
+    def _merge_keys(self, new_keys):
+        """Add the keys of rows appended after self.rows as a sorted level, merging levels of similar size."""
+        if len(new_keys) == 0:
+            return
+        order = np.argsort(new_keys, kind="stable")
+        self.levels.append((new_keys[order], self.rows + order))
+        while len(self.levels) > 1 and len(self.levels[-2][0]) < 2 * len(self.levels[-1][0]):
+            newer, older = self.levels.pop(), self.levels.pop()
+            self.levels.append(_merge_levels(older, newer))
+
+    def lookup(self, keys):
+        """
+        Find the cache rows of keys.
+
+        Args:
+            keys (np.ndarray): Array of 16-byte keys.
+
+        Returns:
+            np.ndarray: int64 row per key (its first row if it was stored more than once),
+            -1 where the key is not cached.
+        """
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        # Older levels hold earlier rows, so the first level containing a key has its first row.
+        for level_keys, level_rows in self.levels:
+            missing = np.flatnonzero(rows < 0)
+            if len(missing) == 0:
+                break
+            pos = np.minimum(np.searchsorted(level_keys, keys[missing]), len(level_keys) - 1)
+            found = level_keys[pos] == keys[missing]
+            rows[missing[found]] = level_rows[pos[found]]
+        return rows
+
+    def _append(self, keys, embeddings):
+        """Append rows for new keys under the cache lock, then commit them in meta.json."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            for path, data, row_bytes in ((self.keys_path, keys, _KEY_DTYPE.itemsize),
+                                          (self.embeddings_path, embeddings, self.dim * 4)):
+                with open(path, "ab") as f:
+                    # Drop rows written by an interrupted append that were never committed.
+                    f.truncate(self.rows * row_bytes)
+                    f.write(data.tobytes())
+            tmp_path = self.meta_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"model_name": self.model_name, "dim": self.dim, "dtype": "float32",
+                           "rows": self.rows + len(keys)}, f)
+            os.replace(tmp_path, self.meta_path)
+            self._merge_keys(keys)
+            self.rows += len(keys)
+
+    def open(self):
+        """Open the committed embeddings as a read-only (rows x dim) float32 memory map."""
+        if self.rows == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    def get_embeddings(self, texts, load_model, batch_size=32, chunk_size=DEFAULT_ENCODE_CHUNK_SIZE,
+                       show_progress_bar=True):
+        """
+        Return embeddings for texts in input order, encoding only segments not cached yet.
+
+        Each distinct missing segment is encoded once, in chunks that are committed to
+        the cache before the next one starts.
+
+        Args:
+            texts (list): Text segments.
+            load_model (callable): Returns the SentenceTransformer model; only called
+                if some segments are missing.
+            batch_size (int): Encoding batch size.
+            chunk_size (int): Number of segments encoded and committed at a time.
+            show_progress_bar (bool): Whether the model shows a progress bar while encoding.
+
+        Returns:
+            (embeddings, hit_rate): (len(texts) x dim) float32 array aligned with texts,
+            and the fraction of texts that were already cached.
+        """
+        self._refresh()
+        keys = np.array([segment_key(text) for text in texts], dtype=_KEY_DTYPE)
+        rows = self.lookup(keys)
+        hits = int((rows >= 0).sum())
+        hit_rate = hits / len(texts) if len(texts) else 1.0
+        logging.info("Embedding cache hit rate: %.2f%% (%d of %d segments) at: %s", 100 * hit_rate, hits,
+                     len(texts), self.path)
+
+        missing = np.flatnonzero(rows < 0)
+        if len(missing):
+            _, first = np.unique(keys[missing], return_index=True)
+            new = missing[np.sort(first)]
+            model = load_model()
+            logging.info("Encoding %d new segments.", len(new))
+            for start in range(0, len(new), chunk_size):
+                chunk = new[start:start + chunk_size]
+                embeddings = model.encode([texts[i] for i in chunk], batch_size=batch_size,
+                                          show_progress_bar=show_progress_bar, convert_to_numpy=True)
+                self._append(keys[chunk], embeddings)
+            rows = self.lookup(keys)
+
+        if self.rows == 0:
+            return np.empty((0, 0), dtype=np.float32), hit_rate
+        stored = self.open()
+        if len(rows) == self.rows and np.array_equal(rows, np.arange(self.rows)):
+            return stored, hit_rate
+        return np.asarray(stored[rows]), hit_rate
@@ -0,0 +1,116 @@
+import logging
+import numpy as np
+
+from .cache import EmbeddingCache
+
+DEFAULT_BATCH_SIZE = 256
+
+
+def _load_sentence_transformer(model_name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class EmbeddingService:
+    """
+    Single entry point for segment embeddings shared by the pipeline stages.
+
+    Each model is loaded at most once per process, and only when a segment actually
+    has to be encoded. With a cache directory, embeddings are published to a shared
+    content-addressed EmbeddingCache, so segments encoded by one stage (e.g. the
+    contamination detector) are reused by the next (e.g. the membership checker)
+    instead of being encoded again.
+    """
+
+    def __init__(self, cache_dir=None, load_model=None, backend="eager", batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            cache_dir (str): Optional directory of the shared embedding cache.
+            load_model (callable): model_name -> SentenceTransformer-like model
+                (default: SentenceTransformer(model_name)).
+            backend (str): Name of the inference backend load_model applies. Embeddings
+                of non-eager backends are cached separately from fp32 ones.
+            batch_size (int): Default encoding batch size.
+        """
+        self.cache_dir = cache_dir
+        self.load_model = load_model or _load_sentence_transformer
+        self.backend = backend
+        self.batch_size = batch_size
+        self._models = {}
+        self._caches = {}
+
+    def model(self, model_name):
+        """Return the model, loading it on first use."""
+        if model_name not in self._models:
+            logging.info("Loading embedding model: %s (backend: %s)", model_name, self.backend)
+            self._models[model_name] = self.load_model(model_name)
+        return self._models[model_name]
+
+    def _cache(self, model_name):
+        if model_name not in self._caches:
+            key = model_name if self.backend == "eager" else f"{model_name}@{self.backend}"
+            self._caches[model_name] = EmbeddingCache(self.cache_dir, key)
+        return self._caches[model_name]
+
+    def encode(self, texts, model_name, batch_size=None, show_progress_bar=True, normalize_embeddings=False):
+        """
+        Embed texts, reusing cached embeddings where available.
+
+        Args:
+            texts (list): Text segments.
+            model_name (str): SentenceTransformer model name.
+            batch_size (int): Encoding batch size (default: the service's).
+            show_progress_bar (bool): Whether to show a progress bar while encoding.
+            normalize_embeddings (bool): Return L2-normalized embeddings. The cache keeps the
+                model's raw embeddings, so normalization is applied after the lookup.
+
+        Returns:
+            np.ndarray: (len(texts) x dim) float32 embeddings aligned with texts.
+        """
+        batch_size = batch_size or self.batch_size
+        if self.cache_dir is None:
+            embeddings = self.model(model_name).encode(texts, batch_size=batch_size,
+                                                       show_progress_bar=show_progress_bar, convert_to_numpy=True)
+        else:
+            embeddings, _ = self._cache(model_name).get_embeddings(texts, lambda: self.model(model_name),
+                                                                   batch_size=batch_size,
+                                                                   show_progress_bar=show_progress_bar)
+        if normalize_embeddings and len(embeddings):
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = np.asarray(embeddings, dtype=np.float32) / np.maximum(norms, 1e-12)
+        return embeddings
+
+    def encoder(self, model_name):
+        """Return a SegmentEncoder bound to model_name."""
+        return SegmentEncoder(self, model_name)
+
+
+class SegmentEncoder:
+    """
+    An EmbeddingService bound to one model.
+
+    Its encode() accepts the arguments of SentenceTransformer.encode used by the
+    pipeline, so it can be passed wherever a model only encodes segments; any other
+    argument raises a TypeError rather than being silently ignored.
+    """
+
+    def __init__(self, service, model_name):
+        self.service = service
+        self.model_name = model_name
+
+    def encode(self, texts, batch_size=None, show_progress_bar=None, convert_to_numpy=True, convert_to_tensor=False,
+               normalize_embeddings=False, **kwargs):
+        if kwargs:
+            raise TypeError(f"SegmentEncoder.encode() does not support the arguments: {', '.join(sorted(kwargs))}")
+        options = dict(batch_size=batch_size, show_progress_bar=show_progress_bar, convert_to_numpy=convert_to_numpy,
+                       convert_to_tensor=convert_to_tensor, normalize_embeddings=normalize_embeddings)
+        if isinstance(texts, str):
+            return self.encode([texts], **options)[0]
+        # Embeddings are numpy arrays unless a tensor is requested, whatever convert_to_numpy says.
+        embeddings = self.service.encode(texts, self.model_name, batch_size=batch_size,
+                                         show_progress_bar=True if show_progress_bar is None else show_progress_bar,
+                                         normalize_embeddings=normalize_embeddings)
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(np.array(embeddings, dtype=np.float32))
+        return embeddings
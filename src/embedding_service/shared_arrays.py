@@ -0,0 +1,42 @@
+import os
+import mmap
+import numpy as np
+
+
+def _maps_whole_array(array):
+    """
+    Whether array is a memory map whose filename, offset and shape describe exactly its data.
+
+    NumPy copies .filename and .offset unchanged onto slices and views of a memmap, so only
+    the array created by np.memmap / np.load(mmap_mode=...) itself (whose base is the mmap)
+    can be reopened from them, and only if it is C-contiguous and lies within the file.
+    """
+    return (isinstance(array, np.memmap) and array.filename is not None and isinstance(array.base, mmap.mmap)
+            and array.flags.c_contiguous and array.offset + array.nbytes <= os.path.getsize(array.filename))
+
+
+def memmap_spec(array, directory, name):
+    """
+    Describe an array as a file that worker processes can memory-map.
+
+    Memory maps covering their whole data are shared as is; anything else (in-memory arrays,
+    and slices or views of memory maps) is written once to directory as <name>.npy.
+
+    Args:
+        array (np.ndarray): Array to share.
+        directory (str): Directory for the copy, if one is needed.
+        name (str): File name of the copy, without extension.
+
+    Returns:
+        dict: 'path', 'dtype', 'offset' and 'shape' of the array, see open_memmap_spec.
+    """
+    if not _maps_whole_array(array):
+        path = os.path.join(directory, f"{name}.npy")
+        np.save(path, np.ascontiguousarray(array))
+        array = np.load(path, mmap_mode='r')
+    return {'path': array.filename, 'dtype': str(array.dtype), 'offset': array.offset, 'shape': list(array.shape)}
+
+
+def open_memmap_spec(spec):
+    """Memory-map (read-only) an array described by memmap_spec."""
+    return np.memmap(spec['path'], dtype=spec['dtype'], mode='r', offset=spec['offset'], shape=tuple(spec['shape']))
@@ -1,26 +1,31 @@
 import os
+import json
 import numpy as np
-import pandas as pd
-from sentence_transformers import SentenceTransformer
 import logging
 from tqdm import tqdm
 
-def load_preprocessed_data(preprocessed_file, preprocess_if_missing=True):
+from embedding_service import EmbeddingService
+from table_io import read_table, iter_batches, count_rows, write_table
+
+DEFAULT_STREAM_CHUNK_SIZE = 10000
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+def load_preprocessed_data(preprocessed_file, preprocess_if_missing=True, columns=None):
     """
-    Load preprocessed data from a CSV file. If the file does not exist and
+    Load preprocessed data from a Parquet (or CSV) table. If the file does not exist and
     preprocess_if_missing is True, call the preprocessor module to generate the data.
     
     Args:
-        preprocessed_file (str): Path to the preprocessed CSV file.
+        preprocessed_file (str): Path to the preprocessed Parquet or CSV table.
         preprocess_if_missing (bool): Whether to run preprocessing if file is missing.
+        columns (list): Columns to load (default: all).
         
     Returns:
         pd.DataFrame: The preprocessed DataFrame.
     """
     if os.path.exists(preprocessed_file):
         logging.info("Loading preprocessed data from: %s", preprocessed_file)
-        df = pd.read_csv(preprocessed_file, on_bad_lines='skip', engine='python')
-        return df
+        return read_table(preprocessed_file, columns=columns)
     else:
         if preprocess_if_missing:
             logging.info("Preprocessed data not found. Running preprocessor module...")
@@ -36,13 +41,14 @@ def load_preprocessed_data(preprocessed_file, preprocess_if_missing=True):
             dummy_args = DummyArgs()
             df = preprocess_dataset(dummy_args)
             os.makedirs(os.path.dirname(preprocessed_file), exist_ok=True)
-            df.to_csv(preprocessed_file, index=False)
+            write_table(df, preprocessed_file)
             logging.info("Preprocessed data generated and saved to: %s", preprocessed_file)
             return df
         else:
             raise FileNotFoundError("Preprocessed data not found. Please run the preprocessor module first.")
 
-def compute_embeddings_for_segments(df, text_column='segments', model_name="all-MiniLM-L6-v2", batch_size=32, embeddings_file=None):
+def compute_embeddings_for_segments(df, text_column='segments', model_name="all-MiniLM-L6-v2", batch_size=32, embeddings_file=None,
+                                    cache_dir=None):
     """
     Compute or load embeddings for each text segment using SentenceTransformer.
     
@@ -52,22 +58,136 @@ def compute_embeddings_for_segments(df, text_column='segments', model_name="all-
         model_name (str): Model name for SentenceTransformer.
         batch_size (int): Batch size for encoding.
         embeddings_file (str): Optional file path to load/save embeddings.
+        cache_dir (str): Optional directory of the shared embedding cache. When given, only segments
+            missing from the cache (e.g. not already encoded by the contamination detector) are
+            encoded and embeddings_file is only written.
         
     Returns:
         np.ndarray: Array of embeddings.
     """
+    if cache_dir is not None:
+        service = EmbeddingService(cache_dir=cache_dir, batch_size=batch_size)
+        embeddings = service.encode(df[text_column].tolist(), model_name)
+        if embeddings_file is not None:
+            os.makedirs(os.path.dirname(embeddings_file), exist_ok=True)
+            np.save(embeddings_file, embeddings)
+            logging.info("Embeddings saved to: %s", embeddings_file)
+        return embeddings
     if embeddings_file is not None and os.path.exists(embeddings_file):
         logging.info("Loading precomputed embeddings from: %s", embeddings_file)
         embeddings = np.load(embeddings_file)
-        return embeddings
+        if len(embeddings) == len(df):
+            return embeddings
+        logging.warning("Precomputed embeddings have %d rows but the data has %d, recomputing.",
+                        len(embeddings), len(df))
+    logging.info("Computing embeddings using model: %s", model_name)
+    from sentence_transformers import SentenceTransformer
+    embedding_model = SentenceTransformer(model_name)
+    texts = df[text_column].tolist()
+    embeddings = embedding_model.encode(texts, batch_size=batch_size, show_progress_bar=True, convert_to_tensor=False)
+    embeddings = np.array(embeddings)
+    if embeddings_file is not None:
+        os.makedirs(os.path.dirname(embeddings_file), exist_ok=True)
+        np.save(embeddings_file, embeddings)
+        logging.info("Embeddings computed and saved to: %s", embeddings_file)
+    return embeddings
+
+
+def _read_progress(progress_file):
+    if os.path.exists(progress_file):
+        with open(progress_file, "r") as f:
+            return json.load(f)
+    return None
+
+
+def _write_progress(progress_file, progress):
+    tmp_path = progress_file + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_file)
+
+
+def _iter_segment_chunks(input_file, text_column, chunk_size):
+    """Read only the segments column, in chunks."""
+    for chunk in iter_batches(input_file, batch_size=chunk_size, columns=[text_column]):
+        yield chunk[text_column].astype(str).tolist()
+
+
+def _to_storage(embeddings, storage_dtype):
+    """
+    Convert a batch of float32 embeddings to the storage dtype.
+
+    int8 storage keeps the L2-normalized embedding scaled by 127; cosine similarity
+    is scale invariant, so the rows can be used as is by the neighbor search.
+    """
+    if storage_dtype == "int8":
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.maximum(norms, 1e-12)
+        return np.rint(normalized * 127).astype(np.int8)
+    return embeddings.astype(storage_dtype)
+
+
+def stream_embeddings_to_memmap(input_file, embeddings_file, text_column='segments', model_name="all-MiniLM-L6-v2",
+                                batch_size=32, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, storage_dtype="float32",
+                                cache_dir=None):
+    """
+    Compute embeddings out of core, appending them to a preallocated memory-mapped .npy file.
+
+    The input is read in chunks of chunk_size rows, each chunk is encoded in batches and
+    written to its rows of the memory map, and the number of finished rows is committed
+    to <embeddings_file>.progress.json. An interrupted run resumes after the last
+    committed chunk, as long as the input, model and storage dtype are unchanged.
+
+    Args:
+        input_file (str): Preprocessed Parquet or CSV table with a text column.
+        embeddings_file (str): Path of the .npy file to write.
+        text_column (str): Column name for segments (default: 'segments').
+        model_name (str): Model name for SentenceTransformer.
+        batch_size (int): Batch size for encoding.
+        chunk_size (int): Number of rows read, encoded and committed at a time.
+        storage_dtype (str): 'float32', 'float16' or 'int8' (normalized, scaled by 127).
+        cache_dir (str): Optional directory of the shared embedding cache, consulted chunk by chunk.
+
+    Returns:
+        np.memmap: Read-only (n_segments x dim) embeddings.
+    """
+    progress_file = embeddings_file + ".progress.json"
+    config = {"input_file": os.path.abspath(input_file), "input_mtime": os.path.getmtime(input_file),
+              "model_name": model_name, "storage_dtype": storage_dtype}
+    progress = _read_progress(progress_file)
+    if progress is not None and progress["config"] == config and os.path.exists(embeddings_file):
+        if progress["done"] == progress["rows"]:
+            logging.info("Loading streamed embeddings from: %s", embeddings_file)
+            return np.load(embeddings_file, mmap_mode='r')
+        logging.info("Resuming streamed embeddings at row %d of %d", progress["done"], progress["rows"])
     else:
-        logging.info("Computing embeddings using model: %s", model_name)
-        embedding_model = SentenceTransformer(model_name)
-        texts = df[text_column].tolist()
-        embeddings = embedding_model.encode(texts, batch_size=batch_size, show_progress_bar=True, convert_to_tensor=False)
-        embeddings = np.array(embeddings)
-        if embeddings_file is not None:
-            os.makedirs(os.path.dirname(embeddings_file), exist_ok=True)
-            np.save(embeddings_file, embeddings)
-            logging.info("Embeddings computed and saved to: %s", embeddings_file)
-        return embeddings
\ No newline at end of file
+        progress = None
+
+    service = EmbeddingService(cache_dir=cache_dir, batch_size=batch_size)
+    if progress is None:
+        rows = count_rows(input_file)
+        if rows is None:
+            rows = sum(len(texts) for texts in _iter_segment_chunks(input_file, text_column, chunk_size))
+        dim = service.model(model_name).get_sentence_embedding_dimension()
+        os.makedirs(os.path.dirname(embeddings_file) or ".", exist_ok=True)
+        np.lib.format.open_memmap(embeddings_file, mode='w+', dtype=storage_dtype, shape=(rows, dim)).flush()
+        progress = {"config": config, "rows": rows, "done": 0}
+        _write_progress(progress_file, progress)
+        logging.info("Streaming embeddings of %d segments to: %s (%s)", rows, embeddings_file, storage_dtype)
+
+    embeddings = np.load(embeddings_file, mmap_mode='r+')
+    start = 0
+    with tqdm(total=progress["rows"], initial=progress["done"], desc="Streaming embeddings") as bar:
+        for texts in _iter_segment_chunks(input_file, text_column, chunk_size):
+            stop = start + len(texts)
+            if stop > progress["done"]:
+                skip = progress["done"] - start
+                batch = service.encode(texts[skip:], model_name)
+                embeddings[progress["done"]:stop] = _to_storage(np.asarray(batch, dtype=np.float32), storage_dtype)
+                embeddings.flush()
+                progress["done"] = stop
+                _write_progress(progress_file, progress)
+                bar.update(len(texts) - skip)
+            start = stop
+    del embeddings
+    return np.load(embeddings_file, mmap_mode='r')
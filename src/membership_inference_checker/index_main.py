@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Membership Index CLI
+
+Maintains a persistent index of training corpus embeddings and checks external
+datasets against it:
+  add:   embed a preprocessed training shard (or reuse its precomputed embeddings)
+         and append it to the index.
+  query: embed an external dataset and save, for every segment, its top-k training
+         neighbours, their shards and rows, and a training membership flag.
+
+Usage:
+    python index_main.py add --index-dir DIR --input-file TRAIN.parquet [--embeddings-file TRAIN.npy]
+    python index_main.py query --index-dir DIR --input-file EXTERNAL.parquet --output-file FLAGS.parquet
+"""
+
+import os
+import argparse
+import logging
+import time
+import numpy as np
+
+from embeddings import load_preprocessed_data, compute_embeddings_for_segments
+from membership_index import MembershipIndex, DEFAULT_TOP_K
+
+from table_io import write_table
+
+
+def add_shard(args):
+    index = MembershipIndex(args.index_dir, args.embedding_model)
+    shard_name = args.shard_name or os.path.basename(args.input_file)
+    if index.has_shard(shard_name):
+        logging.info("Shard %s is already in the membership index.", shard_name)
+        return
+    if args.embeddings_file is not None and os.path.exists(args.embeddings_file):
+        # Reuse the output of compute_embeddings_for_segments without loading it whole.
+        embeddings = np.load(args.embeddings_file, mmap_mode="r")
+    else:
+        df = load_preprocessed_data(args.input_file, preprocess_if_missing=False, columns=['segments'])
+        df['segments'] = df['segments'].astype(str)
+        embeddings = compute_embeddings_for_segments(df, text_column='segments', model_name=args.embedding_model,
+                                                     batch_size=args.batch_size, embeddings_file=args.embeddings_file,
+                                                     cache_dir=args.embedding_cache_dir)
+    index.add(embeddings, shard_name)
+
+
+def query_dataset(args):
+    index = MembershipIndex(args.index_dir, args.embedding_model)
+    df = load_preprocessed_data(args.input_file, preprocess_if_missing=False, columns=['segments'])
+    df['segments'] = df['segments'].astype(str)
+    logging.info("Querying %d segments against a membership index of %d rows.", len(df), len(index))
+    embeddings = compute_embeddings_for_segments(df, text_column='segments', model_name=args.embedding_model,
+                                                 batch_size=args.batch_size, embeddings_file=None,
+                                                 cache_dir=args.embedding_cache_dir)
+    similarities, ids, member_flags = index.query(embeddings, k=args.k, high_sim_threshold=args.high_sim_threshold,
+                                                  memory_budget_mb=args.knn_memory_mb, num_workers=args.knn_workers)
+    shard_names, shard_rows = index.locate(ids[:, 0])
+
+    df['max_training_similarity'] = similarities[:, 0]
+    df['nearest_training_shard'] = shard_names
+    df['nearest_training_row'] = shard_rows
+    df['training_neighbor_ids'] = ids.tolist()
+    df['training_neighbor_similarities'] = np.round(similarities, 6).tolist()
+    df['training_member_flag'] = member_flags
+    return df
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Persistent training corpus membership index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("add", "Add a preprocessed training shard to the index."),
+                            ("query", "Check an external dataset against the index.")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--index-dir", type=str, default="data/membership_index",
+                         help="Directory of the membership index.")
+        sub.add_argument("--input-file", type=str, required=True,
+                         help="Preprocessed Parquet (or CSV) table with a 'segments' column.")
+        sub.add_argument("--embedding-model", type=str, default="all-MiniLM-L6-v2",
+                         help="SentenceTransformer model for computing embeddings.")
+        sub.add_argument("--batch-size", type=int, default=32,
+                         help="Batch size for embedding computation.")
+        sub.add_argument("--embedding-cache-dir", type=str, default="data/embedding_cache",
+                         help="Shared embedding cache; pass an empty string to disable it.")
+    add_parser, query_parser = subparsers.choices["add"], subparsers.choices["query"]
+    add_parser.add_argument("--shard-name", type=str, default=None,
+                            help="Unique name of the shard (default: the input file name).")
+    add_parser.add_argument("--embeddings-file", type=str, default=None,
+                            help="Precomputed embeddings of the shard (.npy); computed and saved here if missing.")
+    query_parser.add_argument("--output-file", type=str, default="data/training_membership_flags.parquet",
+                              help="Path to save the query results (.parquet, or .csv to export CSV).")
+    query_parser.add_argument("--k", type=int, default=DEFAULT_TOP_K,
+                              help=f"Number of training neighbours per segment (default: {DEFAULT_TOP_K}).")
+    query_parser.add_argument("--high-sim-threshold", type=float, default=0.95,
+                              help="Similarity at which a segment is flagged as a training member (default: 0.95).")
+    query_parser.add_argument("--knn-memory-mb", type=int, default=1024,
+                              help="Working-set budget of the nearest neighbor search in MiB (default: 1024).")
+    query_parser.add_argument("--knn-workers", type=int, default=1,
+                              help="Worker processes sharing the nearest neighbor search (default: 1).")
+    args = parser.parse_args()
+    args.embedding_cache_dir = args.embedding_cache_dir or None
+
+    start_time = time.perf_counter()
+    if args.command == "add":
+        add_shard(args)
+        logging.info("Index update completed in %.2f seconds", time.perf_counter() - start_time)
+        return
+
+    df_result = query_dataset(args)
+    logging.info("Membership index query completed in %.2f seconds", time.perf_counter() - start_time)
+    logging.info("Segments flagged as training members: %d", df_result['training_member_flag'].sum())
+    write_table(df_result, args.output_file)
+    logging.info("Membership index results saved to: %s", args.output_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import os
+import math
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import torch
+
+from embedding_service import memmap_spec, open_memmap_spec
+
+DEFAULT_MEMORY_BUDGET_MB = 1024
+# Bytes per entry of a query x corpus similarity block: the float32 scores plus
+# torch.topk workspace.
+_BYTES_PER_SCORE = 8
+
+
+def _normalized_block(embeddings, start, stop):
+    """Return rows [start, stop) of embeddings as an L2-normalized float32 tensor."""
+    block = torch.from_numpy(np.array(embeddings[start:stop], dtype=np.float32))
+    return torch.nn.functional.normalize(block, p=2, dim=1)
+
+
+def block_sizes(n_queries, n_corpus, dim, k, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """
+    Choose query and corpus block sizes whose working set fits in the memory budget.
+
+    The working set of one step is the similarity block, the normalized query and
+    corpus blocks and the running top-k of the query block.
+
+    Returns:
+        (query_block, corpus_block): Number of rows per query and corpus block.
+    """
+    budget = memory_budget_mb * 1024 * 1024
+    side = int(math.sqrt(budget / _BYTES_PER_SCORE))
+    query_block = max(1, min(n_queries, side))
+    # Running top-k of the query block: float32 sims and int64 ids, current and merged.
+    fixed = query_block * (dim * 4 + k * 24)
+    corpus_block = (budget - fixed) // (query_block * _BYTES_PER_SCORE + dim * 4)
+    corpus_block = max(k + 1, min(n_corpus, int(corpus_block)))
+    return query_block, corpus_block
+
+
+def _merge_topk(best_sims, best_ids, sims, ids, k):
+    """
+    Merge two candidate lists per row into the top k, ordered by similarity then id.
+
+    Breaking ties on the lower id makes the result independent of how the corpus was
+    split into blocks.
+    """
+    sims = np.concatenate([best_sims, sims], axis=1)
+    ids = np.concatenate([best_ids, ids], axis=1)
+    order = np.lexsort((ids, -sims), axis=1)[:, :k]
+    return np.take_along_axis(sims, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def _block_topk(scores, k, c_start):
+    """
+    Top k entries of every row of a similarity block, with ties broken on the lower id.
+
+    torch.topk picks arbitrarily among scores tied with the k-th value. One extra
+    candidate reveals such ties, and only those rows are resolved from the full block.
+    """
+    sims, idx = torch.topk(scores, min(k + 1, scores.shape[1]), dim=1)
+    sims, idx = sims.numpy(), idx.numpy() + c_start
+    if sims.shape[1] == k:
+        return sims, idx
+    for row in np.flatnonzero(sims[:, k] == sims[:, k - 1]):
+        row_scores = scores[row].numpy()
+        candidates = np.flatnonzero(row_scores >= sims[row, k - 1])
+        order = np.lexsort((candidates, -row_scores[candidates]))[:k]
+        sims[row, :k] = row_scores[candidates[order]]
+        idx[row, :k] = candidates[order] + c_start
+    return sims[:, :k], idx[:, :k]
+
+
+def query_block_topk(queries, corpus, k, q_start, q_stop, corpus_block, exclude_self=False, c_begin=0, c_end=None):
+    """
+    Exact top-k cosine neighbours in corpus rows [c_begin, c_end) of query rows [q_start, q_stop).
+
+    Args:
+        queries (np.ndarray): Query embeddings (may be a memmap).
+        corpus (np.ndarray): Corpus embeddings (may be a memmap).
+        k (int): Number of neighbours.
+        q_start, q_stop (int): Query rows to search.
+        corpus_block (int): Number of corpus rows per similarity block.
+        exclude_self (bool): Skip corpus row i for query row i (queries is corpus).
+        c_begin, c_end (int): Corpus rows to search (default: all). c_begin must be a
+            multiple of corpus_block so the blocks match a search of the whole corpus.
+
+    Returns:
+        (sims, ids): float32 and int64 arrays of shape (q_stop - q_start, k), best first.
+        Missing neighbours (corpus smaller than k) have similarity -inf and id -1.
+    """
+    c_end = len(corpus) if c_end is None else c_end
+    q = _normalized_block(queries, q_start, q_stop)
+    best_sims = np.full((q_stop - q_start, k), -np.inf, dtype=np.float32)
+    best_ids = np.full((q_stop - q_start, k), -1, dtype=np.int64)
+    for c_start in range(c_begin, c_end, corpus_block):
+        c_stop = min(c_start + corpus_block, c_end)
+        scores = q @ _normalized_block(corpus, c_start, c_stop).T
+        if exclude_self and c_start < q_stop and q_start < c_stop:
+            # Mask the diagonal entries where this block overlaps the query rows.
+            rows = torch.arange(max(q_start, c_start), min(q_stop, c_stop))
+            scores[rows - q_start, rows - c_start] = -np.inf
+        block_k = min(k, c_stop - c_start)
+        sims, ids = _block_topk(scores, block_k, c_start)
+        best_sims, best_ids = _merge_topk(best_sims, best_ids, sims, ids, k)
+    # Entries that only ever saw masked self scores are not real neighbours.
+    best_ids[best_sims == -np.inf] = -1
+    return best_sims, best_ids
+
+
+def topk_cosine(queries, corpus, k, exclude_self=False, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                num_threads=None, num_workers=1):
+    """
+    Exact top-k cosine similarity search with blocked matrix products.
+
+    Query and corpus rows are L2-normalized block by block, so memory-mapped inputs
+    are never loaded whole. Each query block is multiplied with every corpus block
+    (multithreaded by torch) and a partial top-k selection keeps only the best k
+    candidates per query, so the working set stays within memory_budget_mb.
+
+    Args:
+        queries (np.ndarray): Query embeddings (n_queries x dim).
+        corpus (np.ndarray): Corpus embeddings (n_corpus x dim).
+        k (int): Number of neighbours per query.
+        exclude_self (bool): Exclude the identical row when queries is corpus.
+        memory_budget_mb (int): Approximate working-set budget in MiB (per worker process).
+        num_threads (int): Torch intra-op threads (default: torch default, or 1 per
+            worker process when num_workers > 1).
+        num_workers (int): Number of worker processes (see sharded_topk_cosine).
+
+    Returns:
+        (sims, ids): float32 similarities and int64 corpus row ids, shape (n_queries, k),
+        sorted by decreasing similarity with ties broken on the lower id.
+    """
+    if num_workers > 1:
+        return sharded_topk_cosine(queries, corpus, k, exclude_self=exclude_self, memory_budget_mb=memory_budget_mb,
+                                   num_workers=num_workers, threads_per_worker=num_threads or 1)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    n_queries, n_corpus = len(queries), len(corpus)
+    sims = np.full((n_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((n_queries, k), -1, dtype=np.int64)
+    if n_queries == 0 or n_corpus == 0 or k == 0:
+        return sims, ids
+
+    query_block, corpus_block = block_sizes(n_queries, n_corpus, queries.shape[1], k, memory_budget_mb)
+    logging.info("Top-%d cosine search of %d queries in %d rows (blocks of %d x %d)", k, n_queries, n_corpus,
+                 query_block, corpus_block)
+    with torch.inference_mode():
+        for q_start in range(0, n_queries, query_block):
+            q_stop = min(q_start + query_block, n_queries)
+            sims[q_start:q_stop], ids[q_start:q_stop] = query_block_topk(
+                queries, corpus, k, q_start, q_stop, corpus_block, exclude_self=exclude_self)
+    return sims, ids
+
+
+_WORKER_ARRAYS = None
+
+
+def _init_knn_worker(query_spec, corpus_spec, threads):
+    """Memory-map the query and corpus embeddings once per worker process."""
+    global _WORKER_ARRAYS
+    torch.set_num_threads(threads)
+    queries = open_memmap_spec(query_spec)
+    corpus = queries if corpus_spec == query_spec else open_memmap_spec(corpus_spec)
+    _WORKER_ARRAYS = (queries, corpus)
+
+
+def _knn_task(k, q_start, q_stop, c_begin, c_end, corpus_block, exclude_self):
+    queries, corpus = _WORKER_ARRAYS
+    with torch.inference_mode():
+        return query_block_topk(queries, corpus, k, q_start, q_stop, corpus_block, exclude_self=exclude_self,
+                                c_begin=c_begin, c_end=c_end)
+
+
+def sharded_topk_cosine(queries, corpus, k, exclude_self=False, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                        num_workers=None, threads_per_worker=1):
+    """
+    Exact top-k cosine similarity search split across worker processes.
+
+    The query rows are split into the same blocks as topk_cosine uses, and the corpus
+    blocks into num_workers contiguous shards. Every query block x corpus shard pair
+    is a task; workers memory-map the embeddings (in-memory arrays are written once
+    to a temporary file) and return the shard's top k, which are merged into the
+    global top k. Block shapes and tie breaking match topk_cosine, so the results
+    are identical to a single-process search with the same memory budget.
+
+    Args:
+        queries (np.ndarray): Query embeddings (n_queries x dim).
+        corpus (np.ndarray): Corpus embeddings (n_corpus x dim).
+        k (int): Number of neighbours per query.
+        exclude_self (bool): Exclude the identical row when queries is corpus.
+        memory_budget_mb (int): Approximate working-set budget in MiB per worker.
+        num_workers (int): Number of worker processes (default: CPU count).
+        threads_per_worker (int): Torch intra-op threads per worker.
+
+    Returns:
+        (sims, ids): As returned by topk_cosine.
+    """
+    num_workers = num_workers or os.cpu_count()
+    n_queries, n_corpus = len(queries), len(corpus)
+    sims = np.full((n_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((n_queries, k), -1, dtype=np.int64)
+    if n_queries == 0 or n_corpus == 0 or k == 0:
+        return sims, ids
+
+    query_block, corpus_block = block_sizes(n_queries, n_corpus, queries.shape[1], k, memory_budget_mb)
+    n_corpus_blocks = -(-n_corpus // corpus_block)
+    shard_blocks = -(-n_corpus_blocks // num_workers)
+    shards = [(start * corpus_block, min((start + shard_blocks) * corpus_block, n_corpus))
+              for start in range(0, n_corpus_blocks, shard_blocks)]
+    logging.info("Top-%d cosine search of %d queries in %d rows with %d workers (blocks of %d x %d, %d corpus shards)",
+                 k, n_queries, n_corpus, num_workers, query_block, corpus_block, len(shards))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        query_spec = memmap_spec(queries, tmp_dir, "queries")
+        corpus_spec = query_spec if corpus is queries else memmap_spec(corpus, tmp_dir, "corpus")
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_knn_worker,
+                                 initargs=(query_spec, corpus_spec, threads_per_worker)) as pool:
+            futures = {}
+            for q_start in range(0, n_queries, query_block):
+                q_stop = min(q_start + query_block, n_queries)
+                for c_begin, c_end in shards:
+                    future = pool.submit(_knn_task, k, q_start, q_stop, c_begin, c_end, corpus_block, exclude_self)
+                    futures[future] = (q_start, q_stop)
+            for future in as_completed(futures):
+                q_start, q_stop = futures[future]
+                block_sims, block_ids = future.result()
+                sims[q_start:q_stop], ids[q_start:q_stop] = _merge_topk(
+                    sims[q_start:q_stop], ids[q_start:q_stop], block_sims, block_ids, k)
+    ids[sims == -np.inf] = -1
+    return sims, ids
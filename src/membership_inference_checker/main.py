@@ -7,8 +7,11 @@ This script performs neighborhood-based membership inference by:
   2. Computing or loading segment embeddings.
   3. Running a nearest neighbor search to compute maximum cosine similarity for each segment.
   4. Flagging segments as duplicates (if similarity ≥ high threshold) or outliers (if similarity < low threshold).
-  5. Saving the results to a CSV file.
-  6. Generating and saving visualizations to the directory data/plots/membership_module_plots.
+  5. Saving the results to a Parquet table (or CSV, by the output file extension).
+     With --stream-embeddings the segments are never loaded as a whole: the results are
+     written chunk by chunk next to the input segments.
+  6. Generating and saving visualizations to the directory data/plots/membership_module_plots
+     (in a background process, from precomputed bin counts by default).
 
 Usage:
     python main.py [--input-file PATH] [--embeddings-file PATH] [--output-file PATH] [other options...]
@@ -19,44 +22,70 @@ import argparse
 import logging
 import time
 import pandas as pd
-from tqdm import tqdm
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-# Set aesthetic style for plots
-sns.set(style="whitegrid", palette="viridis", font_scale=1.2)
-
-from embeddings import load_preprocessed_data, compute_embeddings_for_segments
+from embeddings import load_preprocessed_data, compute_embeddings_for_segments, stream_embeddings_to_memmap, STORAGE_DTYPES
 from neighborhood import flag_membership
+from plots import compute_plot_data, render_aggregated_plots, start_background_plotting
 
+from table_io import iter_batches, write_table, TableWriter
 
-def process_membership_inference(args):
-    # Load preprocessed data; if not available, run the preprocessor module
-    df = load_preprocessed_data(args.input_file, preprocess_if_missing=True)
-    logging.info("Loaded data with shape: %s", df.shape)
 
-    # Ensure 'segments' column is string type
-    df['segments'] = df['segments'].astype(str)
+def process_membership_inference(args):
+    """
+    Compute the membership flags of all segments.
 
+    Returns:
+        pd.DataFrame: One row per segment with the result columns; without --stream-embeddings
+        also the 'segments' column, with it only the results (see write_streamed_results).
+    """
     # Compute or load embeddings
-    embeddings = compute_embeddings_for_segments(
-        df,
-        text_column='segments',
-        model_name=args.embedding_model,
-        batch_size=args.batch_size,
-        embeddings_file=args.embeddings_file
-    )
+    if args.stream_embeddings:
+        # The segments are read chunk by chunk; only generate the input if it is missing.
+        if not os.path.exists(args.input_file):
+            load_preprocessed_data(args.input_file, preprocess_if_missing=True, columns=['segments'])
+        embeddings = stream_embeddings_to_memmap(
+            args.input_file,
+            args.embeddings_file,
+            text_column='segments',
+            model_name=args.embedding_model,
+            batch_size=args.batch_size,
+            chunk_size=args.stream_chunk_size,
+            storage_dtype=args.embedding_dtype,
+            cache_dir=args.embedding_cache_dir
+        )
+        df = pd.DataFrame(index=pd.RangeIndex(len(embeddings)))
+    else:
+        # Load preprocessed data; if not available, run the preprocessor module
+        # Only the segments are needed; the results are aligned with the input by row position.
+        df = load_preprocessed_data(args.input_file, preprocess_if_missing=True, columns=['segments'])
+        logging.info("Loaded data with shape: %s", df.shape)
+
+        # Ensure 'segments' column is string type
+        df['segments'] = df['segments'].astype(str)
+
+        embeddings = compute_embeddings_for_segments(
+            df,
+            text_column='segments',
+            model_name=args.embedding_model,
+            batch_size=args.batch_size,
+            embeddings_file=args.embeddings_file,
+            cache_dir=args.embedding_cache_dir
+        )
 
     # Compute neighborhood similarity and flag membership issues
     logging.info("Computing neighborhood similarity and flagging membership issues...")
-    duplicate_flags, outlier_flags, max_neighbor_sim = flag_membership(
+    duplicate_flags, outlier_flags, max_neighbor_sim, nearest_neighbor_ids = flag_membership(
         embeddings,
         high_sim_threshold=args.high_sim_threshold,
         low_sim_threshold=args.low_sim_threshold,
-        n_neighbors=args.n_neighbors
+        n_neighbors=args.n_neighbors,
+        memory_budget_mb=args.knn_memory_mb,
+        num_threads=args.knn_threads,
+        num_workers=args.knn_workers
     )
 
     df['max_neighbor_similarity'] = max_neighbor_sim
+    df['nearest_neighbor_id'] = nearest_neighbor_ids
     df['duplicate_flag'] = duplicate_flags
     df['outlier_flag'] = outlier_flags
     df['membership_inference_flag'] = duplicate_flags | outlier_flags
@@ -64,7 +93,40 @@ def process_membership_inference(args):
     return df
 
 
+def write_streamed_results(results, input_file, output_file, chunk_size):
+    """
+    Write the results next to the input segments, reading the segments chunk by chunk.
+
+    Args:
+        results (pd.DataFrame): Result columns, one row per input segment in input order.
+        input_file (str): Preprocessed Parquet or CSV table with a 'segments' column.
+        output_file (str): Output table (.parquet or .csv).
+        chunk_size (int): Rows read and written at a time.
+
+    Returns:
+        int: Number of rows written.
+    """
+    with TableWriter(output_file) as writer:
+        for chunk in iter_batches(input_file, batch_size=chunk_size, columns=['segments']):
+            # Chunks carry their global row positions as index, which is also the index of results.
+            part = results.loc[chunk.index]
+            part.insert(0, 'segments', chunk['segments'].astype(str))
+            writer.write(part)
+    if writer.rows != len(results):
+        raise ValueError(f"{input_file} changed while it was processed: {writer.rows} rows, expected {len(results)}")
+    return writer.rows
+
+
 def save_plots(df, high_sim_threshold, low_sim_threshold, output_plots_dir):
+    """Draw the detailed per-segment plots (one scatter point per segment); for small datasets."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Set aesthetic style for plots
+    sns.set(style="whitegrid", palette="viridis", font_scale=1.2)
+
     os.makedirs(output_plots_dir, exist_ok=True)
 
     # Plot 1: Distribution of Max Neighbor Cosine Similarity
@@ -123,25 +185,45 @@ def main():
     )
 
     parser = argparse.ArgumentParser(description="Membership Inference Checker Module")
-    parser.add_argument("--input-file", type=str, default="data/preprocessed_wikitext103_subset.csv",
-                        help="Path to preprocessed CSV file with a 'segments' column.")
+    parser.add_argument("--input-file", type=str, default="data/preprocessed_wikitext103_subset.parquet",
+                        help="Path to the preprocessed Parquet (or CSV) table with a 'segments' column.")
     parser.add_argument("--embeddings-file", type=str, default="data/segment_embeddings.npy",
                         help="Path to load/save segment embeddings.")
-    parser.add_argument("--output-file", type=str, default="data/membership_inference_flags.csv",
-                        help="Path to save the membership inference results CSV.")
+    parser.add_argument("--output-file", type=str, default="data/membership_inference_flags.parquet",
+                        help="Path to save the membership inference results (.parquet, or .csv to export CSV).")
+    parser.add_argument("--embedding-cache-dir", type=str, default="data/embedding_cache",
+                        help="Shared embedding cache, also filled by the contamination detector; only segments "
+                             "missing from it are encoded. Pass an empty string to disable it.")
+    parser.add_argument("--stream-embeddings", action="store_true", default=False,
+                        help="Compute embeddings out of core into a resumable memory-mapped --embeddings-file.")
+    parser.add_argument("--stream-chunk-size", type=int, default=10000,
+                        help="Rows read, encoded and committed at a time in streaming mode (default: 10000).")
+    parser.add_argument("--embedding-dtype", type=str, choices=STORAGE_DTYPES, default="float32",
+                        help="Storage dtype of streamed embeddings (default: float32).")
     parser.add_argument("--embedding-model", type=str, default="all-MiniLM-L6-v2",
                         help="SentenceTransformer model for computing embeddings.")
     parser.add_argument("--batch-size", type=int, default=32,
                         help="Batch size for embedding computation.")
     parser.add_argument("--n-neighbors", type=int, default=6,
                         help="Number of nearest neighbors to consider (default: 6).")
+    parser.add_argument("--knn-memory-mb", type=int, default=1024,
+                        help="Working-set budget of the blocked nearest neighbor search in MiB (default: 1024).")
+    parser.add_argument("--knn-threads", type=int, default=None,
+                        help="Threads used by the nearest neighbor search, per worker process when --knn-workers > 1 "
+                             "(default: all cores, or 1 per worker).")
+    parser.add_argument("--knn-workers", type=int, default=1,
+                        help="Worker processes sharing the nearest neighbor search (default: 1).")
     parser.add_argument("--high-sim-threshold", type=float, default=0.95,
                         help="Threshold for high similarity to flag duplicates (default: 0.95).")
     parser.add_argument("--low-sim-threshold", type=float, default=0.3,
                         help="Threshold for low similarity to flag outliers (default: 0.3).")
     parser.add_argument("--plots-dir", type=str, default="results/plots/membership_module_plots",
                         help="Directory to save membership inference plots.")
+    parser.add_argument("--plot-mode", type=str, choices=["aggregated", "detailed", "none"], default="aggregated",
+                        help="aggregated: histograms and density plots from bin counts, scales to millions of "
+                             "segments; detailed: per-segment scatter plot; none: no plots (default: aggregated).")
     args = parser.parse_args()
+    args.embedding_cache_dir = args.embedding_cache_dir or None
 
     logging.info("Starting Membership Inference Checker Module...")
     start_time = time.perf_counter()
@@ -151,12 +233,25 @@ def main():
     logging.info("Membership inference processing completed in %.2f seconds", end_time - start_time)
     logging.info("Total flagged segments: %d", df_result['membership_inference_flag'].sum())
 
-    os.makedirs(os.path.dirname(args.output_file), exist_ok=True)
-    df_result.to_csv(args.output_file, index=False)
+    # Save plots to the specified directory in a background process while the results are written
+    plotting = None
+    if args.plot_mode == "aggregated":
+        plotting = start_background_plotting(render_aggregated_plots, compute_plot_data(df_result),
+                                             args.high_sim_threshold, args.low_sim_threshold, args.plots_dir)
+    elif args.plot_mode == "detailed":
+        plotting = start_background_plotting(save_plots, df_result, args.high_sim_threshold,
+                                             args.low_sim_threshold, args.plots_dir)
+
+    if args.stream_embeddings:
+        write_streamed_results(df_result, args.input_file, args.output_file, args.stream_chunk_size)
+    else:
+        write_table(df_result, args.output_file)
     logging.info("Membership inference results saved to: %s", args.output_file)
 
-    # Save plots to the specified directory
-    save_plots(df_result, args.high_sim_threshold, args.low_sim_threshold, args.plots_dir)
+    if plotting is not None:
+        plotting.join()
+        if plotting.exitcode != 0:
+            logging.error("Plotting failed with exit code %d", plotting.exitcode)
 
 
 if __name__ == "__main__":
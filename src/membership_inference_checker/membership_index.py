@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+import numpy as np
+
+from knn import topk_cosine, DEFAULT_MEMORY_BUDGET_MB
+
+EMBEDDINGS_FILENAME = "embeddings.f32"
+META_FILENAME = "index.json"
+DEFAULT_TOP_K = 5
+
+
+class MembershipIndex:
+    """
+    Persistent index of training corpus embeddings for cross-dataset membership queries.
+
+    The index lives in index_dir and consists of:
+      - embeddings.f32: a raw float32 matrix of L2-normalized training embeddings.
+      - index.json: model name, embedding dimension, number of committed rows and the
+        training shards added so far, with the row range each one occupies.
+
+    Training shards are appended with add(); rows of a shard are committed once
+    index.json lists it, so an interrupted add leaves the index unchanged. Queries
+    run the exact blocked top-k search directly against the memory-mapped rows.
+    """
+
+    def __init__(self, index_dir, model_name):
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.embeddings_path = os.path.join(index_dir, EMBEDDINGS_FILENAME)
+        self.meta_path = os.path.join(index_dir, META_FILENAME)
+        self.rows = 0
+        self.dim = None
+        self.shards = []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["model_name"] != model_name:
+                raise ValueError(f"Membership index at {index_dir} was built with model {meta['model_name']}.")
+            self.rows = meta["rows"]
+            self.dim = meta["dim"]
+            self.shards = meta["shards"]
+
+    def __len__(self):
+        return self.rows
+
+    def has_shard(self, shard_name):
+        return any(shard["name"] == shard_name for shard in self.shards)
+
+    def add(self, embeddings, shard_name, chunk_size=100000):
+        """
+        Append the embeddings of a training shard.
+
+        Args:
+            embeddings (np.ndarray): (n x dim) embeddings of the shard (may be a memmap).
+            shard_name (str): Unique name of the shard, e.g. its file name.
+            chunk_size (int): Number of rows normalized and written at a time.
+
+        Returns:
+            int: Number of rows added (0 if the shard is already in the index).
+        """
+        if self.has_shard(shard_name):
+            logging.info("Shard %s is already in the membership index, skipping it.", shard_name)
+            return 0
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Shard {shard_name} has dimension {embeddings.shape[1]}, the index has {self.dim}.")
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.embeddings_path, "ab") as f:
+            # Drop rows written by an interrupted add that were never committed.
+            f.truncate(self.rows * self.dim * 4)
+            for start in range(0, len(embeddings), chunk_size):
+                chunk = np.array(embeddings[start:start + chunk_size], dtype=np.float32)
+                chunk /= np.maximum(np.linalg.norm(chunk, axis=1, keepdims=True), 1e-12)
+                f.write(chunk.tobytes())
+        self.shards.append({"name": shard_name, "start": self.rows, "rows": len(embeddings)})
+        self.rows += len(embeddings)
+        self._write_meta()
+        logging.info("Added %d rows of shard %s to the membership index (%d rows in total).", len(embeddings),
+                     shard_name, self.rows)
+        return len(embeddings)
+
+    def _write_meta(self):
+        meta = {"model_name": self.model_name, "dim": self.dim, "dtype": "float32", "rows": self.rows,
+                "shards": self.shards}
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self.meta_path)
+
+    def open(self):
+        """Open the committed embeddings as a read-only (rows x dim) float32 memory map."""
+        if self.rows == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    def locate(self, ids):
+        """
+        Map index row ids to the training shard and row within it.
+
+        Returns:
+            (shard_names, shard_rows): Object array of shard names (None for id -1) and
+            int64 rows within the shard (-1 for id -1).
+        """
+        ids = np.asarray(ids)
+        starts = np.array([shard["start"] for shard in self.shards], dtype=np.int64)
+        names = np.array([shard["name"] for shard in self.shards] + [None], dtype=object)
+        shard_idx = np.searchsorted(starts, ids, side="right") - 1
+        valid = ids >= 0
+        shard_idx[~valid] = len(self.shards)
+        shard_rows = np.where(valid, ids - starts[np.minimum(shard_idx, len(starts) - 1)], -1)
+        return names[shard_idx], shard_rows
+
+    def query(self, query_embeddings, k=DEFAULT_TOP_K, high_sim_threshold=0.95,
+              memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, num_workers=1):
+        """
+        Find the k most similar training rows of every query embedding.
+
+        Args:
+            query_embeddings (np.ndarray): (n_queries x dim) embeddings of the external dataset.
+            k (int): Number of neighbours per query.
+            high_sim_threshold (float): Similarity at which a query counts as a training member.
+            memory_budget_mb (int): Working-set budget of the blocked search in MiB.
+            num_workers (int): Worker processes sharing the search.
+
+        Returns:
+            (similarities, ids, member_flags): (n_queries x k) similarities and index row
+            ids, best first, and whether the best similarity reaches high_sim_threshold.
+        """
+        if self.rows == 0:
+            raise ValueError(f"Membership index at {self.index_dir} is empty.")
+        similarities, ids = topk_cosine(query_embeddings, self.open(), min(k, self.rows),
+                                        memory_budget_mb=memory_budget_mb, num_workers=num_workers)
+        return similarities, ids, similarities[:, 0] >= high_sim_threshold
@@ -1,47 +1,57 @@
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
 import logging
 
-def compute_neighborhood_similarity(embeddings, n_neighbors=6):
+from knn import topk_cosine, DEFAULT_MEMORY_BUDGET_MB
+
+def compute_neighborhood_similarity(embeddings, n_neighbors=6, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                                    num_threads=None, num_workers=1):
     """
     Compute the cosine similarity for each embedding with its nearest neighbors.
     
     Args:
-        embeddings (np.ndarray): Array of embeddings.
-        n_neighbors (int): Number of neighbors (default: 6).
+        embeddings (np.ndarray): Array of embeddings (may be a memmap).
+        n_neighbors (int): Number of neighbors, counting the segment itself (default: 6).
+        memory_budget_mb (int): Working-set budget of the blocked search in MiB.
+        num_threads (int): Threads used by the blocked search (default: torch default).
+        num_workers (int): Worker processes sharing the search (default: 1).
         
     Returns:
-        np.ndarray: Array of maximum neighbor similarity for each segment.
+        (similarities, neighbor_ids): Arrays of shape (n_segments, n_neighbors - 1) with the
+        similarities and row ids of each segment's nearest neighbors (excluding itself),
+        most similar first. Missing neighbors have similarity NaN and id -1.
     """
-    logging.info("Fitting NearestNeighbors model with %d neighbors.", n_neighbors)
-    nn_model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine')
-    nn_model.fit(embeddings)
-    distances, _ = nn_model.kneighbors(embeddings)
-    # Convert cosine distance to similarity
-    similarities = 1 - distances
-    max_neighbor_sim = []
-    for sim in similarities:
-        # Exclude self (first neighbor with similarity 1)
-        max_sim = np.max(sim[1:]) if len(sim) > 1 else sim[0]
-        max_neighbor_sim.append(max_sim)
-    return np.array(max_neighbor_sim)
+    k = max(n_neighbors - 1, 1)
+    logging.info("Searching the %d nearest neighbors of %d segments.", k, len(embeddings))
+    similarities, neighbor_ids = topk_cosine(embeddings, embeddings, k, exclude_self=True,
+                                             memory_budget_mb=memory_budget_mb, num_threads=num_threads,
+                                             num_workers=num_workers)
+    similarities[neighbor_ids < 0] = np.nan
+    return similarities, neighbor_ids
 
-def flag_membership(embeddings, high_sim_threshold=0.95, low_sim_threshold=0.3, n_neighbors=6):
+def flag_membership(embeddings, high_sim_threshold=0.95, low_sim_threshold=0.3, n_neighbors=6,
+                    memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, num_threads=None, num_workers=1):
     """
     Flag segments based on neighborhood similarity. A segment is flagged as a duplicate
     if its maximum similarity (excluding self) is >= high_sim_threshold, and flagged as an outlier
     if its maximum similarity is below low_sim_threshold.
     
     Args:
-        embeddings (np.ndarray): Array of embeddings.
+        embeddings (np.ndarray): Array of embeddings (may be a memmap).
         high_sim_threshold (float): Threshold for duplicate flag (default: 0.95).
         low_sim_threshold (float): Threshold for outlier flag (default: 0.3).
         n_neighbors (int): Number of nearest neighbors (default: 6).
+        memory_budget_mb (int): Working-set budget of the blocked search in MiB.
+        num_threads (int): Threads used by the blocked search (default: torch default).
+        num_workers (int): Worker processes sharing the search (default: 1).
         
     Returns:
-        tuple: (duplicate_flags, outlier_flags, max_neighbor_sim)
+        tuple: (duplicate_flags, outlier_flags, max_neighbor_sim, nearest_neighbor_ids)
     """
-    max_neighbor_sim = compute_neighborhood_similarity(embeddings, n_neighbors=n_neighbors)
+    similarities, neighbor_ids = compute_neighborhood_similarity(embeddings, n_neighbors=n_neighbors,
+                                                                 memory_budget_mb=memory_budget_mb,
+                                                                 num_threads=num_threads,
+                                                                 num_workers=num_workers)
+    max_neighbor_sim = similarities[:, 0]
     duplicate_flags = max_neighbor_sim >= high_sim_threshold
     outlier_flags = max_neighbor_sim < low_sim_threshold
-    return duplicate_flags, outlier_flags, max_neighbor_sim
\ No newline at end of file
+    return duplicate_flags, outlier_flags, max_neighbor_sim, neighbor_ids[:, 0]
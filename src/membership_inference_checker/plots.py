@@ -0,0 +1,139 @@
+import os
+import logging
+import multiprocessing
+import numpy as np
+
+DEFAULT_HIST_BINS = 50
+DEFAULT_INDEX_BINS = 200
+DEFAULT_SIM_BINS = 100
+
+
+def compute_plot_data(df, hist_bins=DEFAULT_HIST_BINS, index_bins=DEFAULT_INDEX_BINS, sim_bins=DEFAULT_SIM_BINS):
+    """
+    Reduce the membership results to the bin counts the aggregated plots are drawn from.
+
+    The result is a small dict of arrays whose size does not depend on the number of
+    segments, so it is cheap to send to a plotting process.
+
+    Args:
+        df (pd.DataFrame): Membership results with 'max_neighbor_similarity' and the flag columns.
+        hist_bins (int): Number of bins of the similarity histogram.
+        index_bins (int): Number of segment index bins of the density plot.
+        sim_bins (int): Number of similarity bins of the density plot.
+
+    Returns:
+        dict: Histogram counts and edges, 2D density counts of all and of flagged
+        segments over (segment index, similarity), and the flag category counts.
+    """
+    sims = df['max_neighbor_similarity'].to_numpy(dtype=np.float64)
+    flagged = df['membership_inference_flag'].to_numpy(dtype=bool)
+    positions = np.arange(len(df))
+    valid = np.isfinite(sims)
+    # Similarities start at 0 unless some are negative, which is rare for sentence embeddings.
+    sim_range = (max(-1.0, np.floor(np.min(sims[valid], initial=0.0) * 10) / 10), 1.0)
+
+    hist_counts, hist_edges = np.histogram(sims[valid], bins=hist_bins, range=sim_range)
+    density_range = [(0, max(len(df), 1)), sim_range]
+    density, index_edges, sim_edges = np.histogram2d(positions[valid], sims[valid], bins=(index_bins, sim_bins),
+                                                     range=density_range)
+    flagged_density, _, _ = np.histogram2d(positions[valid & flagged], sims[valid & flagged],
+                                           bins=(index_bins, sim_bins), range=density_range)
+    return {
+        "hist_counts": hist_counts,
+        "hist_edges": hist_edges,
+        "density": density,
+        "flagged_density": flagged_density,
+        "index_edges": index_edges,
+        "sim_edges": sim_edges,
+        "flag_counts": {
+            "Duplicates": int(df['duplicate_flag'].sum()),
+            "Outliers": int(df['outlier_flag'].sum()),
+            "Non-Flagged": int(len(df) - flagged.sum()),
+        },
+    }
+
+
+def _smoothed(counts, width=2.0):
+    """Gaussian-smoothed bin counts, drawn in place of a KDE over the raw values."""
+    offsets = np.arange(-3 * int(np.ceil(width)), 3 * int(np.ceil(width)) + 1)
+    kernel = np.exp(-0.5 * (offsets / width) ** 2)
+    return np.convolve(counts, kernel / kernel.sum(), mode="same")
+
+
+def render_aggregated_plots(plot_data, high_sim_threshold, low_sim_threshold, output_plots_dir):
+    """Draw the membership plots from the bin counts returned by compute_plot_data."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
+    os.makedirs(output_plots_dir, exist_ok=True)
+
+    # Plot 1: Distribution of Max Neighbor Cosine Similarity
+    counts, edges = plot_data["hist_counts"], plot_data["hist_edges"]
+    centers = (edges[:-1] + edges[1:]) / 2
+    plt.figure(figsize=(10, 6))
+    plt.stairs(counts, edges, fill=True, color="steelblue", alpha=0.6)
+    plt.plot(centers, _smoothed(counts), color="steelblue")
+    plt.axvline(x=high_sim_threshold, color='red', linestyle='--', label=f'High Threshold ({high_sim_threshold})')
+    plt.axvline(x=low_sim_threshold, color='orange', linestyle='--', label=f'Low Threshold ({low_sim_threshold})')
+    plt.xlabel("Max Neighbor Cosine Similarity")
+    plt.ylabel("Count")
+    plt.title("Distribution of Max Neighbor Cosine Similarity")
+    plt.legend()
+    plot1_path = os.path.join(output_plots_dir, "max_neighbor_similarity_hist.png")
+    plt.tight_layout()
+    plt.savefig(plot1_path)
+    plt.close()
+    logging.info("Saved plot: %s", plot1_path)
+
+    # Plot 2: Bar Plot of Flagged Categories
+    flag_counts = plot_data["flag_counts"]
+    plt.figure(figsize=(8, 6))
+    plt.bar(list(flag_counts.keys()), list(flag_counts.values()), color=plt.cm.magma([0.2, 0.5, 0.8]))
+    plt.title("Count of Segments by Flag Category")
+    plt.xlabel("Flag Category")
+    plt.ylabel("Number of Segments")
+    plt.tight_layout()
+    plot2_path = os.path.join(output_plots_dir, "flagged_categories_bar.png")
+    plt.savefig(plot2_path)
+    plt.close()
+    logging.info("Saved plot: %s", plot2_path)
+
+    # Plot 3: Density of Max Neighbor Similarity Across Segments (all and flagged segments)
+    extent = [plot_data["index_edges"][0], plot_data["index_edges"][-1],
+              plot_data["sim_edges"][0], plot_data["sim_edges"][-1]]
+    fig, axes = plt.subplots(1, 2, figsize=(16, 6), sharey=True)
+    for ax, key, title in ((axes[0], "density", "All Segments"), (axes[1], "flagged_density", "Flagged Segments")):
+        density = plot_data[key].T
+        image = ax.imshow(np.ma.masked_equal(density, 0), origin="lower", aspect="auto", extent=extent,
+                          cmap="viridis", norm=LogNorm(vmin=1, vmax=max(density.max(), 1)))
+        ax.axhline(y=high_sim_threshold, color='red', linestyle='--')
+        ax.axhline(y=low_sim_threshold, color='orange', linestyle='--')
+        ax.set_xlabel("Segment Index")
+        ax.set_title(title)
+        fig.colorbar(image, ax=ax, label="Segments per bin")
+    axes[0].set_ylabel("Max Neighbor Cosine Similarity")
+    fig.suptitle("Variation of Max Neighbor Similarity Across Segments")
+    fig.tight_layout()
+    plot3_path = os.path.join(output_plots_dir, "neighbor_similarity_density.png")
+    fig.savefig(plot3_path)
+    plt.close(fig)
+    logging.info("Saved plot: %s", plot3_path)
+
+
+def _run_plotting(target, args):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    target(*args)
+
+
+def start_background_plotting(target, *args):
+    """
+    Run a plotting function in a separate process so it does not block the caller.
+
+    Returns:
+        multiprocessing.Process: The started process; join() it before exiting.
+    """
+    process = multiprocessing.Process(target=_run_plotting, args=(target, args), daemon=False)
+    process.start()
+    return process
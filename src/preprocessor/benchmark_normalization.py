@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Text Normalization Benchmark
+
+Measures the throughput (rows/s) of text normalization before and after batching:
+  - baseline: the original row-by-row normalize_text through df.apply.
+  - batch:    normalize_texts in the current process.
+  - pool:     normalize_texts across --num-workers processes.
+and checks that every variant returns exactly the baseline's output.
+
+Rows are read from the 'text' column of a raw CSV (--input-file) or generated synthetically.
+
+Usage:
+    python benchmark_normalization.py [--input-file FILE] [--num-rows N] [--num-workers N] [--remove-stopwords]
+"""
+
+import argparse
+import random
+import re
+import time
+import unicodedata
+import pandas as pd
+from nltk.corpus import stopwords
+
+from cleaning import normalize_texts
+
+
+def baseline_normalize_text(text, remove_stopwords=False, language="english"):
+    """The row-by-row normalize_text before batching, kept as the reference implementation."""
+    text = re.sub(r'<.*?>', ' ', text)
+    text = unicodedata.normalize('NFC', text)
+    text = text.lower()
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\x00-\x7F]+', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    if remove_stopwords:
+        stop_words = set(stopwords.words(language))
+        words = text.split()
+        words = [word for word in words if word not in stop_words]
+        text = " ".join(words)
+
+    return text
+
+
+def make_synthetic_texts(num_rows, rng):
+    """Generate wiki-like rows mixing markup, accents, non-Latin scripts and irregular whitespace."""
+    vocab = ("The of and to in a is that for it as was with be by on not he this are or his from at which "
+             "café naïve Ångström Zürich <b>bold</b> <ref>cite</ref> Москва 東京 x̲y é İstanbul "
+             "@-@ = = Section = = \t \n  ﬁne ½").split(" ")
+    return [" ".join(rng.choice(vocab) for _ in range(rng.randint(5, 120))) for _ in range(num_rows)]
+
+
+def measure(name, func, num_rows):
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    print(f"{name:<10} {seconds:8.2f} s {num_rows / seconds:12.0f} rows/s")
+    return result, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text Normalization Benchmark")
+    parser.add_argument("--input-file", type=str, default=None,
+                        help="Raw CSV file with a 'text' column (default: synthetic rows)")
+    parser.add_argument("--num-rows", type=int, default=100000,
+                        help="Number of rows to normalize (default: 100000)")
+    parser.add_argument("--num-workers", type=int, default=4,
+                        help="Number of processes of the pool variant (default: 4)")
+    parser.add_argument("--chunk-size", type=int, default=5000,
+                        help="Rows per pool task (default: 5000)")
+    parser.add_argument("--remove-stopwords", action="store_true", default=False,
+                        help="Also remove stopwords")
+    args = parser.parse_args()
+
+    if args.input_file is not None:
+        texts = pd.read_csv(args.input_file, nrows=args.num_rows)['text'].astype(str).tolist()
+    else:
+        texts = make_synthetic_texts(args.num_rows, random.Random(0))
+    df = pd.DataFrame({'text': texts})
+    print(f"Normalizing {len(texts)} rows (remove_stopwords={args.remove_stopwords})")
+
+    baseline, baseline_seconds = measure(
+        "baseline", lambda: df['text'].apply(lambda x: baseline_normalize_text(x, args.remove_stopwords)).tolist(),
+        len(texts))
+    variants = {
+        "batch": lambda: normalize_texts(texts, remove_stopwords=args.remove_stopwords),
+        "pool": lambda: normalize_texts(texts, remove_stopwords=args.remove_stopwords, num_workers=args.num_workers,
+                                        chunk_size=args.chunk_size),
+    }
+    for name, func in variants.items():
+        result, seconds = measure(name, func, len(texts))
+        mismatches = sum(a != b for a, b in zip(result, baseline))
+        print(f"{'':<10} speedup {baseline_seconds / seconds:.1f}x, rows differing from baseline: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,30 @@
 import re
 import unicodedata
-import nltk
-from nltk.corpus import stopwords
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+DEFAULT_CHUNK_SIZE = 5000
+HTML_TAG_RE = re.compile(r'<.*?>')
+NON_ASCII_RE = re.compile(r'[^\x00-\x7F]+')
+WHITESPACE_RE = re.compile(r'\s+')
 
-# Ensure required NLTK data is available.
-nltk.download('stopwords', quiet=True)
+
+def _replace_non_ascii_run(match):
+    """
+    Accent stripping and non-UTF removal for one run of non-ASCII characters: combining
+    characters are deleted and whatever remains of the run becomes a single space.
+    """
+    return '' if all(unicodedata.combining(c) for c in match.group()) else ' '
+
+
+@lru_cache(maxsize=None)
+def _stop_words(language):
+    """Stopwords of language, read from the local NLTK data cache (never downloaded at run time)."""
+    from nltk.corpus import stopwords
+    try:
+        return frozenset(stopwords.words(language))
+    except LookupError as e:
+        raise LookupError("NLTK stopwords are not in the local NLTK data cache. "
+                          "Install them once with: python -m nltk.downloader stopwords") from e
 
 
 def normalize_text(text, remove_stopwords=False, language="english"):
@@ -25,20 +45,48 @@ def normalize_text(text, remove_stopwords=False, language="english"):
         str: Cleaned text.
     """
     # Remove HTML tags
-    text = re.sub(r'<.*?>', ' ', text)
-    # Normalize Unicode
-    text = unicodedata.normalize('NFC', text)
-    # Lowercase conversion and accent stripping
-    text = text.lower()
-    text = ''.join(c for c in text if not unicodedata.combining(c))
-    # Remove non-UTF characters and extra whitespace
-    text = re.sub(r'[^\x00-\x7F]+', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
+    if '<' in text:
+        text = HTML_TAG_RE.sub(' ', text)
+    if text.isascii():
+        # Unicode normalization, accent stripping and non-UTF removal leave ASCII text unchanged.
+        text = text.lower()
+    else:
+        # Normalize Unicode
+        text = unicodedata.normalize('NFC', text)
+        # Lowercase conversion, accent stripping and removal of non-UTF characters
+        text = NON_ASCII_RE.sub(_replace_non_ascii_run, text.lower())
+    # Remove extra whitespace
+    text = WHITESPACE_RE.sub(' ', text).strip()
 
     if remove_stopwords:
-        stop_words = set(stopwords.words(language))
-        words = text.split()
-        words = [word for word in words if word not in stop_words]
-        text = " ".join(words)
+        stop_words = _stop_words(language)
+        text = " ".join(word for word in text.split() if word not in stop_words)
+
+    return text
+
+
+def _normalize_chunk(texts, remove_stopwords, language):
+    return [normalize_text(text, remove_stopwords=remove_stopwords, language=language) for text in texts]
+
 
-    return text
\ No newline at end of file
+def normalize_texts(texts, remove_stopwords=False, language="english", num_workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Normalize many texts, optionally across worker processes.
+
+    Args:
+        texts (list): Input texts.
+        remove_stopwords (bool): Whether to remove stopwords (default: False).
+        language (str): Language for stopwords (default: "english").
+        num_workers (int): Number of worker processes (1 runs in the current process).
+        chunk_size (int): Number of texts per task.
+
+    Returns:
+        list: Cleaned texts, identical to normalize_text applied to every text.
+    """
+    texts = list(texts)
+    if num_workers <= 1 or len(texts) <= chunk_size:
+        return _normalize_chunk(texts, remove_stopwords, language)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        results = pool.map(_normalize_chunk, chunks, [remove_stopwords] * len(chunks), [language] * len(chunks))
+        return [text for chunk in results for text in chunk]
@@ -1,7 +1,21 @@
 # Text contamination functions
+import re
 import random
+from concurrent.futures import ProcessPoolExecutor
 
-from datasets import load_dataset
+from seeding import row_rng
+
+DEFAULT_NOISE_DATASET = "sedthh/gutenberg_english"
+DEFAULT_NOISE_COLUMN = "TEXT"
+DEFAULT_NUM_NOISE_DOCUMENTS = 100
+DEFAULT_POOL_SIZE = 10000
+DEFAULT_NOISE_LEVEL = 0.05
+DEFAULT_CHUNK_SIZE = 5000
+OPERATIONS = ("swap_words", "char_noise", "insert_irrelevant")
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+MIN_SENTENCE_WORDS = 5
+MAX_SENTENCE_WORDS = 60
 
 
 def swap_words(text):
@@ -32,13 +46,222 @@ def insert_irrelevant_text(text, gutenberg_sentences):
     return ' '.join(words[:insert_pos] + irrelevant.split() + words[insert_pos:])
 
 def contaminate_text(text):
-
+    """Contaminate a single text; prefer ContaminationSimulator, which loads the noise corpus only once."""
     # load the dataset
     # Load irrelevant text dataset
+    from datasets import load_dataset
     gutenberg_ds = load_dataset("sedthh/gutenberg_english", split="train")
     gutenberg_sentences = gutenberg_ds['TEXT']
 
     text = swap_words(text)
     text = add_char_noise(text)
     text = insert_irrelevant_text(text, gutenberg_sentences)
-    return text
\ No newline at end of file
+    return text
+
+
+def _noisy_word(word, rng):
+    """
+    Apply one random character edit (insert, delete, substitute or swap) to a non-empty word.
+
+    The result can equal the word: a delete on a one-character word and a swap at the
+    last position are no-ops, as are a substitution or swap with the same character.
+    """
+    i = rng.randrange(len(word))
+    op = rng.randrange(4)
+    if op == 0:
+        return word[:i] + rng.choice(LETTERS) + word[i:]
+    if op == 1:
+        return word[:i] + word[i + 1:] if len(word) > 1 else word
+    if op == 2:
+        return word[:i] + rng.choice(LETTERS) + word[i + 1:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:] if i < len(word) - 1 else word
+
+
+def _contaminate_rows(texts, row_ids, sentence_pool, seed, operations, noise_level):
+    """
+    Contaminate texts, each with its own RNG from row_rng(seed, row id), so the result of
+    a row does not depend on how rows are batched or distributed over workers.
+
+    Only operations that changed the text are recorded: words_swapped is set when two
+    different words were exchanged and char_edits counts the words an edit changed.
+
+    Returns:
+        list: (text, words_swapped, char_edits, injected_sentence) per row; injected_sentence
+        is the index of the inserted pool sentence or -1.
+    """
+    results = []
+    for text, row_id in zip(texts, row_ids):
+        rng = row_rng(seed, row_id)
+        words = text.split()
+        swapped, char_edits, injected = False, 0, -1
+        if "swap_words" in operations and len(words) >= 2:
+            i, j = rng.sample(range(len(words)), 2)
+            words[i], words[j] = words[j], words[i]
+            swapped = words[i] != words[j]
+        if "char_noise" in operations:
+            for w, word in enumerate(words):
+                if rng.random() < noise_level and word:
+                    words[w] = _noisy_word(word, rng)
+                    char_edits += words[w] != word
+        if "insert_irrelevant" in operations and sentence_pool:
+            injected = rng.randrange(len(sentence_pool))
+            pos = rng.randint(0, len(words))
+            words[pos:pos] = sentence_pool[injected]
+        results.append((' '.join(words), swapped, char_edits, injected))
+    return results
+
+
+_worker_pool = None
+
+
+def _init_simulator_worker(sentence_pool):
+    global _worker_pool
+    _worker_pool = sentence_pool
+
+
+def _contaminate_worker_chunk(texts, row_ids, seed, operations, noise_level):
+    return _contaminate_rows(texts, row_ids, _worker_pool, seed, operations, noise_level)
+
+
+class ContaminationSimulator:
+    """
+    Seeded contamination of text rows with word swaps, character noise and irrelevant
+    sentences from a noise corpus (Project Gutenberg by default).
+
+    The noise corpus is loaded and sampled once, into a pool of sentences that are split
+    into words up front, and rows are perturbed in chunks, optionally across worker
+    processes. Every row has its own RNG derived from the seed and its row id, so the
+    result is reproducible and independent of the number of workers. The operations
+    applied to each row are returned as ground-truth columns.
+    """
+
+    def __init__(self, noise_texts=None, noise_dataset=DEFAULT_NOISE_DATASET, noise_column=DEFAULT_NOISE_COLUMN,
+                 num_noise_documents=DEFAULT_NUM_NOISE_DOCUMENTS, pool_size=DEFAULT_POOL_SIZE,
+                 operations=OPERATIONS, noise_level=DEFAULT_NOISE_LEVEL, seed=42, num_workers=1,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Args:
+            noise_texts (list): Noise documents to draw injected sentences from; loaded from
+                noise_dataset when not given.
+            noise_dataset (str): Hugging Face dataset of noise documents.
+            noise_column (str): Text column of noise_dataset.
+            num_noise_documents (int): Number of noise documents sampled into the pool.
+            pool_size (int): Maximum number of injection sentences.
+            operations (tuple): Subset of OPERATIONS to apply to every contaminated row.
+            noise_level (float): Probability of a character edit per word.
+            seed (int): Seed of all random choices.
+            num_workers (int): Number of worker processes (1 runs in the current process).
+            chunk_size (int): Number of rows per task.
+        """
+        unknown = set(operations) - set(OPERATIONS)
+        if unknown:
+            raise ValueError(f"Unknown contamination operations: {sorted(unknown)}")
+        self.noise_texts = noise_texts
+        self.noise_dataset = noise_dataset
+        self.noise_column = noise_column
+        self.num_noise_documents = num_noise_documents
+        self.pool_size = pool_size
+        self.operations = tuple(operations)
+        self.noise_level = noise_level
+        self.seed = seed
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self._sentence_pool = None
+        self._executor = None
+
+    def _load_noise_documents(self, rng):
+        from datasets import load_dataset
+        dataset = load_dataset(self.noise_dataset, split="train")
+        indices = rng.sample(range(len(dataset)), min(self.num_noise_documents, len(dataset)))
+        return dataset.select(sorted(indices))[self.noise_column]
+
+    @property
+    def sentence_pool(self):
+        """Injection sentences, each pre-split into words; built on first use."""
+        if self._sentence_pool is None:
+            rng = random.Random(self.seed)
+            documents = self.noise_texts if self.noise_texts is not None else self._load_noise_documents(rng)
+            sentences = []
+            for document in documents:
+                for sentence in SENTENCE_SPLIT_RE.split(document):
+                    words = sentence.split()
+                    if MIN_SENTENCE_WORDS <= len(words) <= MAX_SENTENCE_WORDS:
+                        sentences.append(words)
+            if len(sentences) > self.pool_size:
+                sentences = rng.sample(sentences, self.pool_size)
+            self._sentence_pool = sentences
+        return self._sentence_pool
+
+    def contaminate(self, texts, row_ids=None):
+        """
+        Contaminate texts.
+
+        Args:
+            texts (list): Input texts.
+            row_ids (list): Stable integer ids of the rows, seeding their RNGs (default: positions).
+
+        Returns:
+            list: (text, words_swapped, char_edits, injected_sentence) per text.
+        """
+        texts = list(texts)
+        row_ids = list(range(len(texts))) if row_ids is None else list(row_ids)
+        pool = self.sentence_pool if "insert_irrelevant" in self.operations else []
+        if self.num_workers <= 1 or len(texts) <= self.chunk_size:
+            return _contaminate_rows(texts, row_ids, pool, self.seed, self.operations, self.noise_level)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_simulator_worker,
+                                                 initargs=(pool,))
+        starts = range(0, len(texts), self.chunk_size)
+        chunks = [texts[i:i + self.chunk_size] for i in starts]
+        chunk_ids = [row_ids[i:i + self.chunk_size] for i in starts]
+        n = len(chunks)
+        results = self._executor.map(_contaminate_worker_chunk, chunks, chunk_ids, [self.seed] * n,
+                                     [self.operations] * n, [self.noise_level] * n)
+        return [row for chunk in results for row in chunk]
+
+    def contaminate_dataframe(self, df, frac=0.2, text_column='text', sample_seed=None):
+        """
+        Contaminate a random fraction of the rows of df in place of their text.
+
+        Rows are identified by their index labels (which should be unique integers).
+
+        Args:
+            df (pd.DataFrame): Input DataFrame.
+            frac (float): Fraction of rows to contaminate.
+            text_column (str): Column with the text to contaminate.
+            sample_seed (int or np.random.Generator): Seed or generator of the row sample
+                (default: the simulator's seed).
+
+        Returns:
+            pd.DataFrame: df with the contaminated texts and the ground-truth columns
+            'contaminated', 'contam_words_swapped', 'contam_char_edits' and
+            'contam_injected_sentence' (pool index, -1 if none).
+        """
+        sample_seed = self.seed if sample_seed is None else sample_seed
+        contam_indices = df.sample(frac=frac, random_state=sample_seed).index
+        df['contaminated'] = False
+        df['contam_words_swapped'] = False
+        df['contam_char_edits'] = 0
+        df['contam_injected_sentence'] = -1
+        if len(contam_indices) == 0:
+            return df
+        results = self.contaminate(df.loc[contam_indices, text_column].tolist(), row_ids=contam_indices)
+        texts, swapped, char_edits, injected = zip(*results)
+        df.loc[contam_indices, text_column] = list(texts)
+        df.loc[contam_indices, 'contaminated'] = True
+        df.loc[contam_indices, 'contam_words_swapped'] = list(swapped)
+        df.loc[contam_indices, 'contam_char_edits'] = list(char_edits)
+        df.loc[contam_indices, 'contam_injected_sentence'] = list(injected)
+        return df
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
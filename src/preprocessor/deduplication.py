@@ -1,5 +1,17 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
 import pandas as pd
 
+DEFAULT_DIGEST_SIZE = 16
+DEFAULT_MEMORY_BUDGET_MB = 1024
+DEFAULT_MERGE_CHUNK_SIZE = 1 << 20
+# 64-bit digests sort as integers; 128-bit digests as fixed-width byte strings.
+KEY_DTYPES = {8: np.dtype(np.uint64), 16: np.dtype('S16')}
+
 
 def remove_duplicates(df, text_column='cleaned_text'):
     """
@@ -12,4 +24,227 @@ def remove_duplicates(df, text_column='cleaned_text'):
     Returns:
         pd.DataFrame: DataFrame with duplicates removed.
     """
-    return df.drop_duplicates(subset=[text_column])
\ No newline at end of file
+    return df.drop_duplicates(subset=[text_column])
+
+
+def _lookup(keys, rows, queries):
+    """First-seen rows of the sorted queries in a sorted (keys, rows) run, -1 where absent."""
+    found = np.full(len(queries), -1, dtype=np.int64)
+    if len(keys) == 0 or len(queries) == 0:
+        return found
+    pos = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    # Fancy indexing reads only the probed entries of a memory-mapped run.
+    hit = np.asarray(keys[pos]) == queries
+    found[hit] = rows[pos[hit]]
+    return found
+
+
+def _merge_sorted(a, b):
+    """
+    Merge two in-memory sorted (keys, rows) runs with disjoint keys in one pass.
+
+    Only the merged arrays and the insert positions of b are allocated (no argsort).
+    """
+    (a_keys, a_rows), (b_keys, b_rows) = a, b
+    total = len(a_keys) + len(b_keys)
+    # With disjoint keys, b[j] lands after the a entries smaller than it and the j earlier b entries.
+    b_pos = np.searchsorted(a_keys, b_keys) + np.arange(len(b_keys))
+    from_a = np.ones(total, dtype=bool)
+    from_a[b_pos] = False
+    keys = np.empty(total, dtype=a_keys.dtype)
+    rows = np.empty(total, dtype=np.int64)
+    keys[b_pos], rows[b_pos] = b_keys, b_rows
+    keys[from_a], rows[from_a] = a_keys, a_rows
+    return keys, rows
+
+
+def _merge_runs(a, b, path, chunk_size):
+    """
+    Merge two sorted runs with disjoint keys into a new run at path, chunk by chunk.
+
+    Args:
+        a, b (tuple): (keys, rows) arrays of the runs (typically memory-mapped).
+        path (str): Path prefix of the merged run ('<path>.keys.npy', '<path>.rows.npy').
+        chunk_size (int): Entries read from each run per step.
+
+    Returns:
+        tuple: (keys, rows) of the merged run, memory-mapped.
+    """
+    (a_keys, a_rows), (b_keys, b_rows) = a, b
+    total = len(a_keys) + len(b_keys)
+    out_keys = np.lib.format.open_memmap(path + ".keys.npy", mode="w+", dtype=a_keys.dtype, shape=(total,))
+    out_rows = np.lib.format.open_memmap(path + ".rows.npy", mode="w+", dtype=np.int64, shape=(total,))
+    i = j = o = 0
+    while i < len(a_keys) or j < len(b_keys):
+        ak, bk = a_keys[i:i + chunk_size], b_keys[j:j + chunk_size]
+        na, nb = len(ak), len(bk)
+        if na and nb:
+            # Only entries up to the smaller of the two chunk ends are certainly next in order.
+            bound = min(ak[-1], bk[-1])
+            na = int(np.searchsorted(ak, bound, side='right'))
+            nb = int(np.searchsorted(bk, bound, side='right'))
+        keys = np.concatenate([ak[:na], bk[:nb]])
+        rows = np.concatenate([a_rows[i:i + na], b_rows[j:j + nb]])
+        order = np.argsort(keys, kind='stable')
+        out_keys[o:o + na + nb] = keys[order]
+        out_rows[o:o + na + nb] = rows[order]
+        i, j, o = i + na, j + nb, o + na + nb
+    out_keys.flush()
+    out_rows.flush()
+    return (np.load(path + ".keys.npy", mmap_mode="r"), np.load(path + ".rows.npy", mmap_mode="r"))
+
+
+class StreamingDeduplicator:
+    """
+    Exact deduplication across the batches of a stream, within a memory budget.
+
+    Only a fixed-width BLAKE2b digest (64 or 128 bits) and the first-seen row id of every
+    distinct text are kept, in sorted numpy arrays. The new digests of every batch form a
+    small sorted level, and levels of similar size are merged, so each entry is copied a
+    logarithmic number of times rather than the whole array once per batch. Half of the
+    memory budget holds the levels and the other half is left for the copy a merge makes.
+    When the levels outgrow it they are merged into a sorted run file on disk that is
+    looked up through a memory map; runs are merged the same way, so there are only
+    logarithmically many. Rows are
+    dropped when their text already occurred in this or an earlier batch, and every
+    duplicate is reported with the row id of its first occurrence.
+    """
+
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, digest_size=DEFAULT_DIGEST_SIZE, spill_dir=None,
+                 merge_chunk_size=DEFAULT_MERGE_CHUNK_SIZE):
+        """
+        Args:
+            memory_budget_mb (float): Memory for the in-memory digests and row ids, including the
+                copies made while merging them, before spilling to disk.
+            digest_size (int): Digest size in bytes, 8 (64-bit) or 16 (128-bit).
+            spill_dir (str): Directory for the spilled runs (default: the system temp directory).
+                A private subdirectory is created and removed by close().
+            merge_chunk_size (int): Entries read from each run per step when merging runs.
+        """
+        if digest_size not in KEY_DTYPES:
+            raise ValueError(f"digest_size must be one of {sorted(KEY_DTYPES)}, got {digest_size}")
+        self.digest_size = digest_size
+        self.key_dtype = KEY_DTYPES[digest_size]
+        # Merging two levels allocates their merged copy, so the levels themselves get half the budget.
+        self.max_entries = max(1, int(memory_budget_mb * 1024 * 1024) // (2 * (digest_size + 8)))
+        self.spill_dir = spill_dir
+        self.merge_chunk_size = merge_chunk_size
+        self.levels = []
+        self.runs = []
+        self.duplicates = 0
+        self._run_dir = None
+        self._run_count = 0
+
+    def __len__(self):
+        """Number of distinct texts seen so far."""
+        return sum(len(keys) for keys, _ in self.levels + self.runs)
+
+    def _digests(self, texts):
+        digest = hashlib.blake2b
+        size = self.digest_size
+        joined = b''.join(digest(text.encode('utf-8'), digest_size=size).digest() for text in texts)
+        return np.frombuffer(joined, dtype=self.key_dtype)
+
+    def _run_path(self):
+        if self._run_dir is None:
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            self._run_dir = tempfile.mkdtemp(prefix="dedup_runs_", dir=self.spill_dir)
+        self._run_count += 1
+        return os.path.join(self._run_dir, f"run_{self._run_count:06d}")
+
+    @staticmethod
+    def _remove_run(run):
+        for array in run:
+            os.remove(array.filename)
+
+    def _spill(self):
+        """Write the in-memory levels as one sorted run and merge runs of similar size."""
+        # Levels grow from last to first, so merging from the end keeps every merge step small.
+        keys, rows = self.levels.pop()
+        while self.levels:
+            keys, rows = _merge_sorted(self.levels.pop(), (keys, rows))
+        path = self._run_path()
+        np.save(path + ".keys.npy", keys)
+        np.save(path + ".rows.npy", rows)
+        del keys, rows
+        self.runs.append((np.load(path + ".keys.npy", mmap_mode="r"), np.load(path + ".rows.npy", mmap_mode="r")))
+        # Binary-counter merging: a run is merged into its predecessor until the predecessor is twice as large.
+        while len(self.runs) > 1 and len(self.runs[-2][0]) < 2 * len(self.runs[-1][0]):
+            b, a = self.runs.pop(), self.runs.pop()
+            self.runs.append(_merge_runs(a, b, self._run_path(), self.merge_chunk_size))
+            self._remove_run(a)
+            self._remove_run(b)
+
+    def find_duplicates(self, texts, row_ids):
+        """
+        Look up texts and record the new ones.
+
+        Args:
+            texts (iterable): Texts of the batch.
+            row_ids (array-like): Unique integer ids of the rows (e.g. global row positions).
+
+        Returns:
+            np.ndarray: Row id of the first occurrence of every text that was seen before
+            (in an earlier batch or earlier in this batch), -1 for first occurrences.
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        keys, first_index, inverse = np.unique(self._digests(texts), return_index=True, return_inverse=True)
+        found = np.full(len(keys), -1, dtype=np.int64)
+        for run_keys, run_rows in self.levels + self.runs:
+            missing = found < 0
+            if not missing.any():
+                break
+            found[missing] = _lookup(run_keys, run_rows, keys[missing])
+
+        new = found < 0
+        new_rows = row_ids[first_index[new]]
+        found[new] = new_rows
+        first_seen = found[inverse.reshape(-1)]
+        first_seen[first_seen == row_ids] = -1
+        self.duplicates += int((first_seen >= 0).sum())
+
+        if new.any():
+            # keys is sorted, so the new entries already form a sorted level.
+            self.levels.append((keys[new], new_rows))
+            while len(self.levels) > 1 and len(self.levels[-2][0]) < 2 * len(self.levels[-1][0]):
+                b, a = self.levels.pop(), self.levels.pop()
+                self.levels.append(_merge_sorted(a, b))
+            if sum(len(level_keys) for level_keys, _ in self.levels) >= self.max_entries:
+                self._spill()
+        return first_seen
+
+    def filter(self, df, text_column='cleaned_text', report=None):
+        """
+        Return the rows of df whose text has not been seen before, keeping the first occurrence.
+
+        Args:
+            df (pd.DataFrame): Batch whose index holds unique integer row ids.
+            text_column (str): Column to deduplicate on.
+            report: Optional writer (e.g. a table_io.TableWriter) receiving a DataFrame with the
+                'row' and 'first_seen_row' of every duplicate in the batch.
+
+        Returns:
+            pd.DataFrame: The rows of df seen for the first time.
+        """
+        # A list iterates much faster than an (Arrow-backed) string Series.
+        first_seen = self.find_duplicates(df[text_column].tolist(), df.index)
+        duplicate = first_seen >= 0
+        if report is not None:
+            report.write(pd.DataFrame({'row': np.asarray(df.index)[duplicate],
+                                       'first_seen_row': first_seen[duplicate]}))
+        return df[~duplicate]
+
+    def close(self):
+        """Drop the in-memory levels and remove the spilled runs, if any."""
+        self.levels = []
+        self.runs = []
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,223 @@
+import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 3
+DEFAULT_JACCARD_THRESHOLD = 0.8
+DEFAULT_CHUNK_SIZE = 1000
+WORD_RE = re.compile(r"\w+")
+# Odd 64-bit multiplier combining word hashes into shingle hashes (arithmetic wraps modulo 2**64).
+_HASH_BASE = np.uint64(0x9E3779B97F4A7C15)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def _word_hashes(words, cache):
+    """Stable 64-bit hashes of words (Python's hash() differs between worker processes)."""
+    hashes = np.empty(len(words), dtype=np.uint64)
+    for i, word in enumerate(words):
+        value = cache.get(word)
+        if value is None:
+            value = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            cache[word] = value
+        hashes[i] = value
+    return hashes
+
+
+def _shingle_hashes(texts, shingle_size, cache):
+    """
+    Hash the word shingles of many texts at once.
+
+    Texts shorter than shingle_size words form a single shingle of all their words.
+
+    Returns:
+        (hashes, counts): uint64 shingle hashes of all texts concatenated, and the number
+        of shingles of each text.
+    """
+    word_lists = [WORD_RE.findall(text) for text in texts]
+    lengths = np.array([len(words) for words in word_lists], dtype=np.int64)
+    words = _word_hashes([word for word_list in word_lists for word in word_list], cache)
+    total = len(words)
+    if total == 0:
+        return np.empty(0, dtype=np.uint64), np.zeros(len(texts), dtype=np.int64)
+
+    # Hash of the (up to) shingle_size words starting at every position, without crossing texts.
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    owners = np.repeat(np.arange(len(texts)), lengths)
+    remaining = starts[owners] + lengths[owners] - np.arange(total)
+    hashes = words.copy()
+    for j in range(1, shingle_size):
+        nxt = np.zeros(total, dtype=np.uint64)
+        nxt[:total - j] = words[j:]
+        hashes = np.where(remaining > j, hashes * _HASH_BASE + nxt, hashes)
+
+    counts = np.maximum(lengths - shingle_size + 1, np.minimum(lengths, 1))
+    keep = (np.arange(total) - starts[owners]) < counts[owners]
+    return hashes[keep], counts
+
+
+def _minhash_chunk(texts, num_perm, shingle_size, seed):
+    """MinHash signatures of one chunk of texts (runs in a worker process)."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    hashes, counts = _shingle_hashes(texts, shingle_size, {})
+    signatures = np.full((len(texts), num_perm), _MAX_HASH, dtype=np.uint32)
+    nonempty = counts > 0
+    if not nonempty.any():
+        return signatures
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+    # Multiply-shift hashing: the high 32 bits of a * x + b are a universal hash of x.
+    for start in range(0, num_perm, 32):
+        stop = min(start + 32, num_perm)
+        permuted = (hashes[:, None] * a[None, start:stop] + b[None, start:stop]) >> np.uint64(32)
+        signatures[nonempty, start:stop] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+
+def minhash_signatures(texts, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=42,
+                       num_workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Compute MinHash signatures of word shingles.
+
+    Args:
+        texts (list): Input texts.
+        num_perm (int): Number of hash permutations (signature length).
+        shingle_size (int): Number of words per shingle.
+        seed (int): Seed of the hash permutations.
+        num_workers (int): Number of worker processes (1 runs in the current process).
+        chunk_size (int): Number of texts per task.
+
+    Returns:
+        np.ndarray: (len(texts) x num_perm) uint32 signatures. Texts without words get
+        the all-max signature.
+    """
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if not chunks:
+        return np.empty((0, num_perm), dtype=np.uint32)
+    args = ([num_perm] * len(chunks), [shingle_size] * len(chunks), [seed] * len(chunks))
+    if num_workers <= 1:
+        return np.concatenate(list(map(_minhash_chunk, chunks, *args)))
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return np.concatenate(list(pool.map(_minhash_chunk, chunks, *args)))
+
+
+def lsh_params(threshold, num_perm):
+    """
+    Choose the number of LSH bands and rows per band for a Jaccard threshold.
+
+    Minimizes the sum of the false positive and false negative probability mass of
+    the banding S-curve 1 - (1 - s**rows)**bands around the threshold.
+
+    Returns:
+        (bands, rows): Banding with bands * rows <= num_perm.
+    """
+    below = np.linspace(0.0, threshold, 200)
+    above = np.linspace(threshold, 1.0, 200)
+    best, best_error = (1, num_perm), np.inf
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = np.mean(1 - (1 - below ** rows) ** bands) * threshold
+            false_negative = np.mean((1 - above ** rows) ** bands) * (1 - threshold)
+            if false_positive + false_negative < best_error:
+                best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+def near_duplicate_clusters(signatures, threshold=DEFAULT_JACCARD_THRESHOLD, bands=None, rows=None):
+    """
+    Cluster near-duplicate texts with LSH banding of their MinHash signatures.
+
+    Texts sharing a band are candidate pairs; each candidate is linked to the first
+    text of its band bucket if their estimated Jaccard similarity (fraction of equal
+    signature values) reaches the threshold. Clusters are the connected components.
+
+    Args:
+        signatures (np.ndarray): (n x num_perm) uint32 MinHash signatures.
+        threshold (float): Jaccard similarity threshold.
+        bands (int): Number of LSH bands (default: chosen by lsh_params).
+        rows (int): Rows per band (default: chosen by lsh_params).
+
+    Returns:
+        np.ndarray: int64 cluster id per text, the position of the cluster's first text.
+    """
+    n, num_perm = signatures.shape
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    if bands is None or rows is None:
+        bands, rows = lsh_params(threshold, num_perm)
+    nonempty = (signatures != _MAX_HASH).any(axis=1)
+
+    edges = []
+    for band in range(bands):
+        keys = np.zeros(n, dtype=np.uint64)
+        for column in signatures[:, band * rows:(band + 1) * rows].T:
+            keys = keys * _HASH_BASE + column.astype(np.uint64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        new_bucket = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        heads = order[np.maximum.accumulate(np.where(new_bucket, np.arange(n), 0))]
+        members = ~new_bucket
+        edges.append(np.stack([heads[members], order[members]], axis=1))
+    edges = np.unique(np.concatenate(edges), axis=0)
+    edges = edges[nonempty[edges[:, 0]] & nonempty[edges[:, 1]]]
+
+    similar = np.zeros(len(edges), dtype=bool)
+    for start in range(0, len(edges), 100000):
+        pairs = edges[start:start + 100000]
+        similar[start:start + 100000] = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1) >= threshold
+    edges = edges[similar]
+
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    graph = coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    first = np.full(labels.max() + 1, n, dtype=np.int64)
+    np.minimum.at(first, labels, np.arange(n))
+    return first[labels]
+
+
+def assign_near_duplicate_clusters(df, text_column='cleaned_text', threshold=DEFAULT_JACCARD_THRESHOLD,
+                                   num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, num_workers=1,
+                                   seed=42):
+    """
+    Add a 'near_dup_cluster' column with the index label of each row's cluster representative.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing text data.
+        text_column (str): Column name to check for near-duplicates (default: 'cleaned_text').
+        threshold (float): Jaccard similarity of word shingles above which rows are near-duplicates.
+        num_perm (int): MinHash signature length.
+        shingle_size (int): Number of words per shingle.
+        num_workers (int): Number of processes computing signatures.
+        seed (int): Seed of the hash permutations.
+
+    Returns:
+        pd.DataFrame: Copy of df with the 'near_dup_cluster' column. The representative
+        is the first row of the cluster.
+    """
+    signatures = minhash_signatures(df[text_column].tolist(), num_perm=num_perm, shingle_size=shingle_size,
+                                    seed=seed, num_workers=num_workers)
+    clusters = near_duplicate_clusters(signatures, threshold=threshold)
+    df = df.copy()
+    df['near_dup_cluster'] = df.index.to_numpy()[clusters]
+    return df
+
+
+def remove_near_duplicates(df, text_column='cleaned_text', threshold=DEFAULT_JACCARD_THRESHOLD,
+                           num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, num_workers=1, seed=42):
+    """
+    Remove near-duplicate rows, keeping the first row of every cluster.
+
+    Takes the same arguments as assign_near_duplicate_clusters.
+
+    Returns:
+        pd.DataFrame: The kept rows, with their 'near_dup_cluster' id and the number of
+        rows of their cluster in 'near_dup_size'.
+    """
+    df = assign_near_duplicate_clusters(df, text_column=text_column, threshold=threshold, num_perm=num_perm,
+                                        shingle_size=shingle_size, num_workers=num_workers, seed=seed)
+    sizes = df['near_dup_cluster'].map(df['near_dup_cluster'].value_counts())
+    df['near_dup_size'] = sizes
+    return df[df['near_dup_cluster'] == df.index]
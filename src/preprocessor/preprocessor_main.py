@@ -9,33 +9,42 @@ This script performs data preprocessing on a raw text dataset by:
   - Tokenizing the cleaned text.
   - Removing duplicate entries.
   - Segmenting text into smaller units (sentences or fixed-length chunks).
-  - Saving the preprocessed data as a CSV file.
+  - Saving the preprocessed data as a Parquet table (tokens as a typed list column),
+    optionally exported to CSV.
+
+With --stream, the dataset is read in batches (a streaming Hugging Face dataset or a
+chunked CSV reader) and every batch is capped, cleaned, deduplicated, segmented and
+appended to the output table, so peak memory is bounded by the batch size.
 
 Usage:
     python main.py [--output-dir PATH] [--max-bytes BYTES]
                    [--segment-mode MODE] [--segment-limit N]
-                   [--remove-stopwords]
+                   [--remove-stopwords] [--stream] [--batch-size N] [--export-csv]
 """
 
 import os
 import argparse
+import numpy as np
 import pandas as pd
-from datasets import load_dataset
-from pygments.lexer import default
 from tqdm import tqdm
 
-from cleaning import normalize_text
-from contamination_simulator import contaminate_text
-from tokenization import tokenize_text
-from deduplication import remove_duplicates
+from cleaning import normalize_texts
+from contamination_simulator import ContaminationSimulator
+from tokenization import tokenize_texts
+from deduplication import StreamingDeduplicator, DEFAULT_MEMORY_BUDGET_MB
+from near_deduplication import remove_near_duplicates
 from segmentation import segment_dataframe
 
+from table_io import iter_batches, TableWriter, write_table, export_csv
+from seeding import derive_seed
+
 # Default configuration parameters.
 DEFAULT_DATASET_NAME = "iohadrubin/wikitext-103-raw-v1"
 DEFAULT_SPLIT = "train"
 DEFAULT_MAX_BYTES = 25 * 1024 * 1024 * 1024  # 25GB in bytes
 DEFAULT_SEGMENT_MODE = "sentence"
-DEFAULT_OUTPUT_FILENAME = "preprocessed_wikitext103_subset_3414.csv"
+DEFAULT_OUTPUT_FILENAME = "preprocessed_wikitext103_subset_3414.parquet"
+DEFAULT_STREAM_BATCH_SIZE = 10000
 
 
 def cap_dataset_by_bytes(df, max_bytes):
@@ -49,27 +58,39 @@ def cap_dataset_by_bytes(df, max_bytes):
     return df_capped
 
 
+def make_contamination_simulator(args):
+    """Build the contamination simulator, with noise documents from --contamination-noise-file if given."""
+    noise_texts = None
+    if args.contamination_noise_file is not None:
+        with open(args.contamination_noise_file, 'r', encoding='utf-8') as f:
+            noise_texts = [line.strip() for line in f if line.strip()]
+    return ContaminationSimulator(noise_texts=noise_texts, seed=args.contamination_seed, num_workers=args.num_workers)
+
+
+def make_deduplicator(args):
+    """Build the exact deduplicator with the --dedup-* memory budget, digest size and spill directory."""
+    return StreamingDeduplicator(memory_budget_mb=args.dedup_memory_mb, digest_size=args.dedup_hash_bits // 8,
+                                 spill_dir=args.dedup_spill_dir)
+
+
+def open_dedup_report(args):
+    """Writer of the duplicate report (row, first_seen_row) if --dedup-report is given, else None."""
+    return TableWriter(args.dedup_report) if args.dedup_report else None
+
+
 def preprocess_dataset(args):
     print("Loading dataset...")
     if args.input_path is None:
+        from datasets import load_dataset
         dataset = load_dataset(DEFAULT_DATASET_NAME, split=DEFAULT_SPLIT)
         df = pd.DataFrame(dataset)
         print(f"Original dataset rows: {len(df)}")
     else :
         data_file = args.input_path
-        # df = pd.read_csv(data_file)
-        # loading in chunks
-        with open(data_file, 'r', encoding='utf-8', errors='ignore') as f:
-            total_lines = sum(1 for line in f) - 1
-
+        # Read the Parquet or CSV table in chunks and display progress
         chunk_size = 10000  # adjust chunk size as needed
-        total_chunks = total_lines // chunk_size
-
-        # Read CSV in chunks and display progress
         chunks = []
-        for chunk in tqdm(pd.read_csv(data_file, on_bad_lines='skip', engine='python', chunksize=chunk_size),
-                          total=total_chunks,
-                          desc="Loading CSV"):
+        for chunk in tqdm(iter_batches(data_file, batch_size=chunk_size), desc="Loading data"):
             chunks.append(chunk)
 
         # Combine all chunks into one DataFrame
@@ -82,19 +103,31 @@ def preprocess_dataset(args):
 
     if args.sim_contamination:
         print("Contaminating dataset...")
-        contam_indices = df.sample(frac=0.2, random_state=42).index
-        df.loc[contam_indices, 'text'] = df.loc[contam_indices, 'text'].apply(contaminate_text)
-        print("finished dataset contamination")
+        with make_contamination_simulator(args) as simulator:
+            df = simulator.contaminate_dataframe(df, frac=args.contamination_frac, text_column='text')
+        print(f"finished dataset contamination ({int(df['contaminated'].sum())} rows)")
 
     print("Normalizing text...")
-    df['cleaned_text'] = df['text'].apply(lambda x: normalize_text(x, remove_stopwords=args.remove_stopwords))
+    df['cleaned_text'] = normalize_texts(df['text'], remove_stopwords=args.remove_stopwords,
+                                         num_workers=args.num_workers)
 
     print("Tokenizing text...")
-    df['tokens'] = df['cleaned_text'].apply(tokenize_text)
+    df['tokens'] = tokenize_texts(df['cleaned_text'])
 
     print("Removing duplicate entries...")
-    df = remove_duplicates(df, text_column='cleaned_text')
-    print(f"Rows after deduplication: {len(df)}")
+    with make_deduplicator(args) as deduplicator:
+        report = open_dedup_report(args)
+        df = deduplicator.filter(df, text_column='cleaned_text', report=report)
+        if report is not None:
+            report.close()
+    print(f"Rows after deduplication: {len(df)} ({deduplicator.duplicates} duplicates removed)")
+
+    if args.dedup_mode == "near":
+        print(f"Removing near-duplicate entries (Jaccard >= {args.near_dup_threshold})...")
+        df = remove_near_duplicates(df, text_column='cleaned_text', threshold=args.near_dup_threshold,
+                                    num_perm=args.minhash_perms, shingle_size=args.shingle_size,
+                                    num_workers=args.num_workers)
+        print(f"Rows after near-duplicate removal: {len(df)}")
 
     print(f"Segmenting text using mode: {args.segment_mode}")
     df_segmented = segment_dataframe(df, text_column='cleaned_text', mode=args.segment_mode)
@@ -111,14 +144,91 @@ def preprocess_dataset(args):
     return df_segmented
 
 
+def iter_raw_batches(input_path, batch_size):
+    """
+    Yield the raw dataset as DataFrames of at most batch_size rows with a 'text' column.
+
+    Without an input path the default Hugging Face dataset is streamed instead of downloaded
+    whole; Parquet and CSV files are read in chunks without counting their rows first.
+    """
+    if input_path is None:
+        from datasets import load_dataset
+        dataset = load_dataset(DEFAULT_DATASET_NAME, split=DEFAULT_SPLIT, streaming=True)
+        for batch in dataset.iter(batch_size=batch_size):
+            yield pd.DataFrame(batch)
+    else:
+        yield from iter_batches(input_path, batch_size=batch_size)
+
+
+def preprocess_dataset_streaming(args, output_path):
+    """
+    Preprocess the dataset batch by batch and append the segments to output_path.
+
+    Produces the same steps as preprocess_dataset: the byte cap is a running counter over
+    the stream, exact duplicates are detected across batches by their text digests, and
+    reading stops once the byte cap or the segment limit is reached. Contamination samples
+    --contamination-frac of every batch. Near-duplicate removal needs the whole corpus and is not available.
+
+    Returns:
+        int: Number of segmented rows written.
+    """
+    bytes_read = 0
+    rows_read = rows_kept = segments_written = 0
+    report = open_dedup_report(args)
+    with make_contamination_simulator(args) as simulator, make_deduplicator(args) as deduplicator, \
+            TableWriter(output_path) as output:
+        for batch_index, batch in enumerate(tqdm(iter_raw_batches(args.input_path, args.batch_size),
+                                                 desc="Preprocessing batches")):
+            # Global row ids, which also seed the contamination of every row.
+            batch.index = pd.RangeIndex(rows_read, rows_read + len(batch))
+            rows_read += len(batch)
+            # Running byte cap: keep the rows whose cumulative size stays within max_bytes.
+            cum_size = batch['text'].map(lambda x: len(x.encode('utf-8'))).cumsum().to_numpy() + bytes_read
+            within = cum_size <= args.max_bytes
+            batch = batch[within].copy()
+            bytes_read = int(cum_size[-1]) if len(cum_size) else bytes_read
+
+            if args.sim_contamination and len(batch):
+                # Hash (seed, batch index) so consecutive seeds do not reuse each other's batch samples.
+                sample_rng = np.random.default_rng(derive_seed(args.contamination_seed, batch_index))
+                batch = simulator.contaminate_dataframe(batch, frac=args.contamination_frac, text_column='text',
+                                                        sample_seed=sample_rng)
+
+            batch['cleaned_text'] = normalize_texts(batch['text'], remove_stopwords=args.remove_stopwords,
+                                                    num_workers=args.num_workers)
+            # Deduplicate before tokenizing so duplicates are never tokenized.
+            batch = deduplicator.filter(batch, text_column='cleaned_text', report=report)
+            rows_kept += len(batch)
+            batch['tokens'] = tokenize_texts(batch['cleaned_text'])
+
+            segmented = segment_dataframe(batch, text_column='cleaned_text', mode=args.segment_mode)
+            segmented = segmented.drop(columns=['text', 'cleaned_text'])
+            if args.segment_limit:
+                segmented = segmented.iloc[:args.segment_limit - segments_written]
+            output.write(segmented)
+            segments_written += len(segmented)
+
+            if not within.all() or (args.segment_limit and segments_written >= args.segment_limit):
+                break
+
+    if report is not None:
+        report.close()
+    print(f"Rows read: {rows_read}, rows kept after capping and deduplication: {rows_kept} "
+          f"({deduplicator.duplicates} duplicates removed)")
+    print(f"Total segmented rows: {segments_written}")
+    return segments_written
+
+
 def main():
     parser = argparse.ArgumentParser(description="Data Preprocessing Module")
     parser.add_argument("--output-dir", type=str, default="data",
-                        help="Directory to save the preprocessed CSV file (default: ../data)")
+                        help="Directory to save the preprocessed table (default: ../data)")
     parser.add_argument("--input-path", type=str, default=None,
                         help="Input path for Raw data")
     parser.add_argument("--output-filename", type=str, default=DEFAULT_OUTPUT_FILENAME,
-                        help=f"Output CSV filename (default: {DEFAULT_OUTPUT_FILENAME})")
+                        help=f"Output table filename, .parquet or .csv (default: {DEFAULT_OUTPUT_FILENAME})")
+    parser.add_argument("--export-csv", action="store_true", default=False,
+                        help="Also export the Parquet output as a CSV file next to it")
     parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
                         help="Maximum dataset size in bytes (default: 25GB)")
     parser.add_argument("--segment-mode", type=str, choices=["sentence", "fixed", "none"],
@@ -127,19 +237,62 @@ def main():
                         help="Optional limit on the number of segmented rows to keep (default: all)")
     parser.add_argument("--remove-stopwords", action="store_true", default=False,
                         help="Optionally remove stopwords during normalization")
+    parser.add_argument("--dedup-mode", type=str, choices=["exact", "near"], default="exact",
+                        help="Deduplication mode: exact matches only, or also MinHash-LSH near-duplicates (default: exact)")
+    parser.add_argument("--dedup-memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="Memory for exact-duplicate digests before they are spilled to sorted runs on disk "
+                             f"(default: {DEFAULT_MEMORY_BUDGET_MB})")
+    parser.add_argument("--dedup-hash-bits", type=int, choices=[64, 128], default=128,
+                        help="Size of the exact-duplicate content digests (default: 128)")
+    parser.add_argument("--dedup-spill-dir", type=str, default=None,
+                        help="Directory for spilled digest runs (default: the system temp directory)")
+    parser.add_argument("--dedup-report", type=str, default=None,
+                        help="Optional table (.parquet or .csv) listing every duplicate row and its first-seen row")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.8,
+                        help="Jaccard similarity of word shingles above which rows are near-duplicates (default: 0.8)")
+    parser.add_argument("--minhash-perms", type=int, default=128,
+                        help="Number of MinHash permutations (default: 128)")
+    parser.add_argument("--shingle-size", type=int, default=3,
+                        help="Number of words per shingle for near-duplicate detection (default: 3)")
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="Number of processes used for text normalization, contamination and near-duplicate detection "
+                             "(default: 1)")
+    parser.add_argument("--stream", action="store_true", default=False,
+                        help="Process the dataset in batches and write the output incrementally, "
+                             "so memory is bounded by --batch-size rows")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_STREAM_BATCH_SIZE,
+                        help=f"Rows per batch in --stream mode (default: {DEFAULT_STREAM_BATCH_SIZE})")
     parser.add_argument("--sim-contamination", action="store_true", default=True,
                         help="Simulate the contamination of the dataset (default: True)")
+    parser.add_argument("--contamination-frac", type=float, default=0.2,
+                        help="Fraction of rows to contaminate (default: 0.2)")
+    parser.add_argument("--contamination-seed", type=int, default=42,
+                        help="Seed of the contamination simulation (default: 42)")
+    parser.add_argument("--contamination-noise-file", type=str, default=None,
+                        help="Text file with one noise document per line to inject sentences from "
+                             "(default: sample the Gutenberg dataset)")
     args = parser.parse_args()
-
-    df_processed = preprocess_dataset(args)
+    if args.stream and args.dedup_mode == "near":
+        parser.error("--dedup-mode near needs the whole corpus and cannot be combined with --stream")
 
     os.makedirs(args.output_dir, exist_ok=True)
     output_path = os.path.join(args.output_dir, args.output_filename)
-    try:
-        df_processed.to_csv(output_path, index=False)
+    if args.stream:
+        preprocess_dataset_streaming(args, output_path)
         print(f"Preprocessed data saved to {output_path}")
-    except Exception as e:
-        print("Data was not saved properly: {}".format(e))
+    else:
+        df_processed = preprocess_dataset(args)
+        try:
+            write_table(df_processed, output_path)
+            print(f"Preprocessed data saved to {output_path}")
+        except Exception as e:
+            print("Data was not saved properly: {}".format(e))
+            return
+
+    if args.export_csv and output_path.endswith(".parquet"):
+        csv_path = output_path[:-len(".parquet")] + ".csv"
+        export_csv(output_path, csv_path)
+        print(f"Preprocessed data exported to {csv_path}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,7 @@
-from nltk.tokenize import sent_tokenize
 from tokenization import tokenize_text
 
 
-def segment_text(text, mode='sentence', fixed_token_length=100):
+def segment_text(text, mode='sentence', fixed_token_length=100, tokens=None):
     """
     Segment text into units based on mode.
 
@@ -12,20 +11,24 @@ def segment_text(text, mode='sentence', fixed_token_length=100):
                     'fixed' for fixed token-length segments,
                     'none' to return the text as a single segment.
         fixed_token_length (int): Token count per segment (for 'fixed' mode).
+        tokens (list): Tokens of text from tokenize_text/tokenize_texts; reused in 'fixed'
+                       mode instead of tokenizing the text again.
 
     Returns:
         list: List of text segments.
     """
     if mode == 'sentence':
+        from nltk.tokenize import sent_tokenize
         return sent_tokenize(text)
     elif mode == 'fixed':
-        tokens = tokenize_text(text)
+        if tokens is None:
+            tokens = tokenize_text(text)
         return [' '.join(tokens[i:i + fixed_token_length]) for i in range(0, len(tokens), fixed_token_length)]
     else:
         return [text]
 
 
-def segment_dataframe(df, text_column='cleaned_text', mode='sentence'):
+def segment_dataframe(df, text_column='cleaned_text', mode='sentence', tokens_column='tokens'):
     """
     Apply segmentation to each entry in a DataFrame column and explode the result.
 
@@ -33,9 +36,14 @@ def segment_dataframe(df, text_column='cleaned_text', mode='sentence'):
         df (pd.DataFrame): Input DataFrame.
         text_column (str): Column containing the text to segment.
         mode (str): Segmentation mode.
+        tokens_column (str): Column with the tokens of text_column, reused in 'fixed' mode if present.
 
     Returns:
         pd.DataFrame: DataFrame with a new column 'segments', exploded into one row per segment.
     """
-    df['segments'] = df[text_column].apply(lambda x: segment_text(x, mode=mode))
+    if mode == 'fixed' and tokens_column in df:
+        df['segments'] = [segment_text(text, mode=mode, tokens=tokens)
+                          for text, tokens in zip(df[text_column], df[tokens_column])]
+    else:
+        df['segments'] = df[text_column].apply(lambda x: segment_text(x, mode=mode))
     return df.explode('segments')
\ No newline at end of file
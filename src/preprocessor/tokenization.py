@@ -1,9 +1,22 @@
-from transformers import AutoTokenizer
+from functools import lru_cache
 
 # DEFAULT_TOKENIZER_MODEL = 'bert-base-uncased'
 DEFAULT_TOKENIZER_MODEL = 'distilgpt2'
-# Initialize the fast tokenizer.
-tokenizer = AutoTokenizer.from_pretrained(DEFAULT_TOKENIZER_MODEL, use_fast=True)
+MAX_LENGTH = 1024
+DEFAULT_BATCH_SIZE = 1000
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name=DEFAULT_TOKENIZER_MODEL):
+    """Load the fast tokenizer on first use instead of at import time."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+
+def _encode(texts):
+    # Truncate like tokenizer.tokenize(text, truncation=True, max_length=1024), which avoids the length warning.
+    return get_tokenizer()(texts, add_special_tokens=False, truncation=True, max_length=MAX_LENGTH,
+                           return_attention_mask=False)
 
 
 def tokenize_text(text):
@@ -16,4 +29,23 @@ def tokenize_text(text):
     Returns:
         list: List of tokens.
     """
-    return tokenizer.tokenize(text, truncation=True, max_length=1024) # changes made because of warning
\ No newline at end of file
+    return _encode(text).tokens()
+
+
+def tokenize_texts(texts, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Tokenize many texts with the fast tokenizer's batch encoding.
+
+    Args:
+        texts (list): Input texts.
+        batch_size (int): Number of texts encoded per call.
+
+    Returns:
+        list: Per text, the list of tokens (as returned by tokenize_text).
+    """
+    texts = list(texts)
+    tokens = []
+    for start in range(0, len(texts), batch_size):
+        encoded = _encode(texts[start:start + batch_size])
+        tokens.extend(encoding.tokens for encoding in encoded.encodings)
+    return tokens
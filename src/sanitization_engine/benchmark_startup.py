@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Startup Time Benchmark
+
+Measures the cold start of every pipeline entry point: the wall time of
+`python <script> --help` (best of --repeats runs, which covers interpreter start-up
+and all module-level imports), and the slowest imports reported by `python -X importtime`.
+
+Usage (from the repository root):
+    python src/sanitization_engine/benchmark_startup.py [--repeats N] [--top N] [--scripts PATH ...]
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+from manager import stage_environment
+
+ENTRY_POINTS = [
+    "src/sanitization_main.py",
+    "src/preprocessor/preprocessor_main.py",
+    "src/contamination_detector/detector.py",
+    "src/membership_inference_checker/main.py",
+    "src/membership_inference_checker/index_main.py",
+]
+IMPORTTIME_RE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def time_startup(script, repeats):
+    """Best wall time in seconds of `python script --help`."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, script, "--help"], capture_output=True, text=True,
+                                env=stage_environment())
+        best = min(best, time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{script} --help failed: {result.stderr.strip()}")
+    return best
+
+
+def slowest_imports(script, top):
+    """Top-level imports of script with the largest cumulative import time, as (seconds, module)."""
+    result = subprocess.run([sys.executable, "-X", "importtime", script, "--help"], capture_output=True, text=True,
+                            env=stage_environment())
+    imports = []
+    for match in IMPORTTIME_RE.finditer(result.stderr):
+        cumulative_us, indent, module = match.groups()
+        # Only modules imported directly by the script or its siblings (indentation of one level).
+        if len(indent) == 1:
+            imports.append((int(cumulative_us) / 1e6, module))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup Time Benchmark")
+    parser.add_argument("--scripts", nargs="+", default=ENTRY_POINTS,
+                        help="Entry point scripts to measure (default: all pipeline entry points).")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Runs per script; the best wall time is reported (default: 3).")
+    parser.add_argument("--top", type=int, default=5,
+                        help="Number of slowest imports listed per script (default: 5).")
+    args = parser.parse_args()
+
+    for script in args.scripts:
+        seconds = time_startup(script, args.repeats)
+        print(f"{script:<50} {seconds:6.2f} s")
+        for import_seconds, module in slowest_imports(script, args.top):
+            print(f"    {module:<46} {import_seconds:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
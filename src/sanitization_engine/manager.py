@@ -1,65 +1,115 @@
 import logging
+import os
+import runpy
 import subprocess
 import sys
 
+# The stages import the shared packages (table_io, embedding_service) from src.
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stage_environment():
+    """Environment of a stage subprocess, with src on its PYTHONPATH."""
+    python_path = os.environ.get("PYTHONPATH")
+    return {**os.environ, "PYTHONPATH": os.pathsep.join([SRC_DIR, python_path]) if python_path else SRC_DIR}
+
 def run_command(command):
     logging.info(f"Running: {' '.join(command)}")
-    result = subprocess.run(command, capture_output=True, text=True)
+    result = subprocess.run(command, capture_output=True, text=True, env=stage_environment())
     if result.returncode != 0:
         logging.error(f"Error running {' '.join(command)}: {result.stderr}")
         sys.exit(result.returncode)
     else:
         logging.info(result.stdout)
 
+def run_in_process(command):
+    """
+    Run a stage script in the current interpreter, as if started with `python script args...`.
+
+    Libraries already imported by earlier stages (pandas, torch, transformers, ...) are reused
+    instead of being imported again by a fresh interpreter. The script's directory is put first
+    on sys.path for its sibling imports, followed by src for the shared packages, and the modules
+    loaded from the script's directory are unloaded afterwards.
+    Worker processes started by the stage still find its functions, because runpy installs the
+    script as __main__ while it runs.
+    """
+    script, arguments = command[1], command[2:]
+    logging.info(f"Running in process: {' '.join(command[1:])}")
+    script_dir = os.path.dirname(os.path.abspath(script))
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    sys.argv = [script] + arguments
+    sys.path[:0] = [script_dir, SRC_DIR]
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            logging.error(f"Error running {' '.join(command[1:])}: exit code {e.code}")
+            sys.exit(e.code)
+    except Exception:
+        logging.exception(f"Error running {' '.join(command[1:])}")
+        sys.exit(1)
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        for name, module in list(sys.modules.items()):
+            module_file = getattr(module, "__file__", None)
+            if module_file and os.path.dirname(os.path.abspath(module_file)) == script_dir:
+                del sys.modules[name]
+
 def run_full_pipeline(args):
     """
-    Runs the entire pipeline sequentially by invoking the other modules via subprocess.
+    Runs the entire pipeline sequentially, in the current process unless args.isolate_stages
+    asks for a fresh interpreter (subprocess) per stage.
     """
+    run_stage = run_command if getattr(args, "isolate_stages", False) else run_in_process
 
     logging.info("Starting Full Data Sanitization Pipeline")
     logging.info("Starting Data Preprocessing Pipeline")
     # Step 1: Preprocessing
     if args.use_default_raw_data:
-        run_command([
+        run_stage([
             sys.executable, "src/preprocessor/preprocessor_main.py",
             "--output-dir", "data",
             # "--segment-limit", "189700",
             "--segment-limit", "3414", # for testing purposes
-            # "--output-filename", "preprocessed_wikitext103_subset.csv",
-            "--output-filename", "preprocessed_wikitext103_subset_3414.csv",
+            # "--output-filename", "preprocessed_wikitext103_subset.parquet",
+            "--output-filename", "preprocessed_wikitext103_subset_3414.parquet",
             "--remove-stopwords"
         ])
     elif args.raw_data_path is not None:
-        run_command([
+        run_stage([
             sys.executable, "src/preprocessor/preprocessor_main.py",
             "--output-dir", "data",
             "--input-path", args.raw_data_path,
             # "--segment-limit", "189700",
             "--segment-limit", "3414", # for testing purposes
-            # "--output-filename", "preprocessed_wikitext103_subset.csv",
-            "--output-filename", "preprocessed_wikitext103_subset_3414.csv",
+            # "--output-filename", "preprocessed_wikitext103_subset.parquet",
+            "--output-filename", "preprocessed_wikitext103_subset_3414.parquet",
             "--remove-stopwords"
         ])
     logging.info("Starting Contamination Detection Pipeline")
     # Step 2: Contamination Detection
-    run_command([
+    run_stage([
         sys.executable, "src/contamination_detector/detector.py",
-        # "--input-file", "data/preprocessed_wikitext103_subset.csv",
-        "--input-file", "data/preprocessed_wikitext103_subset_3414.csv", # for testing
-        # "--output-file", "data/contamination_flags.csv"
-        "--output-file", "data/contamination_flags_3414.csv",
+        # "--input-file", "data/preprocessed_wikitext103_subset.parquet",
+        "--input-file", "data/preprocessed_wikitext103_subset_3414.parquet", # for testing
+        # "--output-file", "data/contamination_flags.parquet"
+        "--output-file", "data/contamination_flags_3414.parquet",
+        "--reference-store-dir", "data/reference_store",
+        "--embedding-cache-dir", "data/embedding_cache",
         "--ref_similarity_threshold", "0.9",
         "--perplexity_ratio_threshold", "0.8"
     ])
 
     logging.info("Starting Membership Inference Pipeline")
     # Step 3: Membership Inference Checker
-    run_command([
+    run_stage([
         sys.executable, "src/membership_inference_checker/main.py",
-        # "--input-file", "data/preprocessed_wikitext103_subset.csv",
-        # "--output-file", "data/membership_inference_flags.csv"
-        "--input-file", "data/preprocessed_wikitext103_subset_3414.csv",
-        "--output-file", "data/membership_inference_flags_3414.csv",
+        # "--input-file", "data/preprocessed_wikitext103_subset.parquet",
+        # "--output-file", "data/membership_inference_flags.parquet"
+        "--input-file", "data/preprocessed_wikitext103_subset_3414.parquet",
+        "--output-file", "data/membership_inference_flags_3414.parquet",
+        "--embedding-cache-dir", "data/embedding_cache",
         "--high-sim-threshold", "0.95",
         "--low-sim-threshold", "0.3"
     ])
@@ -2,11 +2,7 @@
 
 import argparse
 import logging
-import os
 import time
-import pandas as pd
-from sanitization_engine.manager import run_full_pipeline
-from sanitization_engine.sanitizer import aggregate_flags, sanitize_data
 
 
 def main():
@@ -19,19 +15,26 @@ def main():
                         help="Raw input data for preprocessing.")
     parser.add_argument("--use-default-raw-data", action="store_true",
                         help="Use the default raw data for preprocessing.")
+    parser.add_argument("--isolate-stages", action="store_true",
+                        help="Run every pipeline stage in a fresh interpreter instead of in this process.")
     parser.add_argument("--sanitization-action", choices=["remove", "anonymize", "rewrite"],
                         default="remove", help="Sanitization action to perform.")
-    parser.add_argument("--sanitized-output", type=str, default="../data/sanitized_dataset.csv",
-                        help="Path to save the sanitized dataset.")
-    parser.add_argument("--sanitization-log", type=str, default="../data/sanitization_log.csv",
-                        help="Path to save detailed sanitization logs.")
+    parser.add_argument("--sanitized-output", type=str, default="../data/sanitized_dataset.parquet",
+                        help="Path to save the sanitized dataset (.parquet, or .csv to export CSV).")
+    parser.add_argument("--sanitization-log", type=str, default="../data/sanitization_log.parquet",
+                        help="Path to save detailed sanitization logs (.parquet, or .csv to export CSV).")
     args = parser.parse_args()
 
     start_time = time.perf_counter()
 
     if args.full_pipeline:
+        from sanitization_engine.manager import run_full_pipeline
         run_full_pipeline(args)
 
+    # pandas and pyarrow are only imported once the arguments are valid, so --help and argument errors return immediately.
+    from table_io import read_table, write_table
+    from sanitization_engine.sanitizer import aggregate_flags, sanitize_data
+
     logging.info("Starting Data Sanitization step.")
 
     # Load necessary data
@@ -39,13 +42,14 @@ def main():
     # contamination_path = "../data/contamination_flags.csv"
     # membership_path = "../data/membership_inference_flags.csv"
     # for testing purposes
-    preprocessed_path = "data/preprocessed_wikitext103_subset_3414.csv"
-    contamination_path = "data/contamination_flags_3414.csv"
-    membership_path = "data/membership_inference_flags_3414.csv"
+    preprocessed_path = "data/preprocessed_wikitext103_subset_3414.parquet"
+    contamination_path = "data/contamination_flags_3414.parquet"
+    membership_path = "data/membership_inference_flags_3414.parquet"
 
-    df_preprocessed = pd.read_csv(preprocessed_path)
-    df_contamination = pd.read_csv(contamination_path)
-    df_membership = pd.read_csv(membership_path)
+    # The flag tables are aligned with the preprocessed rows by position; only their flags are loaded.
+    df_preprocessed = read_table(preprocessed_path)
+    df_contamination = read_table(contamination_path, columns=['contamination_flag'])
+    df_membership = read_table(membership_path, columns=['membership_inference_flag'])
 
     flagged_indices, flag_reason = aggregate_flags(df_contamination, df_membership)
 
@@ -53,14 +57,10 @@ def main():
 
     sanitized_df, log_df = sanitize_data(df_preprocessed, flagged_indices, flag_reason, args.sanitization_action)
 
-    # Ensure output directories exist
-    os.makedirs(os.path.dirname(args.sanitized_output), exist_ok=True)
-    os.makedirs(os.path.dirname(args.sanitization_log), exist_ok=True)
-
-    sanitized_df.to_csv(args.sanitized_output, index=False)
+    write_table(sanitized_df, args.sanitized_output)
     logging.info(f"Sanitized dataset saved: {args.sanitized_output}")
 
-    log_df.to_csv(args.sanitization_log, index=False)
+    write_table(log_df, args.sanitization_log)
     logging.info(f"Sanitization log saved: {args.sanitization_log}")
 
     end_time = time.perf_counter()
@@ -0,0 +1,14 @@
+"""
+Seeding
+
+Reproducible random generators shared by the pipeline stages. Generators of a row or a
+batch are derived from the run's seed and the row's (or batch's) id by hashing both, so
+results do not depend on how rows are sharded or distributed over workers, and no two
+(seed, id) pairs share a random stream.
+Modules:
+    - seeds: derive_seed and row_rng.
+"""
+
+from .seeds import derive_seed, row_rng
+
+__version__ = "0.1.0"
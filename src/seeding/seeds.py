@@ -0,0 +1,29 @@
+import random
+import hashlib
+
+
+def derive_seed(*values):
+    """
+    Derive a 64-bit seed from a run's seed and ids (e.g. a row or batch id).
+
+    The values are hashed together rather than combined arithmetically, so distinct
+    value tuples (including seeds None and 0) do not alias onto the same seed.
+
+    Args:
+        *values: Seed and ids; integers (Python or numpy), strings or None.
+
+    Returns:
+        int: Seed in [0, 2**64).
+    """
+    key = ":".join(str(value) for value in values).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def row_rng(seed, row_id):
+    """
+    Random generator of one row, derived from the seed and the row's global id.
+
+    Draws from it do not depend on how rows are split into shards or batches or
+    distributed over workers, and different (seed, row id) pairs do not share streams.
+    """
+    return random.Random(derive_seed(seed, int(row_id)))
@@ -0,0 +1,15 @@
+"""
+Table I/O
+
+Columnar storage layer shared by the pipeline stages. Stage inputs and outputs are Parquet
+tables by default: readers stream them row group by row group and load only the columns a
+stage needs, and token lists are stored as typed list columns. The format follows the file
+extension, so CSV remains available as an export format (and as legacy input).
+Modules:
+    - tables: read_table, iter_batches, TableWriter, write_table and export_csv.
+"""
+
+from .tables import (read_table, iter_batches, table_columns, count_rows, TableWriter, write_table, export_csv,
+                     is_parquet, TOKENS_TYPE)
+
+__version__ = "0.1.0"
@@ -0,0 +1,175 @@
+import os
+import ast
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_ROW_GROUP_SIZE = 100000
+# Typed list column of the preprocessor's tokens (CSV stores them as stringified Python lists).
+TOKENS_TYPE = pa.list_(pa.string())
+LIST_COLUMNS = {'tokens': TOKENS_TYPE}
+
+
+def is_parquet(path):
+    return path.endswith(".parquet")
+
+
+def _parse_list_columns(df):
+    """Turn stringified list columns read from CSV back into lists."""
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            df[column] = [ast.literal_eval(value) if isinstance(value, str) and value.startswith('[') else value
+                          for value in df[column]]
+    return df
+
+
+def _read_csv(path, columns=None, chunksize=None):
+    # The C parser reports skipped malformed lines instead of silently dropping them.
+    return pd.read_csv(path, usecols=columns, chunksize=chunksize, on_bad_lines='warn')
+
+
+def table_columns(path):
+    """Column names of a Parquet or CSV table, without reading its rows."""
+    if is_parquet(path):
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def count_rows(path):
+    """Number of rows of a Parquet table from its metadata (None for CSV)."""
+    if is_parquet(path):
+        return pq.ParquetFile(path).metadata.num_rows
+    return None
+
+
+def read_table(path, columns=None):
+    """
+    Read a Parquet or CSV table.
+
+    Args:
+        path (str): Table path; the format follows the extension (.parquet, otherwise CSV).
+        columns (list): Columns to load (default: all). Parquet only reads these columns.
+
+    Returns:
+        pd.DataFrame: The table. List columns (e.g. 'tokens') hold sequences: lists parsed
+        from CSV, arrays read from Parquet.
+    """
+    if is_parquet(path):
+        return pq.read_table(path, columns=columns).to_pandas()
+    return _parse_list_columns(_read_csv(path, columns=columns))
+
+
+def iter_batches(path, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+    """
+    Stream a Parquet or CSV table as DataFrames of at most batch_size rows.
+
+    Parquet tables are read row group by row group, loading only the requested columns.
+    Batches carry a RangeIndex continuing across batches (their global row positions).
+    """
+    start = 0
+    if is_parquet(path):
+        batches = (batch.to_pandas() for batch in
+                   pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns))
+    else:
+        batches = (_parse_list_columns(df) for df in _read_csv(path, columns=columns, chunksize=batch_size))
+    for df in batches:
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield df
+
+
+class TableWriter:
+    """
+    Incremental writer of a Parquet or CSV table.
+
+    The table is written under a temporary name and renamed into place on close(), so a
+    table at the target path is always complete. The Parquet schema is taken from the
+    first batch, with known list columns (e.g. 'tokens') typed explicitly; later batches
+    are cast to it.
+    """
+
+    def __init__(self, path, row_group_size=DEFAULT_ROW_GROUP_SIZE, schema=None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.row_group_size = row_group_size
+        self.schema = schema
+        self.rows = 0
+        self._writer = None
+        self._csv = None
+        self._empty = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _table(self, df):
+        if self.schema is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            fields = [pa.field(f.name, LIST_COLUMNS[f.name]) if f.name in LIST_COLUMNS else f for f in table.schema]
+            self.schema = pa.schema(fields)
+        return pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+    def write(self, df):
+        if len(df) == 0:
+            # Empty batches add nothing; the first one only provides the columns if no rows follow.
+            if self._empty is None:
+                self._empty = df
+            return
+        if is_parquet(self.path):
+            table = self._table(df)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp_path, self.schema)
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+        else:
+            if self._csv is None:
+                self._csv = open(self.tmp_path, "w", encoding="utf-8", newline="")
+            for column in LIST_COLUMNS:
+                if column in df.columns:
+                    # Parquet list values are numpy arrays; CSV stores them as stringified Python lists.
+                    df = df.assign(**{column: [v.tolist() if hasattr(v, "tolist") else v for v in df[column]]})
+            df.to_csv(self._csv, index=False, header=self.rows == 0)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is None and self._csv is None:
+            # Nothing was written: still create the table, with the columns of the empty batch if any.
+            empty = self._empty if self._empty is not None else pd.DataFrame()
+            if is_parquet(self.path):
+                self._writer = pq.ParquetWriter(self.tmp_path, self.schema or self._table(empty).schema)
+            else:
+                empty.to_csv(self.tmp_path, index=False)
+        if self._writer is not None:
+            self._writer.close()
+        if self._csv is not None:
+            self._csv.close()
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for handle in (self._writer, self._csv):
+                if handle is not None:
+                    handle.close()
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+def write_table(df, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Write a DataFrame as a Parquet or CSV table (by extension), atomically."""
+    with TableWriter(path, row_group_size=row_group_size) as writer:
+        writer.write(df)
+    return writer.rows
+
+
+def export_csv(path, csv_path, batch_size=DEFAULT_BATCH_SIZE):
+    """Export a Parquet table to CSV batch by batch (list columns become stringified lists)."""
+    with TableWriter(csv_path) as writer:
+        for df in iter_batches(path, batch_size=batch_size):
+            writer.write(df)
+    logging.info("Exported %d rows of %s to %s", writer.rows, path, csv_path)
+    return writer.rows